@@ -0,0 +1,239 @@
+# FreqShow background sample acquisition.
+# Reads radio samples and computes spectra on a dedicated thread so the UI never
+# waits on the USB transfer from the tuner.
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import threading
+import time
+
+import numpy as np
+
+import perf
+
+
+def read_samples(source, count, converter, raw_reads=True):
+	"""Read count complex samples from the source.  When raw_reads is True and
+	the source provides raw bytes natively they are read and converted to
+	complex64 with the converter (a dsp.IQConverter).
+	"""
+	start = perf.clock()
+	if raw_reads and getattr(source, 'native_bytes', True):
+		samples = converter.convert(source.read_bytes(2*count))
+	else:
+		samples = source.read_samples(count)
+	perf.record('read', start)
+	return samples
+
+def read_spectrum(source, engine, converter, min_samples=0, raw_reads=True,
+	decimator=None):
+	"""Read samples from the source and return their spectrum computed by the
+	engine (a dsp.SpectrumEngine).  At least min_samples are read, rounded up to
+	a whole number of USB transfer blocks.  See read_samples for the meaning of
+	converter and raw_reads.  With a dsp.Decimator the spectrum is computed
+	from the decimated samples to zoom in on part of the band.  The returned
+	array is owned by the engine and overwritten by its next computation.
+	"""
+	count = engine.samples_needed()
+	if decimator is not None:
+		count = decimator.samples_needed(count)
+	count = max(min_samples, count)
+	count = -(-count//256)*256
+	samples = read_samples(source, count, converter, raw_reads)
+	if decimator is not None:
+		start = perf.clock()
+		samples = decimator.process(samples)
+		perf.record('decimate', start)
+	# Run the windowed FFTs, average and pool them down to the display width,
+	# all in the engine's preallocated buffers.
+	start = perf.clock()
+	freqs = engine.compute(samples)
+	perf.record('dsp', start)
+	return freqs
+
+
+class SpectrumRing(object):
+	"""Bounded ring buffer of spectrum frames with a single writer and a single
+	reader.  The writer never waits on the reader: when the reader falls behind
+	the oldest frames are overwritten and counted as dropped.
+	"""
+
+	def __init__(self, size, width, dtype=np.float32):
+		"""Create a ring which holds size frames of width values each."""
+		# A frame is only safe to read while the writer fills another slot, so
+		# the ring has one more slot than the frames it holds.
+		self.size = max(size, 1)
+		self.slots = self.size + 1
+		self.width = width
+		self.frames = np.zeros((self.slots, width), dtype=dtype)
+		self.timestamps = np.zeros(self.slots)
+		self._latest = np.zeros(width, dtype=dtype)
+		self._written = threading.Condition()
+		self.clear()
+
+	def clear(self):
+		"""Forget all frames and reset statistics."""
+		self.write_seq = 0
+		self.read_seq = 0
+		self.frames_dropped = 0
+		self.staleness = 0.0
+
+	def put(self, frame, timestamp=None):
+		"""Copy a spectrum frame into the next slot of the ring.  Only call this
+		from the writer thread.
+		"""
+		slot = self.write_seq % self.slots
+		self.frames[slot] = frame
+		self.timestamps[slot] = time.time() if timestamp is None else timestamp
+		# Publish the frame only after it is completely written.
+		with self._written:
+			self.write_seq += 1
+			self._written.notify_all()
+
+	def wait(self, timeout=None):
+		"""Wait until at least one frame is available.  Returns True if a frame
+		is available, or False if the timeout elapsed.
+		"""
+		with self._written:
+			return self._written.wait_for(lambda: self.write_seq > 0, timeout)
+
+	def _read(self, oldest):
+		# Copy out the newest frame, or with oldest the oldest frame which
+		# hasn't been read yet and is still safe from the writer.
+		while True:
+			write_seq = self.write_seq
+			seq = write_seq
+			if oldest:
+				seq = max(self.read_seq + 1, write_seq - (self.size - 1))
+			slot = (seq - 1) % self.slots
+			np.copyto(self._latest, self.frames[slot])
+			timestamp = self.timestamps[slot]
+			# The writer could have lapped the ring while the frame was copied,
+			# in which case the copy is torn and has to be taken again.
+			if self.write_seq - seq < self.size:
+				break
+		if seq > self.read_seq:
+			self.frames_dropped += seq - self.read_seq - 1
+			self.read_seq = seq
+		self.staleness = time.time() - timestamp
+		return self._latest
+
+	def latest(self):
+		"""Return the newest frame (or None if no frame has been written yet).
+		The returned array is owned by the ring and is overwritten by the next
+		call to latest().
+		"""
+		if self.write_seq == 0:
+			return None
+		return self._read(False)
+
+	def next(self, timeout=None):
+		"""Return the oldest frame which hasn't been returned yet, waiting up to
+		timeout seconds for one (None if the timeout elapsed).  Frames which were
+		overwritten before they could be returned are counted as dropped.  The
+		returned array is owned by the ring like with latest().
+		"""
+		with self._written:
+			if not self._written.wait_for(lambda: self.write_seq > self.read_seq,
+				timeout):
+				return None
+		return self._read(True)
+
+
+class AcquisitionThread(threading.Thread):
+	"""Thread which continuously calls a spectrum read function and publishes
+	the results into a SpectrumRing.
+	"""
+
+	def __init__(self, read_func, width, ring_size=4, error_delay=0.1,
+		consumer=None):
+		"""Create acquisition thread which calls read_func (a function with no
+		parameters that returns a spectrum of width values) in a loop.  Results
+		are kept in a ring of ring_size frames, and passed to consumer (if not
+		None) on this thread as well.  If read_func raises an IOError the thread
+		waits error_delay seconds and tries again.
+		"""
+		super(AcquisitionThread, self).__init__(name='FreqShowAcquisition')
+		self.daemon = True
+		self.read_func = read_func
+		self.consumer = consumer
+		self.error_delay = error_delay
+		self.ring = SpectrumRing(ring_size, width)
+		self.read_errors = 0
+		self._stop_event = threading.Event()
+
+	def run(self):
+		while not self._stop_event.is_set():
+			try:
+				frame = self.read_func()
+			except IOError:
+				self.read_errors += 1
+				self._stop_event.wait(self.error_delay)
+				continue
+			self.ring.put(frame)
+			if self.consumer is not None:
+				self.consumer(frame)
+
+	def stop(self, timeout=None):
+		"""Ask the thread to stop and wait for it to finish."""
+		self._stop_event.set()
+		if self.is_alive():
+			self.join(timeout)
+
+	def latest(self):
+		"""Return the newest spectrum without blocking (or None if nothing has
+		been acquired yet).
+		"""
+		return self.ring.latest()
+
+	def next(self, timeout=None):
+		"""Return the oldest spectrum which hasn't been returned yet, waiting up
+		to timeout seconds for one (None if the timeout elapsed).
+		"""
+		return self.ring.next(timeout)
+
+	def has_new(self):
+		"""Return True if a spectrum newer than the last one returned by latest()
+		is available.
+		"""
+		return self.ring.write_seq != self.ring.read_seq
+
+	def wait(self, timeout=None):
+		"""Wait until the first spectrum has been acquired."""
+		return self.ring.wait(timeout)
+
+	@property
+	def sequence(self):
+		"""Sequence number of the newest spectrum returned by latest()."""
+		return self.ring.read_seq
+
+	@property
+	def frames_dropped(self):
+		"""Number of acquired spectra which were never read by the UI."""
+		return self.ring.frames_dropped
+
+	@property
+	def staleness(self):
+		"""Age in seconds of the spectrum last returned by latest()."""
+		return self.ring.staleness
@@ -0,0 +1,569 @@
+# FreqShow performance benchmarks.
+# Run with: python benchmark.py [benchmark name ...]
+# The frames benchmark renders every view headless and can save its results as
+# a JSON baseline and compare later runs against it, for example:
+#   python benchmark.py frames --save baseline.json
+#   python benchmark.py frames --compare baseline.json
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import argparse
+import functools
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+# Benchmarks never open a real window.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+
+import controller
+import dsp
+import freqshow
+import model
+import sources
+import sweep
+import views
+
+
+# Display widths to benchmark, from the 2.8" PiTFT up to an HDMI monitor.
+WIDTHS = [320, 480, 800, 1280, 1920]
+
+# Screen sizes to benchmark for views which depend on both dimensions.
+SIZES = [(320, 240), (480, 320), (800, 480), (1280, 720), (1920, 1080)]
+
+# Screen sizes the frames benchmark renders by default: the 2.8" and 3.5"
+# PiTFT and the 7" touchscreen.
+FRAME_SIZES = [(320, 240), (480, 320), (800, 480)]
+
+# Relative increase of a frame time percentile over the baseline which is
+# reported as a regression.
+REGRESSION_THRESHOLD = 0.10
+
+# Frames benchmark baseline checked in next to this file, which --save and
+# --compare use when no other file is given.  Frame times depend on the
+# machine, the baseline records which one it was measured on.
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	'benchmark_baseline.json')
+
+
+class BenchModel(object):
+	"""Minimal stand-in for FreqShowModel with a fixed intensity range."""
+
+	def __init__(self, width, height):
+		self.width = width
+		self.height = height
+		self.min_intensity = -40.0
+		self.max_intensity = 40.0
+		self.range = self.max_intensity - self.min_intensity
+		self.frame_seq = 0
+		self.freqs = random_spectrum(width)
+
+	def get_data(self):
+		self.frame_seq += 1
+		return self.freqs
+
+
+class BenchController(object):
+	"""Minimal stand-in for FreqShowController."""
+
+	def change_to_settings(self, *args):
+		pass
+
+	def toggle_main(self, *args):
+		pass
+
+
+class StageTimer(object):
+	"""Adds up the time spent in wrapped functions for each named stage."""
+
+	def __init__(self):
+		self.totals = {}
+
+	def wrap(self, name, func):
+		"""Return function which calls func and adds its time to the stage."""
+		def timed(*args, **kwargs):
+			start = time.perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				self.totals[name] = self.totals.get(name, 0.0) + \
+					time.perf_counter() - start
+		return timed
+
+	def take(self):
+		"""Return the stage totals and start adding up from zero again."""
+		totals = self.totals
+		self.totals = {}
+		return totals
+
+
+def time_per_call(func, count):
+	"""Call func count times and return the average seconds per call."""
+	start = time.perf_counter()
+	for i in range(count):
+		func()
+	return (time.perf_counter() - start)/count
+
+def random_spectrum(width):
+	"""Return a noisy spectrum of width values spread over the bench range."""
+	return np.random.uniform(-50.0, 50.0, width)
+
+
+def bench_waterfall_row(rows=200):
+	"""Per-row cost of drawing the waterfall against display width, compared
+	with the original per-pixel set_at loop.
+	"""
+	pygame.font.init()
+	color_func = views.gradient_func(freqshow.WATERFALL_GRAD)
+	print('Waterfall row ({0} rows):'.format(rows))
+	print('{0:>8} {1:>14} {2:>14} {3:>9}'.format('width', 'lut (us/row)',
+		'loop (us/row)', 'speedup'))
+	for width in WIDTHS:
+		model = BenchModel(width, 240)
+		view = views.WaterfallSpectrogram(model, BenchController())
+		freqs = random_spectrum(width)
+		def lut_row():
+			view.add_row(freqs)
+		surface = pygame.Surface((width, model.height))
+		def loop_row():
+			# Original implementation, kept here as the reference point.
+			scaled = (freqs-model.min_intensity)/model.range
+			surface.scroll(0, -1)
+			surface.lock()
+			for i in range(width):
+				power = views.clamp(scaled[i], 0.0, 1.0)
+				surface.set_at((i, model.height-1), color_func(power))
+			surface.unlock()
+		lut = time_per_call(lut_row, rows)
+		loop = time_per_call(loop_row, max(rows//10, 1))
+		print('{0:>8} {1:>14.1f} {2:>14.1f} {3:>8.1f}x'.format(width, lut*1e6,
+			loop*1e6, loop/lut))
+
+
+def bench_waterfall_render(frames=200):
+	"""Per-frame cost of drawing the waterfall against screen size, with a new
+	row every frame (compared with scrolling the whole waterfall surface for
+	every row) and when only redrawing it.
+	"""
+	pygame.font.init()
+	print('Waterfall frame ({0} frames):'.format(frames))
+	print('{0:>10} {1:>15} {2:>17} {3:>9} {4:>12} {5:>11}'.format('size',
+		'ring (us/frame)', 'scroll (us/frame)', 'speedup', 'redraw (us)',
+		'history KB'))
+	for width, height in SIZES:
+		model = BenchModel(width, height)
+		view = views.WaterfallSpectrogram(model, BenchController())
+		screen = pygame.Surface((width, height))
+		def ring_frame():
+			view.render_spectrogram(screen)
+		def scroll_frame():
+			# The same work, but moving the entire surface up by one row for
+			# every new row and drawing it with one blit.
+			dsp.quantize_db(model.get_data(), freqshow.WATERFALL_DB_MIN,
+				freqshow.WATERFALL_DB_STEP, view.quantized, view.scaled)
+			view.update_palette()
+			view.waterfall.scroll(0, -1)
+			pixels = pygame.surfarray.pixels2d(view.waterfall)
+			pixels[:, height-1] = view.quantized
+			del pixels
+			screen.blit(view.waterfall, (0, 0))
+		def redraw_frame():
+			view.last_seq = model.frame_seq + 1
+			view.render_spectrogram(screen)
+		ring = time_per_call(ring_frame, frames)
+		scroll = time_per_call(scroll_frame, frames)
+		redraw = time_per_call(redraw_frame, frames)
+		history = view.waterfall.get_pitch()*height/1024.0
+		print('{0:>10} {1:>15.1f} {2:>17.1f} {3:>8.1f}x {4:>12.1f} {5:>11.1f}'
+			.format('{0}x{1}'.format(width, height), ring*1e6, scroll*1e6,
+			scroll/ring, redraw*1e6, history))
+
+
+def bench_instant_render(frames=200):
+	"""Per-frame cost of drawing the instantaneous spectrogram in each mode
+	against screen size, compared with drawing one line per pixel column.
+	"""
+	pygame.font.init()
+	modes = ['line', 'fill', 'dots']
+	print('Instant frame ({0} frames, us/frame):'.format(frames))
+	print('{0:>10} {1} {2:>10}'.format('size',
+		' '.join('{0:>10}'.format(mode) for mode in modes), 'per-line'))
+	for width, height in SIZES:
+		model = BenchModel(width, height)
+		view = views.InstantSpectrogram(model, BenchController())
+		screen = pygame.Surface((width, height))
+		results = []
+		for mode in modes:
+			freqshow.INSTANT_MODE = mode
+			results.append(time_per_call(lambda: view.render_spectrogram(screen),
+				frames))
+		freqshow.INSTANT_MODE = 'line'
+		def line_frame():
+			# Original implementation, kept here as the reference point.
+			freqs = model.get_data()
+			freqs = height-np.floor(((freqs-model.min_intensity)/model.range)*height)
+			screen.fill(freqshow.MAIN_BG)
+			ylast = freqs[0]
+			for i in range(1, width):
+				y = freqs[i]
+				pygame.draw.line(screen, freqshow.INSTANT_LINE, (i-1, ylast), (i, y))
+				ylast = y
+		results.append(time_per_call(line_frame, frames))
+		print('{0:>10} {1}'.format('{0}x{1}'.format(width, height),
+			' '.join('{0:>10.1f}'.format(r*1e6) for r in results)))
+
+
+def bench_pooling(calls=500, width=320):
+	"""Cost of pooling FFT bins down to the display width for each pooling
+	method against FFT size.
+	"""
+	print('Pooling to {0} columns ({1} calls, us/call):'.format(width, calls))
+	print('{0:>8} {1}'.format('fft', ' '.join('{0:>8}'.format(method)
+		for method in dsp.POOL_METHODS)))
+	for size in [1024, 4096, 16384, 65536]:
+		power = np.random.exponential(1.0, size)
+		edges = dsp.pool_edges(size, width)
+		results = [time_per_call(lambda: dsp.pool_spectrum(power, edges, method),
+			calls) for method in dsp.POOL_METHODS]
+		print('{0:>8} {1}'.format(size, ' '.join('{0:>8.1f}'.format(r*1e6)
+			for r in results)))
+
+
+def peak_memory(func):
+	"""Call func once and return the peak bytes of memory it allocated."""
+	tracemalloc.start()
+	try:
+		func()
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+def bench_iq_path(calls=200, size=1024, segments=4):
+	"""Throughput and peak memory of turning raw tuner bytes into an averaged
+	spectrum with the raw byte/complex64 path and with the library's
+	read_samples complex128 conversion.
+	"""
+	print('IQ to spectrum ({0} calls, {1} point FFT, {2} segments):'.format(
+		calls, size, segments))
+	print('{0:>8} {1:>12} {2:>12} {3:>12} {4:>12}'.format('samples',
+		'raw (MS/s)', 'lib (MS/s)', 'raw peak KB', 'lib peak KB'))
+	converter = dsp.IQConverter()
+	for count in [4096, 16384, 65536, 262144]:
+		raw = bytearray(np.random.randint(0, 256, 2*count).astype(np.uint8))
+		def raw_path():
+			samples = converter.convert(raw)
+			dsp.welch_power(samples, size, segments)
+		def lib_path():
+			# Same conversion as RtlSdr.read_samples (packed_bytes_to_iq).
+			samples = np.frombuffer(raw, dtype=np.uint8).astype(np.float64) \
+				.view(np.complex128)
+			samples /= 127.5
+			samples -= (1 + 1j)
+			dsp.welch_power(samples, size, segments)
+		raw_path()
+		raw_rate = count/time_per_call(raw_path, calls)/1e6
+		lib_rate = count/time_per_call(lib_path, calls)/1e6
+		print('{0:>8} {1:>12.1f} {2:>12.1f} {3:>12.1f} {4:>12.1f}'.format(count,
+			raw_rate, lib_rate, peak_memory(raw_path)/1024.0,
+			peak_memory(lib_path)/1024.0))
+
+
+def bench_engine(calls=500, width=320, segments=4):
+	"""Cost and memory of computing a display spectrum with the
+	preallocated SpectrumEngine compared with the allocating dsp functions.
+	"""
+	print('Spectrum engine ({0} calls, {1} columns, {2} segments):'.format(
+		calls, width, segments))
+	print('{0:>8} {1:>12} {2:>12} {3:>12} {4:>12} {5:>7}'.format('fft',
+		'engine (us)', 'funcs (us)', 'engine KB', 'funcs KB', 'buffers'))
+	for size in [1024, 4096, 16384]:
+		engine = dsp.SpectrumEngine(width, fft_size=size, segments=segments)
+		samples = (np.random.randn(engine.samples_needed()) + 1j*np.random.randn(
+			engine.samples_needed())).astype(np.complex64)
+		edges = dsp.pool_edges(size, width)
+		def funcs():
+			power = dsp.welch_power(samples, size, segments)
+			power = dsp.remove_dc(np.fft.fftshift(power))
+			return 10.0*np.log10(dsp.pool_spectrum(power, edges, dsp.POOL_PEAK))
+		engine.compute(samples)
+		allocations = engine.buffer_allocations
+		engine_time = time_per_call(lambda: engine.compute(samples), calls)
+		funcs_time = time_per_call(funcs, calls)
+		print('{0:>8} {1:>12.1f} {2:>12.1f} {3:>12.1f} {4:>12.1f} {5:>7}'.format(
+			size, engine_time*1e6, funcs_time*1e6,
+			peak_memory(lambda: engine.compute(samples))/1024.0,
+			peak_memory(funcs)/1024.0, engine.buffer_allocations - allocations))
+
+
+def bench_zoom(calls=100, size=1024, segments=4):
+	"""Cost and peak memory of mixing and decimating the samples for one
+	zoomed spectrum against zoom factor.
+	"""
+	print('Zoom ({0} calls, {1} point FFT, {2} segments):'.format(calls, size,
+		segments))
+	print('{0:>8} {1:>6} {2:>10} {3:>14} {4:>10} {5:>10}'.format('factor',
+		'taps', 'samples', 'decimate (ms)', 'MS/s', 'peak KB'))
+	engine = dsp.SpectrumEngine(320, fft_size=size, segments=segments)
+	for factor in [2, 4, 8, 16, 32]:
+		decimator = dsp.Decimator(factor, 100e3, 2.4e6,
+			taps_per_phase=freqshow.ZOOM_TAPS_PER_PHASE)
+		count = decimator.samples_needed(engine.samples_needed())
+		samples = (np.random.randn(count) + 1j*np.random.randn(count)) \
+			.astype(np.complex64)
+		decimator.process(samples)
+		elapsed = time_per_call(lambda: decimator.process(samples), calls)
+		print('{0:>8} {1:>6} {2:>10} {3:>14.2f} {4:>10.1f} {5:>10.1f}'.format(
+			factor, len(decimator.taps), count, elapsed*1000.0,
+			count/elapsed/1e6,
+			peak_memory(lambda: decimator.process(samples))/1024.0))
+
+
+def bench_sweep(sweeps=20, width=320, size=1024, segments=4):
+	"""Sweeps per second across common wideband spans with a synthetic
+	source, which returns samples as fast as they are read.
+	"""
+	print('Sweep ({0} sweeps, {1} columns, {2} point FFT, {3} segments):'.format(
+		sweeps, width, size, segments))
+	print('{0:>16} {1:>6} {2:>12} {3:>12}'.format('span (MHz)', 'steps',
+		'sweep (ms)', 'sweeps/s'))
+	source = sources.SyntheticSource()
+	engine = dsp.SpectrumEngine(width, fft_size=size, segments=segments)
+	converter = dsp.IQConverter()
+	for start, stop in [(88.0, 108.0), (400.0, 470.0), (24.0, 1766.0)]:
+		sweeper = sweep.Sweeper(start*1e6, stop*1e6, source.get_sample_rate(),
+			width, usable=freqshow.SWEEP_USABLE,
+			settle_samples=freqshow.SWEEP_SETTLE_SAMPLES)
+		sweeper.read(source, engine, converter)
+		for i in range(sweeps):
+			sweeper.read(source, engine, converter)
+		print('{0:>16} {1:>6} {2:>12.2f} {3:>12.1f}'.format(
+			'{0:g}-{1:g}'.format(start, stop), sweeper.steps,
+			1000.0/sweeper.sweeps_per_second, sweeper.sweeps_per_second))
+
+
+def frame_scenarios(fsmodel, fscontroller, screen):
+	"""Return list of (name, function, view) tuples where each function renders
+	one frame of a view the way the main loop in freqshow.py does, and view is
+	the view it renders (None for the main loop itself).  The main loop only
+	renders views which aren't animated after input, which redraws them, so
+	their frames start with invalidate().
+	"""
+	def view_frame(view):
+		def frame():
+			if not view.animated:
+				view.invalidate()
+			view.render(screen)
+		return frame
+	def main_loop_frame():
+		pygame.event.get()
+		dirty = fscontroller.current().render(screen)
+		if dirty:
+			pygame.display.update(dirty)
+	views_by_name = [
+		('instant', fscontroller.instant),
+		('waterfall', fscontroller.waterfall),
+		('settings', views.SettingsList(fsmodel, fscontroller)),
+		('number', views.NumberDialog(fsmodel, 'FREQUENCY:', 'MHz',
+			initial='90.30')),
+		('message', views.MessageDialog(fsmodel, 'QUIT: Are you sure?',
+			accept=None, cancel=None)),
+	]
+	return [(name, view_frame(view), view) for name, view in views_by_name] + \
+		[('main_loop', main_loop_frame, None)]
+
+def first_frame_ms(view, screen, count=20):
+	"""Return mean milliseconds to render the view from scratch, including
+	drawing its cached static layer, like the first frame after it's shown.
+	"""
+	def frame():
+		view.invalidate(static=True)
+		view.render(screen)
+	return time_per_call(frame, count)*1000.0
+
+def percentile_ms(values, percent):
+	return float(np.percentile(values, percent))*1000.0
+
+def bench_frames(frames=200, sizes=FRAME_SIZES, save=None, compare=None,
+	alloc_frames=20):
+	"""Frame time of every view and the main loop across screen sizes, with
+	a synthetic sample source and SDL's dummy video driver.  Reports frame time
+	percentiles, the mean time per frame spent acquiring samples (reading and
+	converting them), computing and analyzing spectra (DSP, auto scaling and
+	peak tracking) and drawing, the peak memory allocated per frame, and the
+	time of a first frame which also draws the view's static layer.
+	"""
+	pygame.display.init()
+	pygame.font.init()
+	results = {}
+	print('Frames ({0} per view, ms):'.format(frames))
+	print('{0:>20} {1:>7} {2:>7} {3:>7} {4:>7} {5:>7} {6:>7} {7:>9} {8:>7}'
+		.format('view', 'p50', 'p95', 'p99', 'acq', 'dsp', 'draw', 'alloc KB',
+		'first'))
+	# Acquire synchronously so each frame's time can be split into stages.
+	threaded = freqshow.SDR_ACQUISITION_THREAD
+	freqshow.SDR_ACQUISITION_THREAD = False
+	try:
+		for width, height in sizes:
+			screen = pygame.display.set_mode((width, height))
+			source = sources.SyntheticSource()
+			fsmodel = model.FreqShowModel(width, height, source=source)
+			fscontroller = controller.FreqShowController(fsmodel)
+			# Reading samples includes converting them to complex values, and
+			# the spectrum is followed by auto scaling and peak tracking.
+			timer = StageTimer()
+			source.read_bytes = timer.wrap('acquisition', source.read_bytes)
+			source.read_samples = timer.wrap('acquisition', source.read_samples)
+			fsmodel._iq.convert = timer.wrap('acquisition', fsmodel._iq.convert)
+			fsmodel.engine.compute = timer.wrap('dsp', fsmodel.engine.compute)
+			fsmodel.auto_range.update = timer.wrap('dsp', fsmodel.auto_range.update)
+			if fsmodel.peak_tracker is not None:
+				fsmodel.peak_tracker.update = timer.wrap('dsp',
+					fsmodel.peak_tracker.update)
+			for name, frame, view in frame_scenarios(fsmodel, fscontroller,
+				screen):
+				# Warm up caches and buffers before measuring.
+				for i in range(5):
+					frame()
+				timer.take()
+				times = np.zeros(frames)
+				stages = {'acquisition': 0.0, 'dsp': 0.0}
+				for i in range(frames):
+					start = time.perf_counter()
+					frame()
+					times[i] = time.perf_counter() - start
+					for stage, total in timer.take().items():
+						stages[stage] += total
+				allocated = 0
+				tracemalloc.start()
+				for i in range(alloc_frames):
+					tracemalloc.reset_peak()
+					base = tracemalloc.get_traced_memory()[0]
+					frame()
+					allocated += tracemalloc.get_traced_memory()[1] - base
+				tracemalloc.stop()
+				acquisition = stages['acquisition']/frames*1000.0
+				dsp_ms = stages['dsp']/frames*1000.0
+				result = {
+					'p50_ms': percentile_ms(times, 50),
+					'p95_ms': percentile_ms(times, 95),
+					'p99_ms': percentile_ms(times, 99),
+					'acquisition_ms': acquisition,
+					'dsp_ms': dsp_ms,
+					'draw_ms': max(times.mean()*1000.0 - acquisition - dsp_ms, 0.0),
+					'alloc_kb': allocated/1024.0/alloc_frames,
+				}
+				first = '-'
+				if view is not None:
+					result['first_ms'] = first_frame_ms(view, screen)
+					first = '{0:.2f}'.format(result['first_ms'])
+				key = '{0}@{1}x{2}'.format(name, width, height)
+				results[key] = dict((k, round(v, 3)) for k, v in result.items())
+				print('{0:>20} {p50_ms:7.2f} {p95_ms:7.2f} {p99_ms:7.2f} '
+					'{acquisition_ms:7.2f} {dsp_ms:7.2f} {draw_ms:7.2f} '
+					'{alloc_kb:9.1f} {1:>7}'.format(key, first, **result))
+	finally:
+		freqshow.SDR_ACQUISITION_THREAD = threaded
+	if save is not None:
+		with open(save, 'w') as outfile:
+			json.dump({'frames': frames, 'results': results,
+				'machine': '{0} {1}'.format(platform.system(), platform.machine()),
+				'python': platform.python_version(), 'numpy': np.__version__,
+				'pygame': pygame.version.ver}, outfile, indent=1, sort_keys=True)
+			outfile.write('\n')
+		print('Saved baseline to {0}'.format(save))
+	if compare is not None:
+		compare_frames(results, compare)
+	return results
+
+def compare_frames(results, path):
+	"""Print the change of each frame time percentile against the baseline
+	saved at path, and flag regressions over REGRESSION_THRESHOLD.
+	"""
+	with open(path) as infile:
+		baseline = json.load(infile)['results']
+	print('Compared with {0}:'.format(path))
+	regressions = 0
+	for key in sorted(results):
+		if key not in baseline:
+			print('{0:>20} (not in baseline)'.format(key))
+			continue
+		changes = []
+		for stat in ['p50_ms', 'p95_ms', 'p99_ms']:
+			old = baseline[key][stat]
+			change = (results[key][stat] - old)/old if old > 0 else 0.0
+			changes.append('{0} {1:+6.1%}'.format(stat[:3], change))
+			if change > REGRESSION_THRESHOLD:
+				regressions += 1
+				changes[-1] += '!'
+		print('{0:>20} {1}'.format(key, '  '.join(changes)))
+	print('{0} percentile(s) regressed by more than {1:.0%}.'.format(regressions,
+		REGRESSION_THRESHOLD))
+
+
+BENCHMARKS = {
+	'engine': bench_engine,
+	'frames': bench_frames,
+	'iq_path': bench_iq_path,
+	'pooling': bench_pooling,
+	'sweep': bench_sweep,
+	'instant': bench_instant_render,
+	'waterfall': bench_waterfall_row,
+	'waterfall_render': bench_waterfall_render,
+	'zoom': bench_zoom,
+}
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='FreqShow benchmarks.')
+	parser.add_argument('names', nargs='*', metavar='name',
+		help='benchmarks to run, any of: {0} (default all)'.format(
+			', '.join(sorted(BENCHMARKS))))
+	parser.add_argument('--frames', type=int, default=200,
+		help='frames rendered per view by the frames benchmark')
+	parser.add_argument('--sizes', default=','.join('{0}x{1}'.format(w, h)
+		for w, h in FRAME_SIZES),
+		help='comma separated screen sizes for the frames benchmark')
+	parser.add_argument('--save', metavar='FILE', nargs='?',
+		const=BASELINE_FILE,
+		help='save frames benchmark results as a JSON baseline (by default '
+		'the checked in {0})'.format(os.path.basename(BASELINE_FILE)))
+	parser.add_argument('--compare', metavar='FILE', nargs='?',
+		const=BASELINE_FILE,
+		help='compare frames benchmark results with a JSON baseline (by '
+		'default the checked in {0})'.format(os.path.basename(BASELINE_FILE)))
+	args = parser.parse_args()
+	for name in args.names:
+		if name not in BENCHMARKS:
+			parser.error('unknown benchmark: {0}'.format(name))
+	sizes = [tuple(int(v) for v in size.split('x'))
+		for size in args.sizes.split(',')]
+	BENCHMARKS['frames'] = functools.partial(bench_frames, frames=args.frames,
+		sizes=sizes, save=args.save, compare=args.compare)
+	for name in args.names or sorted(BENCHMARKS):
+		BENCHMARKS[name]()
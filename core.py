@@ -0,0 +1,487 @@
+# FreqShow spectrum core.
+# Tuner control, acquisition and spectrum computation without any of the user
+# interface, so spectra can be streamed on machines without a display.  Only
+# numpy is needed, the rtlsdr library is imported when a dongle is opened and
+# pygame is never imported.
+#
+# Usage:
+#   import core
+#   spectra = core.SpectrumCore(1024, center_freq=100.0)
+#   for freqs in spectra.iter_spectra(count=100):
+#       ... freqs is a numpy array of 1024 intensities in decibels ...
+#   spectra.close()
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import threading
+
+import numpy as np
+
+import acquisition
+import dsp
+import sources
+import sweep
+
+
+class SpectrumCore(object):
+	"""Owns the sample source and turns its samples into spectra of width
+	intensities in decibels.  Frequencies are in megahertz like the rest of
+	FreqShow.  Setters which the source rejects with IOError are ignored.
+	"""
+
+	def __init__(self, width, source=None,
+		source_factory=(sources.open_rtlsdr, (), {}), center_freq=90.3,
+		sample_rate=2.4, gain='AUTO', fft_size=1024, segments=1, overlap=0.5,
+		window='hann', pooling=dsp.POOL_PEAK, sample_size=0, raw_reads=True,
+		ring_size=4, dsp_process=False, sweep_usable=0.75,
+		sweep_settle_samples=16384, zoom_taps_per_phase=16, remote=None):
+		"""Create core which computes spectra of width values.
+
+		The samples come from source (an RtlSdr or sources.SampleSource object),
+		or if it's None from the source opened by calling source_factory, a
+		(function, args, kwargs) tuple.  With dsp_process True the source is
+		opened in a separate process which computes the spectra (see worker).
+		The tuner starts at center_freq and sample_rate megahertz with the
+		provided gain.
+
+		Fft_size, segments, overlap, window and pooling configure the
+		dsp.SpectrumEngine, at least sample_size samples are read for each
+		spectrum, and raw_reads reads raw bytes from sources that provide them.
+		Ring_size is the number of spectra buffered by background acquisition.
+		Sweep_usable and sweep_settle_samples configure sweeps (see sweep) and
+		zoom_taps_per_phase the digital zoom filter (see dsp.Decimator).
+
+		Instead of a source, remote can be a server.SpectrumClient which
+		receives the spectra of a FreqShow spectrum server.  Its tuner can't be
+		changed, so the setters have no effect.
+		"""
+		self.width = width
+		self.sample_size = sample_size
+		self.raw_reads = raw_reads
+		self.ring_size = ring_size
+		self.sweep_usable = sweep_usable
+		self.sweep_settle_samples = sweep_settle_samples
+		self.zoom_taps_per_phase = zoom_taps_per_phase
+		# Initialize the spectrum engine which owns the FFT buffers, with the FFT
+		# size, averaging and pooling of FFT bins to display columns.  The lock
+		# serializes access to the tuner and engine between the caller and the
+		# background acquisition thread.
+		self._sdr_lock = threading.RLock()
+		self._iq = dsp.IQConverter()
+		engine_args = dict(fft_size=fft_size, segments=segments,
+			overlap=overlap, window=window, pooling=pooling)
+		self.engine = dsp.SpectrumEngine(width, **engine_args)
+		# Initialize the sample source, normally the RTL-SDR library.  With a DSP
+		# process the source is opened by the worker, which then stands in for
+		# it and also provides the spectra instead of an acquisition thread.
+		self.acquisition = None
+		self.worker = None
+		self.remote = remote
+		self.sweep = None
+		self.zoom = None
+		self.frame_seq = 0
+		self.consumers = []
+		self._no_spectrum = None
+		self.auto_gain = True
+		if remote is not None:
+			# The remote spectra stand in for both the tuner and acquisition, like
+			# a DSP process.
+			self.worker = remote
+			self.sdr = remote
+			self.acquisition = remote
+		elif source is None and dsp_process:
+			import worker
+			self.worker = worker.SpectrumWorker(source_factory, width,
+				engine_args=engine_args, ring_size=ring_size,
+				min_samples=sample_size, raw_reads=raw_reads)
+			self.sdr = self.worker
+			self.acquisition = self.worker
+		elif source is None:
+			func, args, kwargs = source_factory
+			self.sdr = func(*args, **kwargs)
+		else:
+			self.sdr = source
+		self.set_center_freq(center_freq)
+		self.set_sample_rate(sample_rate)
+		self.set_gain(gain)
+
+	def _settings_changed(self):
+		"""Called after a setting which changes the spectra was changed."""
+		pass
+
+	def close(self):
+		"""Stop acquisition and close the sample source."""
+		if self.worker is not None:
+			self.worker.stop()
+			self.acquisition = None
+		else:
+			self.stop_acquisition()
+			self.sdr.close()
+
+	def start_acquisition(self, ring_size=None):
+		"""Start a background thread which continuously reads samples from the
+		tuner and computes spectra, buffering the newest ring_size spectra (by
+		default the ring_size given when the core was created).
+		"""
+		if self.acquisition is not None:
+			return
+		self.acquisition = acquisition.AcquisitionThread(self._read_spectrum,
+			self.width, ring_size=ring_size or self.ring_size,
+			consumer=self._consume)
+		self.acquisition.start()
+
+	def add_consumer(self, consumer):
+		"""Call consumer(freqs, start_freq, stop_freq) with every new spectrum
+		and the span it covers in hertz, whether or not anything reads the
+		spectra.  With background acquisition, a DSP process or remote spectra
+		it's called on a background thread, otherwise whenever a spectrum is
+		read.  Freqs is only valid during the call.
+		"""
+		self.consumers.append(consumer)
+		if self.worker is not None:
+			self.worker.set_consumer(self._consume)
+
+	def _consume(self, freqs):
+		if not self.consumers:
+			return
+		low, high = self.get_span()
+		for consumer in self.consumers:
+			consumer(freqs, low*1000000.0, high*1000000.0)
+
+	def stop_acquisition(self):
+		"""Stop the background acquisition thread and go back to reading
+		samples synchronously.  Has no effect when spectra come from a DSP
+		process, which owns the tuner.
+		"""
+		if self.acquisition is None or self.acquisition is self.worker:
+			return
+		self.acquisition.stop()
+		self.acquisition = None
+
+	def get_center_freq(self):
+		"""Return center frequency of tuner in megahertz, or of the sweep span
+		when sweeping.
+		"""
+		if self.sweep is not None:
+			return (self.sweep.start_freq + self.sweep.stop_freq)/2000000.0
+		return self.sdr.get_center_freq()/1000000.0
+
+	def set_center_freq(self, freq_mhz):
+		"""Set tuner center frequency to provided megahertz value.  Ends the
+		sweep if one is running.
+		"""
+		try:
+			with self._sdr_lock:
+				self._set_sweep(None)
+				self.sdr.set_center_freq(freq_mhz*1000000.0)
+			self._settings_changed()
+		except IOError:
+			# Error setting value, ignore it for now but in the future consider
+			# adding an error message dialog.
+			pass
+
+	def get_sample_rate(self):
+		"""Return sample rate of tuner in megahertz."""
+		return self.sdr.get_sample_rate()/1000000.0
+
+	def set_sample_rate(self, sample_rate_mhz):
+		"""Set tuner sample rate to provided frequency in megahertz."""
+		try:
+			with self._sdr_lock:
+				self.sdr.set_sample_rate(sample_rate_mhz*1000000.0)
+				if self.sweep is not None:
+					# Steps are spaced by the sample rate, so plan them again.
+					self.set_sweep(*[f/1000000.0 for f in self.sweep.requested])
+				if self.zoom is not None:
+					self.set_zoom(*self.get_zoom())
+		except IOError:
+			# Error setting value, ignore it for now but in the future consider
+			# adding an error message dialog.
+			pass
+
+	def get_span(self):
+		"""Return (start, stop) frequencies in megahertz of the displayed
+		spectrum, either the tuner bandwidth or the whole sweep span.
+		"""
+		if self.sweep is not None:
+			return (self.sweep.start_freq/1000000.0,
+				self.sweep.stop_freq/1000000.0)
+		freq = self.get_center_freq()
+		bandwidth = self.get_sample_rate()
+		if self.zoom is not None:
+			freq += self.zoom.offset/1000000.0
+			bandwidth /= self.zoom.factor
+		return (freq - bandwidth/2.0, freq + bandwidth/2.0)
+
+	def get_zoom(self):
+		"""Return (factor, offset from the center frequency in megahertz) of
+		the digital zoom, factor is 1 when not zoomed.
+		"""
+		if self.zoom is None:
+			return (1, 0.0)
+		return (self.zoom.factor, self.zoom.offset/1000000.0)
+
+	def set_zoom(self, factor, offset_mhz=0.0):
+		"""Zoom in on part of the tuner bandwidth without retuning.  The
+		displayed band is the sample rate divided by factor (an integer, 1 turns
+		zoom off) centered offset_mhz megahertz from the center frequency, and
+		is moved inside the tuner bandwidth if needed.  Ends the sweep if one is
+		running and tunes to the center of its span, which the offset is then
+		relative to.
+		"""
+		factor = max(int(factor), 1)
+		try:
+			with self._sdr_lock:
+				if self.sweep is not None:
+					center = (self.sweep.start_freq + self.sweep.stop_freq)/2.0
+					self._set_sweep(None)
+					self.sdr.set_center_freq(center)
+				if factor == 1:
+					self._set_zoom(None)
+				else:
+					rate = self.sdr.get_sample_rate()
+					limit = rate/2.0*(1.0 - 1.0/factor)
+					offset = min(max(offset_mhz*1000000.0, -limit), limit)
+					self._set_zoom(dsp.Decimator(factor, offset, rate,
+						taps_per_phase=self.zoom_taps_per_phase))
+			self._settings_changed()
+		except IOError:
+			# Error setting value, ignore it for now but in the future consider
+			# adding an error message dialog.
+			pass
+
+	def _set_zoom(self, decimator):
+		# The worker process runs its own copy of the decimator.
+		if decimator is self.zoom:
+			return
+		if self.worker is not None:
+			self.worker.set_decimator(decimator)
+		self.zoom = decimator
+
+	def set_sweep(self, start_mhz, stop_mhz):
+		"""Sweep the tuner from start_mhz to stop_mhz megahertz (which can be
+		wider than the sample rate) and show the whole span as one spectrum.
+		The sweep ends by calling clear_sweep() or tuning a center frequency.
+		"""
+		plan = sweep.Sweeper(start_mhz*1000000.0, stop_mhz*1000000.0,
+			self.sdr.get_sample_rate(), self.width, usable=self.sweep_usable,
+			settle_samples=self.sweep_settle_samples)
+		try:
+			with self._sdr_lock:
+				self._set_zoom(None)
+				self._set_sweep(plan)
+			self._settings_changed()
+		except IOError:
+			# Error setting value, ignore it for now but in the future consider
+			# adding an error message dialog.
+			pass
+
+	def clear_sweep(self):
+		"""End the sweep and tune back to the center of its span."""
+		if self.sweep is not None:
+			self.set_center_freq(self.get_center_freq())
+
+	def get_sweep_rate(self):
+		"""Return the number of complete sweeps per second (0 when not
+		sweeping).
+		"""
+		if self.sweep is None:
+			return 0.0
+		if self.worker is not None:
+			return self.worker.sweeps_per_second
+		return self.sweep.sweeps_per_second
+
+	def _set_sweep(self, plan):
+		# The worker process runs its own copy of the sweep.
+		if plan is self.sweep:
+			return
+		if self.worker is not None:
+			self.worker.set_sweep(plan)
+		self.sweep = plan
+
+	def get_gain(self):
+		"""Return gain of tuner.  Can be either the string 'AUTO' or a numeric
+		value that is the gain in decibels.
+		"""
+		if self.auto_gain:
+			return 'AUTO'
+		else:
+			return '{0:0.1f}'.format(self.sdr.get_gain())
+
+	def set_gain(self, gain_db):
+		"""Set gain of tuner.  Can be the string 'AUTO' for automatic gain
+		or a numeric value in decibels for fixed gain.
+		"""
+		try:
+			with self._sdr_lock:
+				if gain_db == 'AUTO':
+					self.sdr.set_manual_gain_enabled(False)
+				else:
+					self.sdr.set_gain(float(gain_db))
+			self.auto_gain = gain_db == 'AUTO'
+			self._settings_changed()
+		except IOError:
+			# Error setting value, ignore it for now but in the future consider
+			# adding an error message dialog.
+			pass
+
+	def _configure_engine(self, **kwargs):
+		# A DSP process gets the change for the engine it runs, and the local
+		# engine keeps the settings for the getters once it was accepted.
+		# Returns False if the change was refused.
+		try:
+			with self._sdr_lock:
+				if self.worker is not None:
+					self.worker.configure(**kwargs)
+				self.engine.configure(**kwargs)
+			return True
+		except IOError:
+			return False
+
+	def get_fft_size(self):
+		"""Return number of samples (and frequency bins) in each FFT."""
+		return self.engine.fft_size
+
+	def set_fft_size(self, size):
+		"""Set number of samples in each FFT.  The FFT size is independent of
+		the display width, FFT bins are pooled down to one value per column.
+		"""
+		if self._configure_engine(fft_size=size):
+			self._settings_changed()
+
+	def set_pooling(self, method):
+		"""Set how FFT bins are pooled down to display columns, can be one of
+		the dsp.POOL_METHODS values ('max', 'mean', or 'peak').
+		"""
+		self._configure_engine(pooling=method)
+
+	def set_averaging(self, segments, overlap=0.5, window='hann'):
+		"""Set how each spectrum is averaged.  Each spectrum averages the power
+		of segments FFTs over blocks of samples which overlap by the provided
+		fraction (0 to <1), after multiplying each block by the window function
+		('rectangular', 'hann', 'hamming', or 'blackman').  A single segment with
+		a rectangular window is a plain FFT.
+		"""
+		if self._configure_engine(segments=segments, overlap=overlap,
+			window=window):
+			self._settings_changed()
+
+	def _read_spectrum(self):
+		"""Read samples from the tuner and return the intensity in decibels of
+		each frequency bucket (i.e. FFT of radio samples) pooled down to the
+		width.  Called either from get_spectrum() or from the background
+		acquisition thread.  The returned array is reused by the next call.
+		"""
+		with self._sdr_lock:
+			if self.sweep is not None:
+				return self.sweep.read(self.sdr, self.engine, self._iq,
+					self.sample_size, self.raw_reads)
+			return acquisition.read_spectrum(self.sdr, self.engine, self._iq,
+				self.sample_size, self.raw_reads, self.zoom)
+
+	def has_new_data(self):
+		"""Return True if get_spectrum() would return a spectrum which it hasn't
+		returned before.  Always True without background acquisition because
+		get_spectrum() reads a new spectrum every time.
+		"""
+		return self.acquisition is None or self.acquisition.has_new()
+
+	def get_spectrum(self):
+		"""Return the newest spectrum, an array of width intensities in decibels
+		which is reused by later spectra.  When background acquisition is
+		running the newest spectrum is returned without blocking, and frame_seq
+		only changes when a new spectrum is available.  Otherwise a spectrum is
+		read from the tuner.
+		"""
+		freqs = None
+		if self.acquisition is not None:
+			freqs = self.acquisition.latest()
+			if freqs is None and self.remote is None \
+				and self.acquisition.wait(1.0):
+				freqs = self.acquisition.latest()
+		if self.remote is not None:
+			if freqs is None:
+				# Nothing received from the server yet (the client keeps trying to
+				# connect in the background), show an empty spectrum meanwhile.
+				if self._no_spectrum is None:
+					self._no_spectrum = np.zeros(self.width, dtype=np.float32)
+				return self._no_spectrum
+			if self._no_spectrum is not None:
+				# The first remote spectrum, scale to it instead of the empty one.
+				self._no_spectrum = None
+				self._settings_changed()
+		elif freqs is None and self.worker is not None:
+			# Only the DSP process can read from the tuner.
+			if not self.worker.wait(self.worker.timeout):
+				raise IOError('DSP process has not computed a spectrum.')
+			freqs = self.acquisition.latest()
+		if freqs is None:
+			# No background acquisition (or it hasn't produced anything yet) so
+			# read from the tuner directly.
+			freqs = self._read_spectrum()
+			self.frame_seq += 1
+			self._consume(freqs)
+		else:
+			self.frame_seq = self.acquisition.sequence
+		return freqs
+
+	def iter_spectra(self, count=None, buffer=4, copy=True, timeout=5.0):
+		"""Generate count spectra (or spectra forever if count is None) in the
+		order they are computed, each an array of width intensities in decibels.
+
+		Buffer is how many spectra can be computed ahead of the caller.  With 0
+		each spectrum is read when the caller asks for it.  Otherwise a
+		background thread keeps computing spectra into a buffer of that size
+		while the caller works, and the oldest are dropped (counted in
+		acquisition.frames_dropped) if the caller falls behind.  When background
+		acquisition is already running its own buffer is used.  With copy False
+		the arrays are reused by later spectra instead of copied.  Raises
+		IOError if no spectrum arrives within timeout seconds.
+		"""
+		started = False
+		if buffer > 0 and self.acquisition is None:
+			self.start_acquisition(ring_size=buffer)
+			started = True
+		try:
+			produced = 0
+			while count is None or produced < count:
+				if self.acquisition is None:
+					freqs = self._read_spectrum()
+					self.frame_seq += 1
+					self._consume(freqs)
+				else:
+					freqs = self.acquisition.next(timeout)
+					if freqs is None and self.remote is not None:
+						raise IOError('No spectrum from {0}:{1} within {2} '
+							'seconds.'.format(self.remote.host, self.remote.port,
+							timeout))
+					if freqs is None:
+						raise IOError('No spectrum within {0} seconds.'.format(
+							timeout))
+					self.frame_seq = self.acquisition.sequence
+				yield np.array(freqs) if copy else freqs
+				produced += 1
+		finally:
+			if started:
+				self.stop_acquisition()
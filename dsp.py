@@ -0,0 +1,589 @@
+# FreqShow signal processing functions.
+# These only depend on numpy so they can be used without the user interface.
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import inspect
+
+import numpy as np
+
+
+# Newer numpy versions can write FFT results into an existing array.
+FFT_HAS_OUT = 'out' in inspect.signature(np.fft.fft).parameters
+
+# Methods for pooling FFT bins down to display columns.
+POOL_MAX  = 'max'	# Strongest bin in each column, never hides a signal.
+POOL_MEAN = 'mean'	# Average power in each column, smoothest noise floor.
+POOL_PEAK = 'peak'	# Average power unless a bin stands out, then the peak.
+POOL_METHODS = (POOL_MAX, POOL_MEAN, POOL_PEAK)
+
+
+# Lookup table from each raw unsigned byte the tuner sends to its sample value
+# from -1.0 to 1.0.
+IQ_LUT = ((np.arange(256) - 127.5)/127.5).astype(np.float32)
+
+
+class IQConverter(object):
+	"""Converts raw interleaved unsigned byte I/Q data from the tuner into
+	complex64 samples.  The conversion goes through IQ_LUT into a buffer which
+	is reused between calls, so the samples returned by convert() are only
+	valid until the next call.
+	"""
+
+	def __init__(self, chunk_size=16384):
+		"""Create converter which looks up chunk_size bytes at a time.  Each
+		chunk goes through a reused index buffer so no temporary arrays are
+		allocated, whatever the size of the data.
+		"""
+		self._buffer = np.zeros(0, dtype=np.float32)
+		self._index = np.zeros(chunk_size, dtype=np.intp)
+
+	def convert(self, raw):
+		"""Convert a bytes-like object of raw I/Q data into complex64 samples."""
+		data = np.frombuffer(raw, dtype=np.uint8)
+		count = len(data) & ~1
+		if len(self._buffer) < count:
+			self._buffer = np.zeros(count, dtype=np.float32)
+		chunk_size = len(self._index)
+		for start in range(0, count, chunk_size):
+			end = min(start + chunk_size, count)
+			index = self._index[:end-start]
+			np.copyto(index, data[start:end])
+			np.take(IQ_LUT, index, out=self._buffer[start:end], mode='clip')
+		return self._buffer[:count].view(np.complex64)
+
+
+# Window functions which can be applied to each FFT segment.
+WINDOWS = {
+	'rectangular': np.ones,
+	'hann':        np.hanning,
+	'hamming':     np.hamming,
+	'blackman':    np.blackman,
+}
+
+window_cache = {}
+def get_window(name, size):
+	"""Get window function of the specified name and size.  Will cache windows
+	internally for faster repeated access to them.
+	"""
+	key = (name, size)
+	if key not in window_cache:
+		if name not in WINDOWS:
+			raise ValueError('Unknown window: {0}'.format(name))
+		window_cache[key] = WINDOWS[name](size).astype(np.float32)
+	return window_cache[key]
+
+def segment_step(size, overlap):
+	"""Return number of samples between the start of consecutive FFT segments
+	of size samples which overlap by the provided fraction (0 to <1).
+	"""
+	return max(1, int(round(size*(1.0 - overlap))))
+
+def segments_length(size, segments, overlap):
+	"""Return number of samples needed for the provided number of overlapping
+	FFT segments.
+	"""
+	return size + (segments - 1)*segment_step(size, overlap)
+
+def segment(samples, size, segments, overlap):
+	"""Return a 2D view (no copy) of samples split into up to the provided
+	number of overlapping segments of size samples each.
+	"""
+	step = segment_step(size, overlap)
+	segments = min(segments, (len(samples) - size)//step + 1)
+	stride = samples.strides[0]
+	return np.lib.stride_tricks.as_strided(samples, shape=(segments, size),
+		strides=(step*stride, stride), writeable=False)
+
+decimator_taps_cache = {}
+def decimator_taps(factor, taps_per_phase=16):
+	"""Get the lowpass FIR filter taps (a Blackman windowed sinc) for decimating
+	by the provided factor, with taps_per_phase taps for each of the factor
+	phases of the polyphase filter.  Will cache taps internally for faster
+	repeated access to them.
+	"""
+	key = (factor, taps_per_phase)
+	if key not in decimator_taps_cache:
+		count = factor*taps_per_phase + 1
+		n = np.arange(count) - (count - 1)/2.0
+		taps = np.sinc(n/factor)*np.blackman(count)
+		taps /= taps.sum()
+		# Reversed, so filtering is a dot product with the samples in order.
+		decimator_taps_cache[key] = taps[::-1].astype(np.complex64)
+	return decimator_taps_cache[key]
+
+def welch_power(samples, size, segments=1, overlap=0.5, window='hann'):
+	"""Compute the averaged power spectrum of samples using Welch's method.
+	The samples are split into overlapping segments of size samples, each is
+	multiplied by the window, all segments are transformed by one batched FFT,
+	and the power is averaged across segments.  The result is normalized by
+	the window power so levels don't depend on the FFT size or window.
+	Complex64 samples are kept in single precision throughout.
+	"""
+	win = get_window(window, size)
+	blocks = segment(samples, size, segments, overlap)
+	power = np.absolute(np.fft.fft(blocks*win, axis=1))**2
+	return power.mean(axis=0)/np.dot(win, win)
+
+def pool_edges(size, width):
+	"""Return array of width start indexes which split size FFT bins into width
+	nearly equal groups (one group per display column).  When size is smaller
+	than width neighboring columns repeat the same bin.
+	"""
+	return (np.arange(width)*size)//width
+
+def pool_spectrum(power, edges, method=POOL_MAX, peak_ratio=4.0):
+	"""Reduce an array of linear power values to one value per group of bins
+	starting at the provided edges (see pool_edges).  Method can be POOL_MAX,
+	POOL_MEAN, or POOL_PEAK.  Peak pooling uses the mean of a group unless its
+	strongest bin is more than peak_ratio times the mean, in which case the
+	strongest bin is used so narrow signals aren't averaged away.
+	"""
+	if method == POOL_MAX:
+		return np.maximum.reduceat(power, edges)
+	counts = np.diff(np.append(edges, len(power)))
+	np.maximum(counts, 1, out=counts)
+	mean = np.add.reduceat(power, edges)/counts
+	if method == POOL_MEAN:
+		return mean
+	elif method == POOL_PEAK:
+		peak = np.maximum.reduceat(power, edges)
+		return np.where(peak > peak_ratio*mean, peak, mean)
+	raise ValueError('Unknown pooling method: {0}'.format(method))
+
+def quantize_db(values, db_min, db_step, out, scratch=None):
+	"""Quantize intensities in decibels into levels 1 to 255 of db_step
+	decibels each starting at db_min, written into the uint8 array out.  Level 0
+	is left free to mark missing data.  Pass a float32 scratch array the size of
+	out to avoid allocating a temporary.
+	"""
+	if scratch is None:
+		scratch = np.zeros(len(out), dtype=np.float32)
+	np.subtract(values[:len(out)], db_min, out=scratch)
+	np.multiply(scratch, 1.0/db_step, out=scratch)
+	np.add(scratch, 1.5, out=scratch)
+	np.clip(scratch, 1, 255, out=scratch)
+	np.copyto(out, scratch, casting='unsafe')
+	return out
+
+def dequantize_db(levels, db_min, db_step, out):
+	"""Convert levels quantized by quantize_db back to decibels, written into
+	the float32 array out.  Level 0 (missing data) comes back as db_min.
+	"""
+	np.copyto(out, levels, casting='unsafe')
+	np.subtract(out, 1.0, out=out)
+	np.maximum(out, 0.0, out=out)
+	np.multiply(out, db_step, out=out)
+	np.add(out, db_min, out=out)
+	return out
+
+def remove_dc(power):
+	"""Replace the center (DC) bin of an fftshifted power spectrum with the
+	average of its neighbors.  The tuner's DC offset otherwise shows up as a
+	spike in the middle of the display.
+	"""
+	center = len(power)//2
+	if 0 < center < len(power)-1:
+		power[center] = (power[center-1] + power[center+1])/2.0
+	return power
+
+
+class Decimator(object):
+	"""Zooms in on part of the tuner bandwidth without retuning.  Samples are
+	mixed down so the offset frequency moves to the center, lowpass filtered
+	and decimated by an integer factor.  The filter only computes the outputs
+	which are kept (a polyphase decimator): the mixed samples are viewed
+	without copying as rows of factor samples, one matrix product filters
+	every row with every row of the taps (one per group of factor taps), and
+	each output is the sum of a diagonal of the result.  The mixer, work
+	buffers, output and taps are reused between calls.
+	"""
+
+	def __init__(self, factor, offset, sample_rate, taps_per_phase=16):
+		"""Create decimator by factor (an integer of at least 1) centered at
+		offset hertz from the center of samples captured at sample_rate hertz.
+		"""
+		self.factor = max(int(factor), 1)
+		self.offset = float(offset)
+		self.sample_rate = float(sample_rate)
+		self.taps = decimator_taps(self.factor, taps_per_phase)
+		# Taps padded with zeros to whole rows of factor taps, transposed so the
+		# product of the sample rows with it has a column per row of taps.
+		rows = -(-len(self.taps)//self.factor)
+		bank = np.zeros(rows*self.factor, dtype=np.complex64)
+		bank[:len(self.taps)] = self.taps
+		self._bank = bank.reshape(rows, self.factor).T
+		self._mixer = np.zeros(0, dtype=np.complex64)
+		self._mixed = np.zeros(0, dtype=np.complex64)
+		self._products = np.zeros((0, rows), dtype=np.complex64)
+		self._out = np.zeros(0, dtype=np.complex64)
+
+	def samples_needed(self, count):
+		"""Return number of input samples needed for count output samples."""
+		return count*self.factor + len(self.taps) - 1
+
+	def process(self, samples):
+		"""Return the decimated complex64 samples of the provided samples.  The
+		returned array is reused by the next call.
+		"""
+		count = (len(samples) - len(self.taps))//self.factor + 1
+		if count <= 0:
+			return self._out[:0]
+		rows = self._bank.shape[1]
+		length = (count - 1)*self.factor + len(self.taps)
+		if len(self._out) != count:
+			phase = -2.0*np.pi*self.offset/self.sample_rate*np.arange(length)
+			self._mixer = np.exp(1j*phase).astype(np.complex64)
+			# Room for whole rows, the samples past length only ever meet the
+			# zero padding of the taps.
+			self._mixed = np.zeros((count + rows - 1)*self.factor,
+				dtype=np.complex64)
+			self._products = np.zeros((count + rows - 1, rows),
+				dtype=np.complex64)
+			self._out = np.zeros(count, dtype=np.complex64)
+		np.multiply(samples[:length], self._mixer, out=self._mixed[:length])
+		# Products[r, m] is sample row r filtered by tap row m, and output k
+		# sums row k + m filtered by tap row m over every m.
+		np.matmul(self._mixed.reshape(-1, self.factor), self._bank,
+			out=self._products)
+		out = self._out
+		np.copyto(out, self._products[:count, 0])
+		for m in range(1, rows):
+			np.add(out, self._products[m:m + count, m], out=out)
+		return out
+
+
+class RangeEstimator(object):
+	"""Tracks the intensity range to display for a stream of spectra.  Each
+	spectrum's low and high percentiles are found in a reused buffer (so
+	memory doesn't grow with history) and the estimate follows them at the
+	attack rate when the range widens and at the slower decay rate when it
+	narrows.  A transient spike widens the range right away but the range then
+	shrinks back to the signals actually present.
+	"""
+
+	def __init__(self, low_percentile=5.0, high_percentile=100.0, attack=0.5,
+		decay=0.02, min_range=1.0):
+		"""Create estimator which uses the provided percentiles (0 to 100) of
+		each spectrum as its bottom and top.  Attack and decay are the fractions
+		(0 to 1) of the difference to a new spectrum's values that the estimate
+		moves per spectrum when widening and narrowing.  The returned range is
+		at least min_range decibels.
+		"""
+		self.low_percentile = low_percentile
+		self.high_percentile = high_percentile
+		self.attack = attack
+		self.decay = decay
+		self.min_range = min_range
+		self._sorted = np.zeros(0, dtype=np.float32)
+		self.reset()
+
+	def reset(self):
+		"""Forget the current estimate, the next spectrum sets it directly."""
+		self.low = None
+		self.high = None
+
+	def _follow(self, current, value, widening):
+		if current is None:
+			return value
+		rate = self.attack if widening else self.decay
+		return current + rate*(value - current)
+
+	def update(self, values):
+		"""Update the estimate with a spectrum and return the (low, high)
+		intensities to display.
+		"""
+		if len(self._sorted) != len(values):
+			self._sorted = np.zeros(len(values), dtype=np.float32)
+		np.copyto(self._sorted, values)
+		last = len(values) - 1
+		low_index = int(round(self.low_percentile/100.0*last))
+		high_index = int(round(self.high_percentile/100.0*last))
+		# Partially sort in place, which is all percentiles need.
+		self._sorted.partition((low_index, high_index))
+		low = float(self._sorted[low_index])
+		high = float(self._sorted[high_index])
+		self.low = self._follow(self.low, low,
+			self.low is not None and low < self.low)
+		self.high = self._follow(self.high, high,
+			self.high is not None and high > self.high)
+		return self.low, max(self.high, self.low + self.min_range)
+
+
+def find_peaks(values, prominence=10.0, radius=4, noise_floor=None,
+	max_peaks=None):
+	"""Return indexes of the peaks in a spectrum of intensities in decibels,
+	strongest first.  A peak is the highest value within radius bins on either
+	side (the first one of a flat top) and at least prominence decibels above
+	the noise floor, by default the median of the spectrum.  At most max_peaks
+	are returned if it isn't None.  Every bin is checked at once with a
+	sliding window, without a Python loop over the spectrum.
+	"""
+	count = len(values)
+	if count == 0:
+		return np.zeros(0, dtype=np.intp)
+	radius = max(radius, 1)
+	if noise_floor is None:
+		noise_floor = float(np.partition(values, count//2)[count//2])
+	# Maximum of the window around every bin, from a strided view over the
+	# spectrum padded with -inf on both ends, in the spectrum's own precision
+	# so every peak compares equal to its window's maximum.
+	padded = np.full(count + 2*radius, -np.inf,
+		dtype=np.result_type(values, np.float32))
+	padded[radius:radius + count] = values
+	stride = padded.strides[0]
+	windows = np.lib.stride_tricks.as_strided(padded, shape=(count, 2*radius+1),
+		strides=(stride, stride), writeable=False)
+	peaks = values >= windows.max(axis=1)
+	peaks &= values > padded[radius-1:radius-1 + count]
+	peaks &= values >= noise_floor + prominence
+	index = np.flatnonzero(peaks)
+	if max_peaks is not None and len(index) > max_peaks:
+		index = index[np.argpartition(values[index], -max_peaks)[-max_peaks:]]
+	return index[np.argsort(values[index])[::-1]]
+
+
+class PeakTrack(object):
+	"""A peak followed across spectra by a PeakTracker."""
+
+	def __init__(self, index, level):
+		self.index = index
+		self.level = level
+		self.hits = 1
+		self.misses = 0
+
+
+class PeakTracker(object):
+	"""Follows the strongest peaks across spectra with hysteresis, so markers
+	don't flicker on and off with the noise.  A new peak has to be at least
+	prominence decibels above the noise floor and found in confirm spectra in
+	a row before it is shown, but a shown peak only has to stay release
+	decibels above it.  A peak which disappears is kept for hold spectra.
+	"""
+
+	def __init__(self, max_peaks=3, prominence=10.0, release=6.0, radius=4,
+		tolerance=3, confirm=3, hold=10):
+		"""Create tracker which shows up to max_peaks peaks.  Radius is passed to
+		find_peaks and a peak within tolerance bins of a tracked one continues
+		it.
+		"""
+		self.max_peaks = max_peaks
+		self.prominence = prominence
+		self.release = release
+		self.radius = radius
+		self.tolerance = tolerance
+		self.confirm = confirm
+		self.hold = hold
+		self.tracks = []
+
+	def reset(self):
+		"""Forget all tracked peaks."""
+		self.tracks = []
+
+	def update(self, values):
+		"""Update the tracks with a spectrum of intensities in decibels and
+		return the tracks to show, strongest first.
+		"""
+		count = len(values)
+		noise_floor = float(np.partition(values, count//2)[count//2])
+		# Candidates above the release level, of which only the ones above the
+		# prominence level can start a new track.
+		candidates = find_peaks(values, self.release, self.radius, noise_floor,
+			max_peaks=4*self.max_peaks)
+		start_level = noise_floor + self.prominence
+		unmatched = list(self.tracks)
+		tracks = []
+		for index in candidates:
+			level = float(values[index])
+			track = None
+			if unmatched:
+				track = min(unmatched, key=lambda t: abs(t.index - index))
+				if abs(track.index - index) > self.tolerance:
+					track = None
+			if track is not None:
+				unmatched.remove(track)
+				track.index = int(index)
+				track.level = level
+				track.hits += 1
+				track.misses = 0
+			elif level >= start_level:
+				track = PeakTrack(int(index), level)
+			else:
+				continue
+			tracks.append(track)
+		# Shown tracks which weren't found are held for a while, new ones which
+		# weren't found again are forgotten.
+		for track in unmatched:
+			track.misses += 1
+			if track.hits >= self.confirm and track.misses <= self.hold:
+				tracks.append(track)
+		tracks.sort(key=lambda t: t.level, reverse=True)
+		self.tracks = tracks[:4*self.max_peaks]
+		shown = [t for t in self.tracks if t.hits >= self.confirm]
+		return shown[:self.max_peaks]
+
+
+class SpectrumEngine(object):
+	"""Computes display spectra from complex samples.  The engine does the same
+	work as welch_power, fftshift, remove_dc and pool_spectrum but owns all its
+	work buffers and runs every step in place.  Buffers are only rebuilt when
+	the FFT size, number of segments or display width change, and the
+	buffer_allocations attribute counts every array the engine has allocated.
+
+	Numpy's FFT still allocates its own scratch space internally on every
+	call (a few times the size of the segments), which is the only memory
+	computing a spectrum from complex64 samples allocates.
+	"""
+
+	def __init__(self, width, fft_size=1024, segments=1, overlap=0.5,
+		window='hann', pooling=POOL_PEAK, peak_ratio=4.0):
+		"""Create engine which turns samples into width dB values.  See
+		configure() for the meaning of the other parameters.
+		"""
+		self.buffer_allocations = 0
+		self._shape = None
+		self.width = width
+		self.configure(fft_size=fft_size, segments=segments, overlap=overlap,
+			window=window, pooling=pooling, peak_ratio=peak_ratio)
+
+	def configure(self, width=None, fft_size=None, segments=None, overlap=None,
+		window=None, pooling=None, peak_ratio=None):
+		"""Change any of the engine parameters, parameters which are None keep
+		their current value.  Width is the number of output values, fft_size the
+		number of frequency bins in each FFT, segments and overlap control the
+		averaging of multiple FFTs per spectrum (see welch_power), window is one
+		of the WINDOWS names, and pooling and peak_ratio control how FFT bins are
+		reduced to width values (see pool_spectrum).
+		"""
+		if window is not None and window not in WINDOWS:
+			raise ValueError('Unknown window: {0}'.format(window))
+		if pooling is not None and pooling not in POOL_METHODS:
+			raise ValueError('Unknown pooling method: {0}'.format(pooling))
+		if overlap is not None and not 0.0 <= overlap < 1.0:
+			raise ValueError('Overlap must be from 0 up to 1.')
+		if width is not None:
+			self.width = int(width)
+		if fft_size is not None:
+			self.fft_size = int(fft_size)
+		if segments is not None:
+			self.segments = max(int(segments), 1)
+		if overlap is not None:
+			self.overlap = float(overlap)
+		if window is not None:
+			self.window = window
+		if pooling is not None:
+			self.pooling = pooling
+		if peak_ratio is not None:
+			self.peak_ratio = float(peak_ratio)
+		win = get_window(self.window, self.fft_size)
+		self._scale = 1.0/np.dot(win, win)
+		# Keep a complex copy of the window so multiplying complex64 samples by
+		# it doesn't need a casting buffer.
+		self._win = win.astype(np.complex64)
+		if self._shape != (self.width, self.fft_size, self.segments):
+			self._build()
+
+	def samples_needed(self):
+		"""Return number of samples compute() needs to fill every segment."""
+		return segments_length(self.fft_size, self.segments, self.overlap)
+
+	def _alloc(self, shape, dtype):
+		self.buffer_allocations += 1
+		return np.zeros(shape, dtype=dtype)
+
+	def _build(self):
+		width, size, segments = self.width, self.fft_size, self.segments
+		self._shape = (width, size, segments)
+		self._windowed = self._alloc((segments, size), np.complex64)
+		self._spectrum = self._alloc((segments, size), np.complex64)
+		self._power2d = self._alloc((segments, size), np.float32)
+		self._power = self._alloc(size, np.float32)
+		self._shifted = self._alloc(size, np.float32)
+		# Index permutation which does the same as fftshift.
+		self._shift = np.fft.fftshift(np.arange(size))
+		self._edges = pool_edges(size, width)
+		counts = np.diff(np.append(self._edges, size))
+		self._counts = np.maximum(counts, 1).astype(np.float32)
+		self._peak = self._alloc(width, np.float32)
+		self._mean = self._alloc(width, np.float32)
+		self._mask = self._alloc(width, np.bool_)
+		self._out = self._alloc(width, np.float32)
+		self.buffer_allocations += 4
+
+	def compute_power(self, samples):
+		"""Compute the averaged power of every FFT bin of the provided complex
+		samples, with the center frequency in the middle and the DC bin removed.
+		Returns an array of fft_size linear power values which is owned by the
+		engine and overwritten by the next computation.
+		"""
+		blocks = segment(samples, self.fft_size, self.segments, self.overlap)
+		count = len(blocks)
+		windowed = self._windowed[:count]
+		spectrum = self._spectrum[:count]
+		power2d = self._power2d[:count]
+		# Window every segment and run all the FFTs in one batch.  Segments are
+		# windowed one at a time because numpy copies the whole overlapping
+		# view into a temporary buffer when multiplying it in one call.
+		for i in range(count):
+			np.multiply(blocks[i], self._win, out=windowed[i])
+		if FFT_HAS_OUT:
+			np.fft.fft(windowed, axis=1, out=spectrum)
+		else:
+			spectrum = np.fft.fft(windowed, axis=1)
+			self.buffer_allocations += 1
+		# Average the power of the segments.
+		np.absolute(spectrum, out=power2d)
+		np.square(power2d, out=power2d)
+		np.sum(power2d, axis=0, out=self._power)
+		np.multiply(self._power, self._scale/count, out=self._power)
+		# Shift the center frequency to the center and ignore the DC value.
+		np.take(self._power, self._shift, out=self._shifted, mode='clip')
+		remove_dc(self._shifted)
+		return self._shifted
+
+	def compute(self, samples):
+		"""Compute the spectrum of the provided complex samples.  Returns an
+		array of width intensities in decibels which is owned by the engine and
+		overwritten by the next call to compute().
+		"""
+		self.compute_power(samples)
+		# Pool the FFT bins down to one value per display column.
+		out = self._out
+		if self.pooling == POOL_MAX:
+			np.maximum.reduceat(self._shifted, self._edges, out=out)
+		else:
+			np.add.reduceat(self._shifted, self._edges, out=self._mean)
+			np.divide(self._mean, self._counts, out=self._mean)
+			if self.pooling == POOL_MEAN:
+				np.copyto(out, self._mean)
+			else:
+				np.maximum.reduceat(self._shifted, self._edges, out=self._peak)
+				np.multiply(self._mean, self.peak_ratio, out=out)
+				np.greater(self._peak, out, out=self._mask)
+				np.copyto(out, self._mean)
+				np.copyto(out, self._peak, where=self._mask)
+		# Convert to decibels.
+		np.log10(out, out=out)
+		np.multiply(out, 10.0, out=out)
+		return out
@@ -22,27 +22,152 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import atexit
 import os
+import sys
 import time
 
 import pygame
 
 import controller
 import model
+import perf
+import scheduler
 import ui
+import views
 
 
 # Application configuration.
-SDR_SAMPLE_SIZE = 1024	# Number of samples to grab from the radio.  Should be
-						# larger than the maximum display width.
+SDR_SAMPLE_SIZE = 1024	# Number of samples to grab from the radio.  At least
+						# SDR_FFT_SIZE samples are always read.
+
+SDR_RAW_READS = True	# Read raw bytes from the radio and convert them to
+						# single precision samples, which uses a quarter of
+						# the memory of the library's double precision ones.
+
+# Replay a raw I/Q recording instead of opening the RTL-SDR, set to the path
+# of a recording file to enable.  Recordings can be made with rtl_sdr (cu8
+# format) and are replayed looping at their recorded sample rate.
+SDR_REPLAY_FILE        = None
+SDR_REPLAY_FORMAT      = 'cu8'		# 'cu8' (unsigned bytes) or 'cf32' (floats).
+SDR_REPLAY_SAMPLE_RATE = 2.4		# Sample rate of the recording in MHz.
+SDR_REPLAY_CENTER_FREQ = 90.3		# Center frequency of the recording in MHz.
+SDR_REPLAY_PACING      = 'realtime'	# 'realtime' or 'fast' (as fast as possible).
+SDR_REPLAY_LOOP        = True		# Start over at the end of the recording.
+
+# Read samples from an rtl_tcp server instead of a local RTL-SDR, set to
+# 'host' or 'host:port' of the server (port 1234 by default) to enable.
+SDR_RTL_TCP = None
+
+SDR_FFT_SIZE = 1024		# Number of frequency bins computed by each FFT.
+						# Larger sizes give finer frequency resolution and
+						# are independent of the display width.
+
+SDR_AVERAGE_SEGMENTS = 4	# Number of FFT segments averaged into each
+							# spectrum to smooth out noise (1 to disable).
+
+SDR_AVERAGE_OVERLAP = 0.5	# Fraction that consecutive FFT segments overlap.
+
+SDR_WINDOW = 'hann'		# Window applied to each FFT segment, can be
+						# 'rectangular', 'hann', 'hamming', or 'blackman'.
+
+SDR_POOLING = 'peak'	# How FFT bins are combined into display columns, can
+						# be 'max', 'mean', or 'peak' (mean unless one bin
+						# stands out, then its peak).
+
+SWEEP_USABLE = 0.75		# Fraction of the bandwidth in the middle of each
+						# sweep step which is kept, the edges of the tuner
+						# passband roll off.
+
+SWEEP_SETTLE_SAMPLES = 16384	# Samples thrown away after each retune of a
+								# sweep while the tuner settles.
+
+AUTO_SCALE_ATTACK = 0.5		# Fraction of the way the AUTO min/max intensity
+							# moves towards each new spectrum when its range
+							# widens (0 to 1, 1 is immediately).
+
+AUTO_SCALE_DECAY  = 0.02	# Fraction of the way the AUTO min/max intensity
+							# moves towards each new spectrum when its range
+							# narrows, so spikes fade out of the scale.
+
+AUTO_SCALE_LOW_PERCENTILE  = 5		# Percentile of each spectrum used as the
+AUTO_SCALE_HIGH_PERCENTILE = 100	# AUTO min and max intensity (0 to 100).
+
+PEAK_MARKERS    = 3		# Number of strongest signals marked with their
+						# frequency on the spectrograms, 0 disables markers.
+PEAK_PROMINENCE = 10.0	# Decibels above the noise floor (median) a signal
+PEAK_RELEASE    = 6.0	# needs to get a marker, and to keep it.
+PEAK_CONFIRM    = 3		# Spectra a signal has to be found in before it is
+						# marked, and spectra a marker is kept after the
+PEAK_HOLD       = 10	# signal is gone.
+
+HISTORY_FILE   = None	# Path to keep a long-term history of every spectrum
+						# on disk, for example '/home/pi/freqshow_history'.
+						# Swipe down and up on the waterfall (or press the
+						# up and down keys) to scroll back through it, left
+						# and right (minus and plus) to zoom out and in, and
+						# up at the newest rows (end) for the live view.
+						# None disables it.
+HISTORY_LEVELS = 4		# Number of zoomed out levels of the history, each
+HISTORY_FACTOR = 8		# HISTORY_FACTOR times fewer rows than the one below.
+HISTORY_MAX_MB = 256	# Megabytes of disk the history uses at most, then
+						# new rows overwrite the oldest.  None for no limit.
+
+RECORD_FILE        = None	# Path to record every spectrum to for analysis (see
+							# recorder.RecordingReader), None disables it.
+RECORD_FORMAT      = 'uint8'	# 'uint8' (quantized like the waterfall) or
+								# 'float16' (decibels in half precision).
+RECORD_COMPRESSION = 'zlib'	# 'zlib', 'zstd' (needs the zstandard package) or
+							# None to leave recorded spectra uncompressed.
+RECORD_IQ_FILE     = None	# Path to record the raw samples from the tuner to,
+							# replayable with SDR_REPLAY_FILE (see
+							# recorder.open_iq).  Needs SDR_RAW_READS and no
+							# DSP_PROCESS.  None disables it.
+
+ZOOM_TAPS_PER_PHASE = 16	# Length of the digital zoom lowpass filter, in taps
+							# per zoom factor.  Longer filters cut off more
+							# sharply but take longer to run.
+
+SDR_ACQUISITION_THREAD = True	# Read samples and compute spectra on a
+								# background thread so rendering never waits
+								# on the USB transfer from the radio.
+
+DSP_PROCESS = False		# Read samples and compute spectra in a separate
+						# process (on another CPU core) which shares the
+						# spectra with the UI through shared memory.  Needs
+						# Python 3.8 or newer, and replaces the background
+						# acquisition thread.
+
+SPECTRUM_RING_SIZE = 4	# Number of spectra buffered by the background
+						# acquisition thread.  Older spectra are dropped
+						# when the display can't keep up.
+
+SERVER_PORT   = None	# Serve every spectrum to other FreqShow displays on
+						# this TCP port (for example 8622), None disables.
+REMOTE_SERVER = None	# Show the spectra of a FreqShow spectrum server
+						# instead of opening a tuner, for example
+						# 'mast.local:8622'.  The remote tuner can't be
+						# changed from this display.
 
 CLICK_DEBOUNCE  = 0.4	# Number of seconds to wait between clicks events. Set
 						# to a few hunded milliseconds to prevent accidental
 						# double clicks from hard screen presses.
+SWIPE_DISTANCE  = 20	# Pixels a press has to move before it's released to
+						# count as a swipe instead of a click.
+
+PERF_ENABLED   = False	# Time the acquisition, DSP and rendering stages.
+PERF_HUD       = False	# Show FPS and stage timings on screen at startup.
+						# Press 'p' to toggle the display (and timing).
+PERF_DUMP_FILE = None	# Path of a JSON file to write timing statistics to
+						# at exit (when timing is enabled).
+
+TARGET_FPS = 30		# Maximum frames per second rendered for the spectrogram
+					# views.  Other views only render after input.
 
 # Font size configuration.
 MAIN_FONT = 33
 NUM_FONT  = 50
+HUD_FONT  = 20
 
 # Color configuration (RGB tuples, 0 to 255).
 MAIN_BG        = (  0,   0,   0) # Black
@@ -54,10 +179,21 @@ BUTTON_BG      = ( 60,  60,  60) # Dark gray
 BUTTON_FG      = (255, 255, 255) # White
 BUTTON_BORDER  = (200, 200, 200) # White/light gray
 INSTANT_LINE   = (  0, 255, 128) # Bright yellow green.
+HUD_FG         = (255, 255,   0) # Yellow
+MARKER_FG      = (255, 255, 255) # White
+
+# Instantaneous spectrogram drawing configuration.
+INSTANT_MODE      = 'line'	# How to draw the instantaneous spectrogram, can be
+							# 'line', 'fill' (area under the line), or 'dots'.
+INSTANT_ANTIALIAS = False	# Draw antialiased lines in 'line' mode (slower).
 
 # Define gradient of colors for the waterfall graph.  Gradient goes from blue to
 # yellow to cyan to red.
 WATERFALL_GRAD = [(0, 0, 255), (0, 255, 255), (255, 255, 0), (255, 0, 0)]
+WATERFALL_LUT_SIZE = 256	# Number of precomputed colors along the gradient.
+WATERFALL_DB_MIN  = -80.0	# Intensity in decibels of the lowest level kept
+WATERFALL_DB_STEP = 0.5		# in the waterfall history, and the decibels
+							# between its 255 levels.
 
 # Configure default UI and button values.
 ui.MAIN_FONT = MAIN_FONT
@@ -82,18 +218,57 @@ if __name__ == '__main__':
 	pygame.display.update()
 	splash_start = time.time()
 	# Create model and controller.
+	perf.enable(PERF_ENABLED)
+	if PERF_DUMP_FILE is not None:
+		atexit.register(perf.dump, PERF_DUMP_FILE)
 	fsmodel = model.FreqShowModel(size[0], size[1])
 	fscontroller = controller.FreqShowController(fsmodel)
+	hud = views.PerfHud()
+	if PERF_HUD:
+		hud.toggle()
 	time.sleep(2.0)
-	# Main loop to process events and render current view.
+	# Main loop to render current view and process events.
+	frames = scheduler.FrameScheduler(TARGET_FPS)
 	lastclick = 0
+	lastview = None
+	redraw = False
 	while True:
-		# Process any events (only mouse events for now).
-		for event in pygame.event.get():
-			if (event.type == pygame.MOUSEBUTTONDOWN) \
+		# Update and render the current view.  Redraw the whole view when it
+		# was just shown or something was clicked, otherwise only the parts of
+		# the view that changed are drawn and sent to the display.
+		start = perf.clock()
+		view = fscontroller.current()
+		if redraw or view is not lastview:
+			view.invalidate()
+			lastview = view
+		dirty = view.render(screen)
+		dirty += hud.render(screen)
+		perf.record('render', start)
+		start = perf.clock()
+		if dirty:
+			pygame.display.update(dirty)
+		perf.record('update', start)
+		perf.frame()
+		# Wait for the next frame (or input for static views) and process any
+		# events (only mouse events for now).
+		redraw = False
+		events = frames.wait(view.animated or hud.visible)
+		start = perf.clock()
+		for event in events:
+			if event.type == pygame.QUIT:
+				sys.exit(0)
+			elif (event.type == pygame.MOUSEBUTTONDOWN) \
 				and (time.time() - lastclick >= CLICK_DEBOUNCE):
 				lastclick = time.time()
 				fscontroller.current().click(pygame.mouse.get_pos())
-		# Update and render the current view.
-		fscontroller.current().render(screen)
-		pygame.display.update()
+				redraw = True
+			elif event.type == pygame.MOUSEBUTTONUP:
+				fscontroller.current().release(pygame.mouse.get_pos())
+				redraw = True
+			elif event.type == pygame.KEYDOWN:
+				if event.key == pygame.K_p:
+					hud.toggle()
+				else:
+					fscontroller.current().key(event.key)
+				redraw = True
+		perf.record('events', start)
@@ -0,0 +1,364 @@
+# FreqShow long-term spectrum history.
+# Appends every spectrum to files on disk which are memory-mapped for reading,
+# so hours of history can be scrolled back through with bounded memory and
+# (with a size limit, where the newest rows overwrite the oldest) bounded
+# disk use.
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+# Record kept in the index for every full resolution row.
+INDEX_DTYPE = np.dtype([('time', '<f8'), ('start', '<f8'), ('stop', '<f8')])
+
+# Header of a RingFile: magic, capacity, number of records dropped from the
+# start and number of records held.
+RING_HEADER = struct.Struct('<4sQQQ')
+RING_MAGIC  = b'FSRF'
+
+
+class RowFile(object):
+	"""Append-only file of fixed size records.  Records are appended with
+	buffered writes and read through a memory map of the file.  The records
+	appended since the file was last mapped are also kept in memory, so the
+	file is only mapped again once more than chunk records were appended.
+	"""
+
+	def __init__(self, path, dtype, shape=(), chunk=256):
+		self.path = path
+		self.dtype = np.dtype(dtype)
+		self.shape = tuple(shape)
+		self.record_size = self.dtype.itemsize*int(np.prod(self.shape))
+		# Number of records dropped from the start, always 0 for this file.
+		self.first = 0
+		self.file = open(path, 'ab')
+		# Ignore a partly written record at the end of the file.
+		self.count = os.path.getsize(path)//self.record_size
+		self.file.truncate(self.count*self.record_size)
+		self._map = None
+		self._mapped = 0
+		self._tail = np.zeros((chunk,) + self.shape, dtype=self.dtype)
+		self._joined = None
+
+	def __len__(self):
+		return self.count
+
+	def append(self, record):
+		record = np.ascontiguousarray(record, dtype=self.dtype)
+		self.file.write(record.tobytes())
+		if self._map is not None and self.count - self._mapped < len(self._tail):
+			self._tail[self.count - self._mapped] = record
+		self.count += 1
+
+	def read(self, start, stop):
+		"""Return a read only array of the records from start up to stop.  It
+		can be a buffer which is reused by the next read.
+		"""
+		start = max(0, start)
+		stop = min(stop, self.count)
+		if stop <= start:
+			return np.zeros((0,) + self.shape, dtype=self.dtype)
+		if self._map is None or stop - self._mapped > len(self._tail):
+			self.file.flush()
+			self._map = np.memmap(self.path, dtype=self.dtype, mode='r',
+				shape=(self.count,) + self.shape)
+			self._mapped = self.count
+		if stop <= self._mapped:
+			return self._map[start:stop]
+		if start >= self._mapped:
+			rows = self._tail[start-self._mapped:stop-self._mapped]
+		else:
+			# Join the mapped records and the ones kept in memory in a buffer
+			# which only grows.
+			if self._joined is None or len(self._joined) < stop - start:
+				self._joined = np.zeros((stop - start,) + self.shape,
+					dtype=self.dtype)
+			rows = self._joined[:stop-start]
+			split = self._mapped - start
+			rows[:split] = self._map[start:]
+			rows[split:] = self._tail[:stop-self._mapped]
+		rows = rows.view()
+		rows.flags.writeable = False
+		return rows
+
+	def keep(self, total):
+		"""Drop the records after the first total ever appended."""
+		self.count = min(self.count, total)
+		self.file.truncate(self.count*self.record_size)
+		self._map = None
+
+	def flush(self):
+		self.file.flush()
+
+	def close(self):
+		self._map = None
+		self.file.close()
+
+
+class RingFile(object):
+	"""File of at most capacity fixed size records, which overwrites the
+	oldest record in place once it's full.  Record i since the file was
+	created is kept in slot i % capacity, and a small header at the start of
+	the file counts the records dropped from the start (first) and the
+	records held.  The file grows chunk records at a time until it holds
+	capacity records, and is only mapped again when it grows.
+	"""
+
+	def __init__(self, path, dtype, shape, capacity, chunk=256):
+		self.path = path
+		self.dtype = np.dtype(dtype)
+		self.shape = tuple(shape)
+		self.record_size = self.dtype.itemsize*int(np.prod(self.shape))
+		self.capacity = capacity
+		self.chunk = chunk
+		if not os.path.exists(path):
+			open(path, 'wb').close()
+		self.file = open(path, 'r+b')
+		header = self.file.read(RING_HEADER.size)
+		magic, capacity, self.first, self.count = RING_HEADER.unpack(header) \
+			if len(header) == RING_HEADER.size else (None, None, 0, 0)
+		if magic != RING_MAGIC or capacity != self.capacity:
+			# Start over a file from an older version or for another capacity.
+			self.first = self.count = 0
+			self.file.truncate(0)
+		self.slots = max(min((os.path.getsize(path) - RING_HEADER.size)
+			//self.record_size, self.capacity), 0)
+		self.count = min(self.count, self.slots)
+		self.write_header()
+		self._map = None
+		self._joined = None
+
+	def __len__(self):
+		return self.count
+
+	def write_header(self):
+		self.file.seek(0)
+		self.file.write(RING_HEADER.pack(RING_MAGIC, self.capacity, self.first,
+			self.count))
+
+	def append(self, record):
+		slot = (self.first + self.count) % self.capacity
+		if slot >= self.slots:
+			self.slots = min(slot + self.chunk, self.capacity)
+			self.file.truncate(RING_HEADER.size + self.slots*self.record_size)
+		self.file.seek(RING_HEADER.size + slot*self.record_size)
+		self.file.write(np.ascontiguousarray(record, dtype=self.dtype).tobytes())
+		if self.count < self.capacity:
+			self.count += 1
+		else:
+			self.first += 1
+		self.write_header()
+
+	def read(self, start, stop):
+		"""Return a read only array of the records from start up to stop
+		(counted from the oldest record held).  It can be a buffer which is
+		reused by the next read.
+		"""
+		start = max(0, start)
+		stop = min(stop, self.count)
+		if stop <= start:
+			return np.zeros((0,) + self.shape, dtype=self.dtype)
+		# The map shares the file's pages, so written records show in it once
+		# they're flushed.
+		self.file.flush()
+		if self._map is None or len(self._map) != self.slots:
+			self._map = np.memmap(self.path, dtype=self.dtype, mode='r',
+				offset=RING_HEADER.size, shape=(self.slots,) + self.shape)
+		begin = (self.first + start) % self.capacity
+		end = begin + stop - start
+		if end <= self.capacity:
+			return self._map[begin:end]
+		# The records wrap around the end of the file, join them in a buffer
+		# which only grows.
+		if self._joined is None or len(self._joined) < stop - start:
+			self._joined = np.zeros((stop - start,) + self.shape,
+				dtype=self.dtype)
+		rows = self._joined[:stop-start]
+		split = self.capacity - begin
+		rows[:split] = self._map[begin:]
+		rows[split:] = self._map[:end-self.capacity]
+		rows = rows.view()
+		rows.flags.writeable = False
+		return rows
+
+	def keep(self, total):
+		"""Drop the records after the first total ever appended."""
+		self.count = max(min(self.first + self.count, total) - self.first, 0)
+		self.first = min(self.first, total)
+		self.write_header()
+
+	def flush(self):
+		self.file.flush()
+
+	def close(self):
+		self._map = None
+		self.file.close()
+
+
+class SpectrumHistory(object):
+	"""On-disk history of spectra, one fixed width row of quantized intensities
+	(see dsp.quantize_db) per spectrum.  Full resolution rows are stored in
+	the file at path, together with an index of the time and frequency span of
+	every row in path.index.
+
+	For zooming out over long stretches of time the history also keeps a
+	pyramid of coarser levels in path.1, path.2 and so on.  Each row of level
+	k is the maximum of factor rows of level k-1, so a signal that was present
+	in any of them still shows.  Rows are pooled as they are appended, which
+	only needs one pending row per level in memory.
+
+	With a max_size every file is a RingFile sized so together they take up
+	about max_size bytes, and the newest rows overwrite the oldest ones.  Row
+	i of level k (counting every row ever appended) pools full resolution
+	rows i*factor**k to (i+1)*factor**k, which keeps the levels aligned as
+	their oldest rows are dropped.
+
+	Rows can be appended on one thread while they're read on another.
+	"""
+
+	def __init__(self, path, width, levels=4, factor=8, max_size=None):
+		"""Open or create the history at path for rows of width values, with
+		levels coarser levels each factor times smaller than the one below,
+		and keep at most about max_size bytes of it (None for no limit).
+		"""
+		self.path = path
+		self.width = width
+		self.factor = factor
+		self._lock = threading.Lock()
+		paths = [path] + ['{0}.{1}'.format(path, level)
+			for level in range(1, levels + 1)]
+		if max_size is None:
+			self.max_rows = None
+			self.index = RowFile(path + '.index', INDEX_DTYPE)
+			self.levels = [RowFile(level_path, np.uint8, (width,))
+				for level_path in paths]
+		else:
+			# A whole number of rows of the coarsest level, and the index keeps
+			# records for one more of them so the oldest row of every level
+			# still has its record.
+			row_size = INDEX_DTYPE.itemsize + sum(width/float(factor**level)
+				for level in range(levels + 1))
+			block = factor**levels
+			self.max_rows = max(int(max_size/row_size)//block - 1, 1)*block
+			self.index = RingFile(path + '.index', INDEX_DTYPE, (),
+				self.max_rows + block)
+			self.levels = [RingFile(level_path, np.uint8, (width,),
+				self.max_rows//factor**level)
+				for level, level_path in enumerate(paths)]
+		# Rows, index records and levels can be out of step if the program
+		# stopped while appending, use the rows which are complete in all of
+		# them.
+		total = min(self.index.first + len(self.index),
+			self.levels[0].first + len(self.levels[0]))
+		self.index.keep(total)
+		self.levels[0].keep(total)
+		self._pending = np.zeros((len(self.levels), width), dtype=np.uint8)
+		self._pending_count = [0]*len(self.levels)
+		for level in range(1, len(self.levels)):
+			below = self.levels[level-1]
+			rows = self.levels[level]
+			total = below.first + len(below)
+			rows.keep(total//factor)
+			# Pool the rows of the level below which don't fill a whole row of
+			# this level yet.
+			tail = below.read((rows.first + len(rows))*factor - below.first,
+				len(below))
+			self._pending_count[level] = len(tail)
+			if len(tail) > 0:
+				np.max(tail, axis=0, out=self._pending[level])
+
+	def __len__(self):
+		with self._lock:
+			return len(self.levels[0])
+
+	def count(self, level=0):
+		"""Return number of rows in the provided pyramid level."""
+		with self._lock:
+			return len(self.levels[level])
+
+	def append(self, row, start_freq=0.0, stop_freq=0.0, timestamp=None):
+		"""Append a row of width quantized intensities which covers start_freq
+		to stop_freq hertz, and pool it into the coarser levels.
+		"""
+		with self._lock:
+			self.index.append(np.array((time.time() if timestamp is None else
+				timestamp, start_freq, stop_freq), dtype=INDEX_DTYPE))
+			self.levels[0].append(row)
+			for level in range(1, len(self.levels)):
+				pending = self._pending[level]
+				if self._pending_count[level] == 0:
+					pending[:] = row
+				else:
+					np.maximum(pending, row, out=pending)
+				self._pending_count[level] += 1
+				if self._pending_count[level] < self.factor:
+					break
+				# The pooled row is complete, it goes into this level and is pooled
+				# into the level above.
+				self.levels[level].append(pending)
+				self._pending_count[level] = 0
+				row = pending
+
+	def rows(self, start, stop, level=0):
+		"""Return read only array of the rows from start up to stop in the
+		provided pyramid level, oldest first.
+		"""
+		with self._lock:
+			return self.levels[level].read(start, stop)
+
+	def records(self, start, stop, level=0):
+		"""Return the index records (time, start and stop frequency) of the
+		first full resolution row of each row from start up to stop in the
+		provided pyramid level.
+		"""
+		with self._lock:
+			scale = self.factor**level
+			offset = self.levels[level].first*scale - self.index.first
+			return self.index.read(offset + start*scale,
+				offset + stop*scale)[::scale]
+
+	def find(self, timestamp):
+		"""Return the index of the first full resolution row recorded at or
+		after the provided time.
+		"""
+		with self._lock:
+			times = self.index.read(0, len(self.index))['time']
+			return max(int(np.searchsorted(times, timestamp)) -
+				(self.levels[0].first - self.index.first), 0)
+
+	def flush(self):
+		with self._lock:
+			for rows in self.levels + [self.index]:
+				rows.flush()
+
+	def close(self):
+		with self._lock:
+			for rows in self.levels + [self.index]:
+				rows.close()
@@ -22,30 +22,136 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import atexit
+
 import numpy as np
-from rtlsdr import *
 
+import core
+import dsp
 import freqshow
+import history
+import recorder
+import rtltcp
+import server
+import sources
 
 
-class FreqShowModel(object):
-	def __init__(self, width, height):
+class FreqShowModel(core.SpectrumCore):
+	def __init__(self, width, height, source=None):
 		"""Create main FreqShow application model.  Must provide the width and
-		height of the screen in pixels.
+		height of the screen in pixels.  Can provide an optional sample source
+		(an RtlSdr or sources.SampleSource object), by default the recording in
+		SDR_REPLAY_FILE is replayed if set, otherwise an RTL-SDR is opened.
 		"""
 		# Set properties that will be used by views.
 		self.width = width
 		self.height = height
-		# Initialize auto scaling both min and max intensity (Y axis of plots).
+		# Initialize auto scaling both min and max intensity (Y axis of plots),
+		# which follows the range of recent spectra.
+		self.auto_range = dsp.RangeEstimator(
+			low_percentile=freqshow.AUTO_SCALE_LOW_PERCENTILE,
+			high_percentile=freqshow.AUTO_SCALE_HIGH_PERCENTILE,
+			attack=freqshow.AUTO_SCALE_ATTACK, decay=freqshow.AUTO_SCALE_DECAY)
+		self.scaled_seq = None
+		# Track the strongest signals to mark them, if enabled.
+		self.peak_tracker = None
+		self.peaks = []
+		self.peaks_seq = None
+		if freqshow.PEAK_MARKERS > 0:
+			self.peak_tracker = dsp.PeakTracker(max_peaks=freqshow.PEAK_MARKERS,
+				prominence=freqshow.PEAK_PROMINENCE, release=freqshow.PEAK_RELEASE,
+				confirm=freqshow.PEAK_CONFIRM, hold=freqshow.PEAK_HOLD)
+		# Open the long-term history on disk if enabled.
+		self.history = None
+		if freqshow.HISTORY_FILE is not None:
+			self.history = history.SpectrumHistory(freqshow.HISTORY_FILE, width,
+				levels=freqshow.HISTORY_LEVELS, factor=freqshow.HISTORY_FACTOR,
+				max_size=None if freqshow.HISTORY_MAX_MB is None else
+					freqshow.HISTORY_MAX_MB*1024*1024)
+			atexit.register(self.history.close)
+			self._quantized = np.zeros(width, dtype=np.uint8)
+			self._scratch = np.zeros(width, dtype=np.float32)
 		self.min_auto_scale = True
 		self.max_auto_scale = True
 		self.set_min_intensity('AUTO')
 		self.set_max_intensity('AUTO')
-		# Initialize RTL-SDR library.
-		self.sdr = RtlSdr()
-		self.set_center_freq(90.3)
-		self.set_sample_rate(2.4)
-		self.set_gain('AUTO')
+		# Record spectra and samples if enabled.
+		self.recorder = None
+		if freqshow.RECORD_FILE is not None or freqshow.RECORD_IQ_FILE is not None:
+			self.recorder = recorder.Recorder(freqshow.RECORD_FILE,
+				freqshow.RECORD_IQ_FILE, rows=freqshow.RECORD_FORMAT,
+				compression=freqshow.RECORD_COMPRESSION,
+				db_min=freqshow.WATERFALL_DB_MIN, db_step=freqshow.WATERFALL_DB_STEP)
+			atexit.register(self.recorder.close)
+		# Serve spectra to other displays if enabled.
+		self.server = None
+		if freqshow.SERVER_PORT is not None:
+			self.server = server.SpectrumServer(port=freqshow.SERVER_PORT,
+				db_min=freqshow.WATERFALL_DB_MIN, db_step=freqshow.WATERFALL_DB_STEP)
+			self.server.start()
+			atexit.register(self.server.stop)
+		# Show the spectra of a remote server instead of a tuner if enabled.
+		remote = None
+		if freqshow.REMOTE_SERVER is not None:
+			host, _, port = freqshow.REMOTE_SERVER.partition(':')
+			remote = server.SpectrumClient(host, int(port or server.DEFAULT_PORT),
+				width=width, ring_size=freqshow.SPECTRUM_RING_SIZE)
+		# Initialize the tuner and spectrum computation from the configuration.
+		super(FreqShowModel, self).__init__(width, source=source,
+			source_factory=self._source_factory(), center_freq=90.3,
+			sample_rate=2.4, gain='AUTO', fft_size=freqshow.SDR_FFT_SIZE,
+			segments=freqshow.SDR_AVERAGE_SEGMENTS,
+			overlap=freqshow.SDR_AVERAGE_OVERLAP, window=freqshow.SDR_WINDOW,
+			pooling=freqshow.SDR_POOLING, sample_size=freqshow.SDR_SAMPLE_SIZE,
+			raw_reads=freqshow.SDR_RAW_READS,
+			ring_size=freqshow.SPECTRUM_RING_SIZE,
+			dsp_process=freqshow.DSP_PROCESS,
+			sweep_usable=freqshow.SWEEP_USABLE,
+			sweep_settle_samples=freqshow.SWEEP_SETTLE_SAMPLES,
+			zoom_taps_per_phase=freqshow.ZOOM_TAPS_PER_PHASE, remote=remote)
+		# Hand the raw samples to the recorder, which can only see them when
+		# they are read in this process.
+		if freqshow.RECORD_IQ_FILE is not None and self.worker is None:
+			self.sdr = recorder.TapSource(self.sdr, self.recorder)
+		# Keep the history, recording and clients of the server going with every
+		# spectrum, whichever view is shown.  They need spectra to be read in the
+		# background for that.
+		if self.history is not None or self.recorder is not None \
+			or self.server is not None:
+			self.add_consumer(self._keep_spectrum)
+		# Start reading spectra in the background if enabled.
+		if freqshow.SDR_ACQUISITION_THREAD or self.consumers:
+			self.start_acquisition()
+
+	def _keep_spectrum(self, freqs, start_freq, stop_freq):
+		# Append each new spectrum to the long-term history, record it and send
+		# it to the clients of the server.  Called on a background thread.
+		if self.history is not None:
+			dsp.quantize_db(freqs, freqshow.WATERFALL_DB_MIN,
+				freqshow.WATERFALL_DB_STEP, self._quantized, self._scratch)
+			self.history.append(self._quantized, start_freq, stop_freq)
+		if self.recorder is not None:
+			self.recorder.add_spectrum(freqs, start_freq, stop_freq)
+		if self.server is not None:
+			self.server.publish(freqs, start_freq, stop_freq)
+
+	def _source_factory(self):
+		# Return (function, args, kwargs) which opens the configured source, in
+		# a form that can be sent to a worker process.
+		if freqshow.SDR_REPLAY_FILE is not None:
+			return (sources.FileSource, (freqshow.SDR_REPLAY_FILE,), dict(
+				format=freqshow.SDR_REPLAY_FORMAT,
+				sample_rate=freqshow.SDR_REPLAY_SAMPLE_RATE*1000000.0,
+				center_freq=freqshow.SDR_REPLAY_CENTER_FREQ*1000000.0,
+				pacing=freqshow.SDR_REPLAY_PACING, loop=freqshow.SDR_REPLAY_LOOP))
+		if freqshow.SDR_RTL_TCP is not None:
+			host, _, port = freqshow.SDR_RTL_TCP.partition(':')
+			return (rtltcp.RtlTcpSource, (host, int(port or rtltcp.DEFAULT_PORT)),
+				{})
+		return (sources.open_rtlsdr, (), {})
+
+	def _settings_changed(self):
+		self._clear_intensity()
 
 	def _clear_intensity(self):
 		if self.min_auto_scale:
@@ -53,60 +159,18 @@ class FreqShowModel(object):
 		if self.max_auto_scale:
 			self.max_intensity = None
 		self.range = None
+		self.auto_range.reset()
+		self.scaled_seq = None
+		if self.peak_tracker is not None:
+			self.peak_tracker.reset()
+			self.peaks = []
 
-	def get_center_freq(self):
-		"""Return center frequency of tuner in megahertz."""
-		return self.sdr.get_center_freq()/1000000.0
-
-	def set_center_freq(self, freq_mhz):
-		"""Set tuner center frequency to provided megahertz value."""
-		try:
-			self.sdr.set_center_freq(freq_mhz*1000000.0)
-			self._clear_intensity()
-		except IOError:
-			# Error setting value, ignore it for now but in the future consider
-			# adding an error message dialog.
-			pass
-
-	def get_sample_rate(self):
-		"""Return sample rate of tuner in megahertz."""
-		return self.sdr.get_sample_rate()/1000000.0
-
-	def set_sample_rate(self, sample_rate_mhz):
-		"""Set tuner sample rate to provided frequency in megahertz."""
-		try:
-			self.sdr.set_sample_rate(sample_rate_mhz*1000000.0)
-		except IOError:
-			# Error setting value, ignore it for now but in the future consider
-			# adding an error message dialog.
-			pass
-
-	def get_gain(self):
-		"""Return gain of tuner.  Can be either the string 'AUTO' or a numeric
-		value that is the gain in decibels.
-		"""
-		if self.auto_gain:
-			return 'AUTO'
-		else:
-			return '{0:0.1f}'.format(self.sdr.get_gain())
-
-	def set_gain(self, gain_db):
-		"""Set gain of tuner.  Can be the string 'AUTO' for automatic gain
-		or a numeric value in decibels for fixed gain.
+	def get_peak_freq(self, index):
+		"""Return frequency in megahertz of the center of the provided bin of
+		the displayed spectrum.
 		"""
-		if gain_db == 'AUTO':
-			self.sdr.set_manual_gain_enabled(False)
-			self.auto_gain = True
-			self._clear_intensity()
-		else:
-			try:
-				self.sdr.set_gain(float(gain_db))
-				self.auto_gain = False
-				self._clear_intensity()
-			except IOError:
-				# Error setting value, ignore it for now but in the future consider
-				# adding an error message dialog.
-				pass
+		low, high = self.get_span()
+		return low + (index + 0.5)*(high - low)/self.width
 
 	def get_min_string(self):
 		"""Return string with the appropriate minimum intensity value, either
@@ -151,29 +215,25 @@ class FreqShowModel(object):
 	def get_data(self):
 		"""Get spectrogram data from the tuner.  Will return width number of
 		values which are the intensities of each frequency bucket (i.e. FFT of
-		radio samples).
+		radio samples).  When background acquisition is running the newest
+		spectrum is returned without blocking, and frame_seq only changes when
+		a new spectrum is available.
 		"""
-		# Get width number of raw samples so the number of frequency bins is
-		# the same as the display width.  Add two because there will be mean/DC
-		# values in the results which are ignored.
-		samples = self.sdr.read_samples(freqshow.SDR_SAMPLE_SIZE)[0:self.width+2]
-		# Run an FFT and take the absolute value to get frequency magnitudes.
-		freqs = np.absolute(np.fft.fft(samples))
-		# Ignore the mean/DC values at the ends.
-		freqs = freqs[1:-1]
-		# Shift FFT result positions to put center frequency in center.
-		freqs = np.fft.fftshift(freqs)
-		# Convert to decibels.
-		freqs = 20.0*np.log10(freqs)
-		# Update model's min and max intensities when auto scaling each value.
-		if self.min_auto_scale:
-			min_intensity = np.min(freqs)
-			self.min_intensity = min_intensity if self.min_intensity is None \
-				else min(min_intensity, self.min_intensity)
-		if self.max_auto_scale:
-			max_intensity = np.max(freqs)
-			self.max_intensity = max_intensity if self.max_intensity is None \
-				else max(max_intensity, self.max_intensity)
+		freqs = self.get_spectrum()
+		# Update model's min and max intensities when auto scaling each value,
+		# once per spectrum.
+		if (self.min_auto_scale or self.max_auto_scale) and \
+			self.frame_seq != self.scaled_seq:
+			self.scaled_seq = self.frame_seq
+			min_intensity, max_intensity = self.auto_range.update(freqs)
+			if self.min_auto_scale:
+				self.min_intensity = min_intensity
+			if self.max_auto_scale:
+				self.max_intensity = max_intensity
+		# Follow the strongest signals in each new spectrum.
+		if self.peak_tracker is not None and self.frame_seq != self.peaks_seq:
+			self.peaks_seq = self.frame_seq
+			self.peaks = self.peak_tracker.update(freqs)
 		# Update intensity range (length between min and max intensity).
 		self.range = self.max_intensity - self.min_intensity
 		# Return frequency intensities.
@@ -0,0 +1,158 @@
+# FreqShow hot path timing statistics.
+# Stages of the acquisition, DSP and rendering code record how long they take
+# into fixed size rings.  When timing is disabled clock() and record() return
+# immediately so the instrumentation can stay in the hot path.
+#
+# Usage:
+#   start = perf.clock()
+#   ... do work ...
+#   perf.record('stage name', start)
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from collections import OrderedDict
+import json
+import time
+
+import numpy as np
+
+
+enabled = False
+history = 120	# Number of most recent timings kept for each stage.
+
+
+class StageRing(object):
+	"""Fixed size ring of the most recent durations (in seconds) of a stage."""
+
+	def __init__(self, size):
+		self.durations = np.zeros(size)
+		self.count = 0
+
+	def add(self, duration):
+		self.durations[self.count % len(self.durations)] = duration
+		self.count += 1
+
+	def values(self):
+		"""Return array of the durations currently held by the ring."""
+		return self.durations[:min(self.count, len(self.durations))]
+
+
+stages = OrderedDict()
+rates = OrderedDict()
+frame_times = StageRing(history)
+_last_frame = None
+_last_ticks = {}
+
+
+def enable(on=True):
+	"""Turn timing on or off.  Turning it on clears all statistics."""
+	global enabled, _last_frame
+	if on and not enabled:
+		stages.clear()
+		rates.clear()
+		_last_ticks.clear()
+		frame_times.__init__(history)
+		_last_frame = None
+	enabled = on
+
+def clock():
+	"""Return a start time to pass to record() (0 when timing is disabled)."""
+	if not enabled:
+		return 0.0
+	return time.perf_counter()
+
+def record(name, start):
+	"""Record the time elapsed since start (from clock()) for a named stage."""
+	if not enabled:
+		return
+	ring = stages.get(name)
+	if ring is None:
+		ring = stages[name] = StageRing(history)
+	ring.add(time.perf_counter() - start)
+
+def frame():
+	"""Mark the end of a displayed frame, used to compute frames per second."""
+	global _last_frame
+	if not enabled:
+		return
+	now = time.perf_counter()
+	if _last_frame is not None:
+		frame_times.add(now - _last_frame)
+	_last_frame = now
+
+def tick(name):
+	"""Mark one occurrence of a named repeating event (like a completed sweep),
+	used to compute how many times per second it happens.
+	"""
+	if not enabled:
+		return
+	now = time.perf_counter()
+	last = _last_ticks.get(name)
+	_last_ticks[name] = now
+	if last is None:
+		return
+	ring = rates.get(name)
+	if ring is None:
+		ring = rates[name] = StageRing(history)
+	ring.add(now - last)
+
+def rate(ring):
+	"""Return average occurrences per second of the intervals in a ring."""
+	values = ring.values()
+	if len(values) == 0 or values.sum() <= 0:
+		return 0.0
+	return float(len(values)/values.sum())
+
+def fps():
+	"""Return average frames per second over the recent frames."""
+	return rate(frame_times)
+
+def summary():
+	"""Return dict of recent statistics: frames per second, the rate per second
+	of each ticked event and, for each stage, the mean, 95th percentile and max
+	milliseconds and the number of samples.
+	"""
+	result = OrderedDict()
+	result['fps'] = round(fps(), 2)
+	result['rates'] = OrderedDict((name, round(rate(ring), 2))
+		for name, ring in list(rates.items()))
+	for name, ring in list(stages.items()):
+		values = ring.values()*1000.0
+		if len(values) == 0:
+			continue
+		result[name] = OrderedDict([
+			('mean_ms', round(float(values.mean()), 3)),
+			('p95_ms', round(float(np.percentile(values, 95)), 3)),
+			('max_ms', round(float(values.max()), 3)),
+			('count', ring.count),
+		])
+	return result
+
+def dump(path):
+	"""Write the statistics summary to a JSON file at path."""
+	if not enabled:
+		return
+	with open(path, 'w') as outfile:
+		json.dump(summary(), outfile, indent=1)
+		outfile.write('\n')
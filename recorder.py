@@ -0,0 +1,404 @@
+# FreqShow recorder.
+# Records spectra and raw I/Q samples to disk on a background thread, and reads
+# the recordings back for analysis.
+#
+# Spectra are written in chunks of rows which share the same width and tuning.
+# Every chunk is a header (see CHUNK_HEADER) followed by its payload, the
+# timestamp of every row (float64) and then the rows, either quantized levels
+# (uint8, see dsp.quantize_db) or decibels (float16).  The payload can be
+# compressed as one zlib or zstd block, otherwise it is memory-mapped when read.
+#
+# Raw I/Q samples are written as a plain cu8 file which FileSource can replay,
+# with a record of the tuning of each segment of samples in path.segments.
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import dsp
+import history
+import sources
+
+
+# How spectrum rows are stored.
+ROWS_UINT8   = 'uint8'		# Quantized levels, one byte per value.
+ROWS_FLOAT16 = 'float16'	# Decibels in half precision.
+ROW_FORMATS = (ROWS_UINT8, ROWS_FLOAT16)
+
+# How chunk payloads are compressed.  Zstd needs the zstandard package.
+COMPRESS_NONE = None
+COMPRESS_ZLIB = 'zlib'
+COMPRESS_ZSTD = 'zstd'
+COMPRESSIONS = (COMPRESS_NONE, COMPRESS_ZLIB, COMPRESS_ZSTD)
+
+# Chunk header fields: magic, row format, compression, number of rows, width,
+# decibels of level 1 and decibels per level (for uint8 rows), start and stop
+# frequency in hertz, and payload length in bytes.
+CHUNK_MAGIC  = b'FQSR'
+CHUNK_HEADER = struct.Struct('<4sBBxxIIddddQ')
+_ROW_CODES = {ROWS_UINT8: 0, ROWS_FLOAT16: 1}
+_ROW_DTYPES = {0: np.uint8, 1: np.float16}
+_COMPRESSION_CODES = {COMPRESS_NONE: 0, COMPRESS_ZLIB: 1, COMPRESS_ZSTD: 2}
+
+# Index of the chunks of a recording, see RecordingReader.chunks.
+CHUNK_DTYPE = np.dtype([('offset', '<i8'), ('row', '<i8'), ('rows', '<i8'),
+	('width', '<i8'), ('format', 'u1'), ('compression', 'u1'),
+	('db_min', '<f8'), ('db_step', '<f8'), ('start', '<f8'), ('stop', '<f8'),
+	('length', '<i8')])
+
+# Record of the tuning from each sample of a raw I/Q recording on.
+SEGMENT_DTYPE = np.dtype([('center', '<f8'), ('rate', '<f8'),
+	('sample', '<i8')])
+
+
+def _zstd():
+	# The zstandard package is only needed for zstd compressed recordings.
+	try:
+		import zstandard
+	except ImportError:
+		raise ValueError('Zstd compression needs the zstandard package.')
+	return zstandard
+
+
+class Recorder(object):
+	"""Writes spectra and raw I/Q samples to disk on a background thread.  The
+	add methods only copy their data into a bounded queue and never wait on the
+	disk, when the queue is full the data is dropped and counted instead.
+	"""
+
+	def __init__(self, path=None, iq_path=None, rows=ROWS_UINT8,
+		compression=COMPRESS_ZLIB, chunk_rows=256, queue_size=64, db_min=-80.0,
+		db_step=0.5, level=1):
+		"""Create recorder which appends spectra to the file at path and raw I/Q
+		samples to the file at iq_path (either can be None to not record them).
+		Rows is ROWS_UINT8 to quantize spectra into db_step decibel levels from
+		db_min or ROWS_FLOAT16, compression is COMPRESS_NONE, COMPRESS_ZLIB or
+		COMPRESS_ZSTD (at the provided level), and up to chunk_rows spectra are
+		written in each chunk.  Up to queue_size spectra or sample reads wait
+		to be written.
+		"""
+		if rows not in ROW_FORMATS:
+			raise ValueError('Unknown row format: {0}'.format(rows))
+		if compression not in COMPRESSIONS:
+			raise ValueError('Unknown compression: {0}'.format(compression))
+		self.rows = rows
+		self.compression = compression
+		self.chunk_rows = chunk_rows
+		self.db_min = db_min
+		self.db_step = db_step
+		self.level = level
+		self._compressor = None
+		if compression == COMPRESS_ZSTD:
+			self._compressor = _zstd().ZstdCompressor(level=level)
+		self.spectra_written = 0
+		self.spectra_dropped = 0
+		self.samples_written = 0
+		self.samples_dropped = 0
+		self.bytes_written = 0
+		self.file = open(path, 'ab') if path is not None else None
+		self.iq_file = None
+		self.segments = None
+		if iq_path is not None:
+			self.iq_file = open(iq_path, 'ab')
+			self.segments = history.RowFile(iq_path + '.segments', SEGMENT_DTYPE)
+		self._iq_samples = self.iq_file.tell()//2 if self.iq_file else 0
+		self._tuning = None
+		self._chunk = None
+		self._count = 0
+		self._queue = queue.Queue(queue_size)
+		self._thread = threading.Thread(target=self._run, name='FreqShowRecorder')
+		self._thread.daemon = True
+		self._thread.start()
+
+	def add_spectrum(self, freqs, start_freq, stop_freq, timestamp=None):
+		"""Record a spectrum of intensities in decibels which covers start_freq
+		to stop_freq hertz.
+		"""
+		if self.file is None:
+			return
+		try:
+			self._queue.put_nowait(('spectrum', np.array(freqs, dtype=np.float32),
+				start_freq, stop_freq,
+				time.time() if timestamp is None else timestamp))
+		except queue.Full:
+			self.spectra_dropped += 1
+
+	def add_samples(self, data, center_freq, sample_rate):
+		"""Record raw unsigned byte I/Q data received at the provided center
+		frequency and sample rate in hertz.
+		"""
+		if self.iq_file is None:
+			return
+		try:
+			self._queue.put_nowait(('samples', np.array(data, dtype=np.uint8),
+				center_freq, sample_rate, self.samples_dropped))
+		except queue.Full:
+			self.samples_dropped += len(data)//2
+
+	def close(self, timeout=5.0):
+		"""Write everything still queued and close the files."""
+		if not self._thread.is_alive():
+			return
+		self._queue.put(None)
+		self._thread.join(timeout)
+
+	def _run(self):
+		while True:
+			item = self._queue.get()
+			if item is None:
+				break
+			if item[0] == 'spectrum':
+				self._write_spectrum(*item[1:])
+			else:
+				self._write_samples(*item[1:])
+		self._flush_chunk()
+		if self.file is not None:
+			self.file.close()
+		if self.iq_file is not None:
+			self.iq_file.close()
+			self.segments.close()
+
+	def _write_spectrum(self, freqs, start_freq, stop_freq, timestamp):
+		chunk = self._chunk
+		if chunk is not None and (len(freqs) != chunk[1].shape[1] or
+			(start_freq, stop_freq) != chunk[2]):
+			self._flush_chunk()
+			chunk = None
+		if chunk is None:
+			rows = np.zeros((self.chunk_rows, len(freqs)),
+				dtype=np.uint8 if self.rows == ROWS_UINT8 else np.float16)
+			chunk = self._chunk = (np.zeros(self.chunk_rows), rows,
+				(start_freq, stop_freq), np.zeros(len(freqs), dtype=np.float32))
+		times, rows, tuning, scratch = chunk
+		times[self._count] = timestamp
+		if self.rows == ROWS_UINT8:
+			dsp.quantize_db(freqs, self.db_min, self.db_step, rows[self._count],
+				scratch)
+		else:
+			rows[self._count] = freqs
+		self._count += 1
+		self.spectra_written += 1
+		if self._count == self.chunk_rows:
+			self._flush_chunk()
+
+	def _flush_chunk(self):
+		if self._chunk is None or self._count == 0:
+			return
+		times, rows, tuning, scratch = self._chunk
+		payload = times[:self._count].tobytes() + rows[:self._count].tobytes()
+		if self.compression == COMPRESS_ZLIB:
+			payload = zlib.compress(payload, self.level)
+		elif self.compression == COMPRESS_ZSTD:
+			payload = self._compressor.compress(payload)
+		header = CHUNK_HEADER.pack(CHUNK_MAGIC, _ROW_CODES[self.rows],
+			_COMPRESSION_CODES[self.compression], self._count, rows.shape[1],
+			self.db_min, self.db_step, tuning[0], tuning[1], len(payload))
+		self.file.write(header)
+		self.file.write(payload)
+		self.file.flush()
+		self.bytes_written += len(header) + len(payload)
+		self._count = 0
+
+	def _write_samples(self, data, center_freq, sample_rate, dropped):
+		# Samples which follow dropped ones start a new segment, since they
+		# don't continue the last ones.
+		if self._tuning != (center_freq, sample_rate, dropped):
+			self.segments.append(np.array((center_freq, sample_rate,
+				self._iq_samples), dtype=SEGMENT_DTYPE))
+			self.segments.flush()
+			self._tuning = (center_freq, sample_rate, dropped)
+		self.iq_file.write(data.tobytes())
+		self._iq_samples += len(data)//2
+		self.samples_written += len(data)//2
+		self.bytes_written += len(data)
+
+
+class TapSource(object):
+	"""Wraps a sample source and hands a copy of every read to a Recorder,
+	along with the tuning it was received at.  Samples read as complex values
+	(without raw reads) are quantized back to the unsigned bytes the tuner
+	sends.  Everything else is passed through to the wrapped source.
+	"""
+
+	def __init__(self, source, recorder):
+		self.source = source
+		self.recorder = recorder
+		self._center_freq = source.get_center_freq()
+		self._sample_rate = source.get_sample_rate()
+		self._scratch = None
+		self._raw = None
+
+	def __getattr__(self, name):
+		return getattr(self.source, name)
+
+	def set_center_freq(self, freq):
+		self.source.set_center_freq(freq)
+		self._center_freq = self.source.get_center_freq()
+
+	def set_sample_rate(self, rate):
+		self.source.set_sample_rate(rate)
+		self._sample_rate = self.source.get_sample_rate()
+
+	def read_bytes(self, num_bytes):
+		data = self.source.read_bytes(num_bytes)
+		self.recorder.add_samples(data, self._center_freq, self._sample_rate)
+		return data
+
+	def read_samples(self, num_samples):
+		samples = self.source.read_samples(num_samples)
+		if self._raw is None or len(self._raw) != 2*len(samples):
+			# Buffers reused for every read of the same size.
+			self._scratch = np.zeros(2*len(samples), dtype=np.float32)
+			self._raw = np.zeros(2*len(samples), dtype=np.uint8)
+		# Interleave I and Q and scale them back to bytes like dsp.IQ_LUT.
+		scratch = self._scratch
+		scratch[0::2] = samples.real
+		scratch[1::2] = samples.imag
+		np.multiply(scratch, 127.5, out=scratch)
+		np.add(scratch, 127.5, out=scratch)
+		np.rint(scratch, out=scratch)
+		np.clip(scratch, 0, 255, out=scratch)
+		self._raw[:] = scratch
+		self.recorder.add_samples(self._raw, self._center_freq, self._sample_rate)
+		return samples
+
+
+class RecordingReader(object):
+	"""Reads back the spectra written by a Recorder.  The chunk headers are read
+	once when the recording is opened, uncompressed chunks are then read
+	through a memory map of the file and compressed chunks are decompressed
+	when they are read.
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		chunks = []
+		row = 0
+		size = os.path.getsize(path)
+		with open(path, 'rb') as f:
+			offset = 0
+			while offset + CHUNK_HEADER.size <= size:
+				f.seek(offset)
+				magic, format, compression, rows, width, db_min, db_step, start, \
+					stop, length = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+				if magic != CHUNK_MAGIC:
+					raise IOError('{0} is not a FreqShow recording.'.format(path))
+				offset += CHUNK_HEADER.size
+				if offset + length > size:
+					# The recording stopped while writing this chunk.
+					break
+				chunks.append((offset, row, rows, width, format, compression,
+					db_min, db_step, start, stop, length))
+				offset += length
+				row += rows
+		self.chunks = np.array(chunks, dtype=CHUNK_DTYPE)
+		self._map = np.memmap(path, dtype=np.uint8, mode='r') if size else None
+
+	def __len__(self):
+		"""Total number of spectra in the recording."""
+		if len(self.chunks) == 0:
+			return 0
+		return int(self.chunks['row'][-1] + self.chunks['rows'][-1])
+
+	def chunk(self, index):
+		"""Return (timestamps, rows) of a chunk as they are stored, rows are
+		uint8 levels or float16 decibels.  Uncompressed chunks are read only
+		views of the file.
+		"""
+		c = self.chunks[index]
+		payload = self._map[c['offset']:c['offset'] + c['length']]
+		if c['compression'] == _COMPRESSION_CODES[COMPRESS_ZLIB]:
+			payload = np.frombuffer(zlib.decompress(payload), dtype=np.uint8)
+		elif c['compression'] == _COMPRESSION_CODES[COMPRESS_ZSTD]:
+			payload = np.frombuffer(_zstd().ZstdDecompressor().decompress(
+				payload), dtype=np.uint8)
+		rows = int(c['rows'])
+		times = payload[:rows*8].view(np.float64)
+		data = payload[rows*8:].view(_ROW_DTYPES[int(c['format'])])
+		return times, data.reshape(rows, int(c['width']))
+
+	def read(self, start=0, stop=None):
+		"""Return (timestamps, start frequencies, stop frequencies, decibels) of
+		the spectra from start up to stop, decibels as a float32 array with one
+		row per spectrum.  All of them must have the same width.
+		"""
+		stop = len(self) if stop is None else min(stop, len(self))
+		first = np.searchsorted(self.chunks['row'], start, side='right') - 1
+		selected = self.chunks[max(first, 0):]
+		selected = selected[selected['row'] < stop]
+		if len(np.unique(selected['width'])) > 1:
+			raise ValueError('Spectra have different widths, read fewer of them.')
+		count = max(stop - start, 0)
+		width = int(selected['width'][0]) if len(selected) else 0
+		times = np.zeros(count)
+		starts = np.zeros(count)
+		stops = np.zeros(count)
+		freqs = np.zeros((count, width), dtype=np.float32)
+		for i in range(len(selected)):
+			c = selected[i]
+			chunk_times, rows = self.chunk(max(first, 0) + i)
+			lo = max(start - c['row'], 0)
+			hi = min(stop - c['row'], c['rows'])
+			out = slice(c['row'] + lo - start, c['row'] + hi - start)
+			times[out] = chunk_times[lo:hi]
+			starts[out] = c['start']
+			stops[out] = c['stop']
+			if c['format'] == _ROW_CODES[ROWS_UINT8]:
+				dsp.dequantize_db(rows[lo:hi], c['db_min'], c['db_step'],
+					freqs[out])
+			else:
+				freqs[out] = rows[lo:hi]
+		return times, starts, stops, freqs
+
+
+def read_segments(iq_path):
+	"""Return the (center frequency, first sample, number of samples) segments
+	of a raw I/Q recording, as taken by sources.FileSource, and its sample
+	rate (of the first segment).
+	"""
+	path = iq_path + '.segments'
+	records = np.fromfile(path, dtype=SEGMENT_DTYPE,
+		count=os.path.getsize(path)//SEGMENT_DTYPE.itemsize)
+	total = os.path.getsize(iq_path)//2
+	ends = np.append(records['sample'][1:], total)
+	segments = [(float(r['center']), int(r['sample']), int(end - r['sample']))
+		for r, end in zip(records, ends) if end > r['sample']]
+	rate = float(records['rate'][0]) if len(records) else 2.4e6
+	return segments, rate
+
+
+def open_iq(iq_path, pacing=sources.PACING_REALTIME, loop=True):
+	"""Open a raw I/Q recording as a sources.FileSource which replays each
+	recorded segment when tuned to its center frequency.
+	"""
+	segments, rate = read_segments(iq_path)
+	return sources.FileSource(iq_path, sample_rate=rate, segments=segments,
+		pacing=pacing, loop=loop)
@@ -0,0 +1,410 @@
+# FreqShow rtl_tcp sample source.
+# Reads samples from a tuner on another machine which is served by rtl_tcp
+# (part of the rtl-sdr tools), for example a dongle on a remote mast.
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import select
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+import dsp
+import sources
+
+
+DEFAULT_PORT = 1234
+
+# rtl_tcp sends a header when a client connects: magic, tuner type and number
+# of gain values.  After that the server streams raw unsigned byte I/Q data,
+# and the client sends commands of a command byte and a parameter.
+HEADER  = struct.Struct('>4sII')
+MAGIC   = b'RTL0'
+COMMAND = struct.Struct('>BI')
+
+CMD_SET_FREQ        = 0x01	# Center frequency in hertz.
+CMD_SET_SAMPLE_RATE = 0x02	# Sample rate in hertz.
+CMD_SET_GAIN_MODE   = 0x03	# 0 for automatic gain, 1 for manual gain.
+CMD_SET_GAIN        = 0x04	# Gain in tenths of a decibel.
+
+# Most bytes the reader thread receives with one call.
+RECV_SIZE = 65536
+
+
+class RtlTcpSource(sources.SampleSource):
+	"""Sample source which connects to an rtl_tcp server.  Tuning commands are
+	sent to the server, and a reader thread receives the stream continuously
+	with large reads straight into a preallocated ring buffer, so samples don't
+	queue up in the socket or in the server while spectra are computed.
+
+	Reads return the newest samples which arrived after the previous read and
+	after the last command was sent, older samples are skipped.  That keeps
+	the display live instead of falling behind the stream, and samples from
+	before a retune are never returned.
+
+	When the connection is lost the source reconnects on the next read and
+	sends the current settings again.  Throughput, underruns (reads which had
+	to wait for data from the network) and skipped bytes are counted.
+	"""
+
+	def __init__(self, host, port=DEFAULT_PORT, center_freq=100e6,
+		sample_rate=2.4e6, buffer_size=1048576, timeout=5.0, retries=3,
+		retry_delay=0.5):
+		"""Connect to the rtl_tcp server at host and port and tune it to
+		center_freq and sample_rate hertz.  Buffer_size is the size in bytes of
+		the ring buffer which received data is kept in (it grows when a read
+		needs more).  Reads fail with IOError when no data arrives within
+		timeout seconds, after reconnecting retries times retry_delay seconds
+		apart.
+		"""
+		super(RtlTcpSource, self).__init__(center_freq, sample_rate)
+		self.host = host
+		self.port = port
+		self.buffer_size = buffer_size
+		self.timeout = timeout
+		self.retries = retries
+		self.retry_delay = retry_delay
+		self.tuner_type = None
+		self.gain_count = 0
+		self.connects = 0
+		self.bytes_received = 0
+		self.bytes_skipped = 0
+		self.reads = 0
+		self.underruns = 0
+		self._sock = None
+		self._connected_at = None
+		self._connected_bytes = 0
+		# Ring of received bytes.  Received counts every byte put into the ring
+		# and fresh is the count when the last command was sent, reads only
+		# return bytes past it and past the end of the previous read.
+		self._ring = np.zeros(max(buffer_size, 2*RECV_SIZE), dtype=np.uint8)
+		self._received = 0
+		self._fresh = 0
+		self._read_end = 0
+		self._cond = threading.Condition()
+		self._buffer = np.zeros(0, dtype=np.uint8)
+		self._iq = dsp.IQConverter()
+		self._connect()
+
+	@property
+	def connected(self):
+		return self._sock is not None
+
+	@property
+	def throughput(self):
+		"""Average bytes per second received over the current connection."""
+		if self._connected_at is None:
+			return 0.0
+		elapsed = time.time() - self._connected_at
+		if elapsed <= 0:
+			return 0.0
+		return self._connected_bytes/elapsed
+
+	def _connect(self):
+		# Open the connection, read the header, send the current settings and
+		# start the reader thread, trying again a few times before giving up
+		# with an IOError.
+		error = None
+		for attempt in range(self.retries + 1):
+			if attempt > 0:
+				time.sleep(self.retry_delay)
+			try:
+				sock = socket.create_connection((self.host, self.port),
+					self.timeout)
+				sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+				header = bytearray(HEADER.size)
+				view = memoryview(header)
+				while len(view) > 0:
+					count = sock.recv_into(view)
+					if count == 0:
+						raise IOError('rtl_tcp server closed the connection.')
+					view = view[count:]
+			except (IOError, OSError) as e:
+				error = e
+				continue
+			magic, self.tuner_type, self.gain_count = HEADER.unpack(header)
+			if magic != MAGIC:
+				sock.close()
+				raise IOError('{0}:{1} is not an rtl_tcp server.'.format(self.host,
+					self.port))
+			with self._cond:
+				self._sock = sock
+				self._connected_at = time.time()
+				self._connected_bytes = 0
+				self._fresh = self._received
+			self.connects += 1
+			thread = threading.Thread(target=self._receive, args=(sock,),
+				name='RtlTcpReader')
+			thread.daemon = True
+			thread.start()
+			self._send(CMD_SET_SAMPLE_RATE, self.sample_rate)
+			self._send(CMD_SET_FREQ, self.center_freq)
+			self._send_gain()
+			if self._sock is not None:
+				return
+		raise IOError('Could not connect to rtl_tcp at {0}:{1}: {2}'.format(
+			self.host, self.port, error))
+
+	def _disconnect(self, sock=None):
+		# Close the connection (only if it is still sock, when provided).
+		with self._cond:
+			if self._sock is None or (sock is not None and self._sock is not sock):
+				return
+			# Shutdown first so a reader thread blocked in recv wakes up.
+			try:
+				self._sock.shutdown(socket.SHUT_RDWR)
+			except OSError:
+				pass
+			self._sock.close()
+			self._sock = None
+			self._connected_at = None
+			self._cond.notify_all()
+
+	def _receive(self, sock):
+		# Reader thread, receives into the ring until the connection is lost.
+		# Writes go just past the newest data, which reads never copy from as
+		# long as the ring holds a read plus RECV_SIZE bytes.
+		try:
+			while True:
+				with self._cond:
+					if self._sock is not sock:
+						break
+					ring = self._ring
+					position = self._received % len(ring)
+				end = min(len(ring), position + RECV_SIZE)
+				count = sock.recv_into(memoryview(ring)[position:end])
+				if count == 0:
+					break
+				with self._cond:
+					if self._ring is not ring:
+						# The ring grew while receiving, start again with it.
+						self._fresh = self._received
+						continue
+					self._received += count
+					self._connected_bytes += count
+					self.bytes_received += count
+					self._cond.notify_all()
+		except (IOError, OSError):
+			pass
+		self._disconnect(sock)
+
+	def _send(self, command, value):
+		# Settings are kept by the source, a command which can't be sent is
+		# sent again after reconnecting.  Data received before the command is
+		# not returned by reads.  The reader thread can close the connection at
+		# any time, so the socket is looked up once under the lock.
+		with self._cond:
+			sock = self._sock
+		if sock is None:
+			return
+		try:
+			sock.sendall(COMMAND.pack(command, int(value)))
+		except (IOError, OSError):
+			self._disconnect(sock)
+			return
+		with self._cond:
+			self._fresh = self._received
+
+	def _send_gain(self):
+		self._send(CMD_SET_GAIN_MODE, 1 if self.manual_gain else 0)
+		if self.manual_gain:
+			self._send(CMD_SET_GAIN, round(self.gain*10.0))
+
+	def set_center_freq(self, freq):
+		super(RtlTcpSource, self).set_center_freq(freq)
+		self._send(CMD_SET_FREQ, self.center_freq)
+
+	def set_sample_rate(self, rate):
+		super(RtlTcpSource, self).set_sample_rate(rate)
+		self._send(CMD_SET_SAMPLE_RATE, self.sample_rate)
+
+	def set_gain(self, gain):
+		super(RtlTcpSource, self).set_gain(gain)
+		self._send_gain()
+
+	def set_manual_gain_enabled(self, enabled):
+		super(RtlTcpSource, self).set_manual_gain_enabled(enabled)
+		self._send_gain()
+
+	def _take(self, num_bytes):
+		# Wait for num_bytes of new data and copy the newest num_bytes out of
+		# the ring, return None if the connection was lost or timed out.
+		with self._cond:
+			if len(self._ring) < num_bytes + RECV_SIZE:
+				self._ring = np.zeros(num_bytes + RECV_SIZE, dtype=np.uint8)
+				self._fresh = self._received
+			start = max(self._fresh, self._read_end)
+			if self._received - start < num_bytes:
+				self.underruns += 1
+				deadline = time.time() + self.timeout
+				while self._sock is not None and self._received - start < num_bytes:
+					remaining = deadline - time.time()
+					if remaining <= 0:
+						return None
+					self._cond.wait(remaining)
+					start = max(self._fresh, self._read_end)
+				if self._received - start < num_bytes:
+					return None
+			self.bytes_skipped += self._received - start - num_bytes
+			self._read_end = self._received
+			size = len(self._ring)
+			first = (self._received - num_bytes) % size
+			count = min(num_bytes, size - first)
+			self._buffer[:count] = self._ring[first:first + count]
+			self._buffer[count:num_bytes] = self._ring[:num_bytes - count]
+			return self._buffer[:num_bytes]
+
+	def read_bytes(self, num_bytes):
+		"""Return the newest num_bytes of raw I/Q data.  The array is a view of
+		the source's buffer and is overwritten by the next read.
+		"""
+		num_bytes &= ~1
+		if len(self._buffer) < num_bytes:
+			self._buffer = np.zeros(num_bytes, dtype=np.uint8)
+		for attempt in range(2):
+			if self._sock is None:
+				self._connect()
+			data = self._take(num_bytes)
+			if data is not None:
+				self.reads += 1
+				return data
+			# Reconnect once, the stream starts over with new samples.
+			self._disconnect()
+		raise IOError('Lost connection to rtl_tcp at {0}:{1}.'.format(
+			self.host, self.port))
+
+	def read_samples(self, num_samples):
+		return self._iq.convert(self.read_bytes(2*num_samples))
+
+	def close(self):
+		self._disconnect()
+
+
+class FakeRtlTcpServer(object):
+	"""Minimal rtl_tcp server for trying out and testing RtlTcpSource without
+	a tuner.  Streams the raw bytes of a sources.SyntheticSource (or any source
+	with read_bytes) to each client and applies the commands it receives to
+	that source.  Every command received is kept in the commands list as a
+	(command, value) tuple.
+	"""
+
+	def __init__(self, source=None, host='127.0.0.1', port=0,
+		chunk_size=65536, tuner_type=5, gain_count=29):
+		"""Create server on host and port (0 picks a free port, see the port
+		attribute) which sends chunk_size bytes at a time.  Call start() to
+		begin accepting clients.
+		"""
+		self.source = source if source is not None else sources.SyntheticSource()
+		self.chunk_size = chunk_size
+		self.tuner_type = tuner_type
+		self.gain_count = gain_count
+		self.commands = []
+		self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._listener.bind((host, port))
+		self._listener.listen(4)
+		self.host, self.port = self._listener.getsockname()
+		self._clients = []
+		self._lock = threading.Lock()
+		self._stop_event = threading.Event()
+		self._thread = None
+
+	def start(self):
+		self._thread = threading.Thread(target=self._accept,
+			name='FakeRtlTcpServer')
+		self._thread.daemon = True
+		self._thread.start()
+
+	def stop(self):
+		"""Stop accepting clients and disconnect the connected ones."""
+		self._stop_event.set()
+		try:
+			self._listener.shutdown(socket.SHUT_RDWR)
+		except OSError:
+			pass
+		self._listener.close()
+		self.drop_clients()
+		if self._thread is not None:
+			self._thread.join(1.0)
+
+	def drop_clients(self):
+		"""Close the connection to every client, to test reconnecting."""
+		with self._lock:
+			for client in self._clients:
+				try:
+					client.shutdown(socket.SHUT_RDWR)
+				except OSError:
+					pass
+			self._clients = []
+
+	def _accept(self):
+		while not self._stop_event.is_set():
+			try:
+				client, address = self._listener.accept()
+			except OSError:
+				break
+			with self._lock:
+				self._clients.append(client)
+			thread = threading.Thread(target=self._serve, args=(client,),
+				name='FakeRtlTcpClient')
+			thread.daemon = True
+			thread.start()
+
+	def _apply(self, command, value):
+		with self._lock:
+			self.commands.append((command, value))
+			if command == CMD_SET_FREQ:
+				self.source.set_center_freq(value)
+			elif command == CMD_SET_SAMPLE_RATE:
+				self.source.set_sample_rate(value)
+			elif command == CMD_SET_GAIN_MODE:
+				self.source.set_manual_gain_enabled(value == 1)
+			elif command == CMD_SET_GAIN:
+				self.source.set_gain(value/10.0)
+
+	def _serve(self, client):
+		pending = b''
+		try:
+			client.sendall(HEADER.pack(MAGIC, self.tuner_type, self.gain_count))
+			while not self._stop_event.is_set():
+				readable, writable, _ = select.select([client], [client], [], 0.1)
+				if readable:
+					data = client.recv(4096)
+					if not data:
+						break
+					pending += data
+					while len(pending) >= COMMAND.size:
+						self._apply(*COMMAND.unpack(pending[:COMMAND.size]))
+						pending = pending[COMMAND.size:]
+				if writable:
+					with self._lock:
+						chunk = self.source.read_bytes(self.chunk_size)
+					client.sendall(chunk)
+		except OSError:
+			pass
+		finally:
+			client.close()
@@ -0,0 +1,120 @@
+# FreqShow main loop frame scheduling.
+# Paces animated views to a target frame rate and lets static views sleep until
+# there is input, so the main loop doesn't spin a CPU core at 100%.
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import time
+
+import pygame
+
+
+# Events which never change what is drawn, waits ignore them.
+IGNORED_EVENTS = (pygame.MOUSEMOTION,)
+
+
+def wait_events(timeout):
+	"""Wait up to timeout seconds for input and return the list of pending
+	events (empty if the timeout elapsed).  Events in IGNORED_EVENTS don't end
+	the wait and aren't returned.
+	"""
+	end = time.time() + timeout
+	while True:
+		remaining = end - time.time()
+		if remaining <= 0:
+			return []
+		try:
+			event = pygame.event.wait(max(int(remaining*1000), 1))
+		except TypeError:
+			# Older pygame can't time out a wait, so sleep and then poll.
+			time.sleep(remaining)
+			return [event for event in pygame.event.get()
+				if event.type not in IGNORED_EVENTS]
+		if event.type == pygame.NOEVENT:
+			return []
+		if event.type not in IGNORED_EVENTS:
+			return [event] + [event for event in pygame.event.get()
+				if event.type not in IGNORED_EVENTS]
+
+
+def collect_events(until):
+	"""Wait until the time until (as returned by time.time()) and return the
+	list of events which arrived in the meantime.
+	"""
+	events = []
+	while True:
+		remaining = until - time.time()
+		if remaining <= 0:
+			return events
+		events.extend(wait_events(remaining))
+
+
+class FrameScheduler(object):
+	"""Decides when the main loop renders the next frame.  Animated views are
+	rendered at up to a target frame rate, and input which arrives while
+	waiting is handled with the next frame.  Static views only render again
+	after input, but never faster than the target frame rate however much
+	input arrives.  When a frame takes longer than its time slot the schedule
+	restarts from now instead of rendering late frames back to back, so slow
+	frames are dropped rather than building up latency.
+	"""
+
+	def __init__(self, fps=30, idle_timeout=1.0):
+		"""Create scheduler for the target frames per second.  Static views are
+		rendered again at least every idle_timeout seconds even without input.
+		"""
+		self.frame_time = 1.0/fps
+		self.idle_timeout = idle_timeout
+		self.next_frame = None
+		self.last_frame = None
+		self.frames_dropped = 0
+
+	def wait(self, animated):
+		"""Wait until the next frame should be rendered and return the list of
+		events which arrived in the meantime.  Animated is True if the current
+		view changes without input.
+		"""
+		if not animated:
+			# Nothing changes until there's input, so sleep until there is.  Then
+			# wait out the rest of the frame time, so a stream of input can't
+			# render more often than the target rate.
+			self.next_frame = None
+			events = wait_events(self.idle_timeout)
+			if events and self.last_frame is not None:
+				events.extend(collect_events(self.last_frame + self.frame_time))
+			self.last_frame = time.time()
+			return events
+		now = time.time()
+		if self.next_frame is None:
+			self.next_frame = now
+		elif now - self.next_frame > self.frame_time:
+			# The last frame overran by more than a slot, skip the frames it
+			# missed instead of rendering them back to back.
+			self.frames_dropped += int((now - self.next_frame)/self.frame_time)
+			self.next_frame = now
+		events = collect_events(self.next_frame)
+		self.next_frame += self.frame_time
+		self.last_frame = time.time()
+		return events + [event for event in pygame.event.get()
+			if event.type not in IGNORED_EVENTS]
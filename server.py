@@ -0,0 +1,494 @@
+# FreqShow spectrum server and client.
+# Publishes every spectrum over TCP so several displays can watch the same
+# tuner.  Spectra are quantized to one byte per column (see dsp.quantize_db)
+# and sent zlib compressed, either whole (keyframes) or as the difference from
+# the previous spectrum (deltas), which compresses much better since most of
+# the spectrum barely changes between frames.
+#
+# Run a headless server with (see --help for the tuner options):
+#   python server.py --port 8622
+# and show it on a display by setting REMOTE_SERVER in freqshow.py.
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import argparse
+import asyncio
+import socket
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import acquisition
+import dsp
+import perf
+
+
+DEFAULT_PORT = 8622
+
+# Every frame is a header followed by its zlib compressed payload.  Header
+# fields: magic, kind, width, sequence number, timestamp, start and stop
+# frequency in hertz, decibels of level 1 and decibels per level (see
+# dsp.quantize_db), and payload length.
+FRAME_MAGIC  = b'FQS1'
+FRAME_HEADER = struct.Struct('<4sB3xIQdddffI')
+FRAME_KEY    = 0	# Payload is the quantized spectrum.
+FRAME_DELTA  = 1	# Payload is the difference (modulo 256) from the last frame.
+
+
+class _Connection(object):
+	# State of one client, only used from the server's event loop.
+
+	def __init__(self, writer, queue_size):
+		self.writer = writer
+		self.queue = asyncio.Queue(queue_size)
+		# A delta can only be sent when the client got the frame before it.
+		self.needs_key = True
+		self.frames_dropped = 0
+		self.task = asyncio.current_task()
+
+
+class SpectrumServer(object):
+	"""Serves spectra to any number of TCP clients from an asyncio event loop on
+	a background thread.  Publishing never waits on the network: frames are
+	compressed on the event loop thread and queued for each client, and a
+	client whose queue is full (because its connection is slower than the
+	spectra) skips frames and gets a keyframe once it catches up.
+	"""
+
+	def __init__(self, host='', port=DEFAULT_PORT, db_min=-80.0, db_step=0.5,
+		queue_size=4, level=1):
+		"""Create server listening on host and port (0 picks a free port, see
+		the port attribute after start()).  Spectra are quantized into levels of
+		db_step decibels starting at db_min, up to queue_size frames are queued
+		for each client, and level is the zlib compression level.
+		"""
+		self.host = host
+		self.port = port
+		self.db_min = db_min
+		self.db_step = db_step
+		self.queue_size = queue_size
+		self.level = level
+		self.sequence = 0
+		self.frames_dropped = 0
+		self.bytes_sent = 0
+		self._connections = set()
+		self._loop = None
+		self._server = None
+		self._thread = None
+		self._previous = None
+		# Publishing threads share the quantizing scratch buffer.
+		self._lock = threading.Lock()
+		self._scratch = None
+
+	@property
+	def clients(self):
+		"""Number of connected clients."""
+		return len(self._connections)
+
+	def start(self):
+		"""Start listening for clients on a background thread."""
+		if self._thread is not None:
+			return
+		self._loop = asyncio.new_event_loop()
+		started = threading.Event()
+		errors = []
+		def run():
+			asyncio.set_event_loop(self._loop)
+			try:
+				self._server = self._loop.run_until_complete(
+					asyncio.start_server(self._serve, self.host, self.port))
+			except Exception as error:
+				errors.append(error)
+				started.set()
+				return
+			self.port = self._server.sockets[0].getsockname()[1]
+			started.set()
+			self._loop.run_forever()
+			self._loop.close()
+		self._thread = threading.Thread(target=run, name='FreqShowServer')
+		self._thread.daemon = True
+		self._thread.start()
+		started.wait()
+		if errors:
+			self._thread = None
+			raise errors[0]
+
+	def stop(self, timeout=1.0):
+		"""Disconnect all clients and stop listening."""
+		if self._thread is None:
+			return
+		try:
+			asyncio.run_coroutine_threadsafe(self._shutdown(),
+				self._loop).result(timeout)
+		finally:
+			self._loop.call_soon_threadsafe(self._loop.stop)
+			self._thread.join(timeout)
+			self._thread = None
+
+	async def _shutdown(self):
+		self._server.close()
+		tasks = [connection.task for connection in self._connections]
+		for connection in self._connections:
+			# Ask the client's task to finish after any frame it is sending.
+			while connection.queue.full():
+				connection.queue.get_nowait()
+			connection.queue.put_nowait(None)
+			connection.writer.close()
+		await asyncio.gather(*tasks, return_exceptions=True)
+		await self._server.wait_closed()
+
+	def publish(self, freqs, start_freq, stop_freq, timestamp=None):
+		"""Send a spectrum of intensities in decibels which covers start_freq to
+		stop_freq hertz to all clients.  Only takes the time to quantize the
+		spectrum, can be called from any thread.
+		"""
+		if self._thread is None:
+			return
+		levels = np.zeros(len(freqs), dtype=np.uint8)
+		with self._lock:
+			if self._scratch is None or len(self._scratch) != len(freqs):
+				self._scratch = np.zeros(len(freqs), dtype=np.float32)
+			dsp.quantize_db(freqs, self.db_min, self.db_step, levels,
+				self._scratch)
+		self._loop.call_soon_threadsafe(self._fan_out, levels,
+			(time.time() if timestamp is None else timestamp, start_freq,
+			stop_freq))
+
+	def _frame(self, kind, levels, info):
+		payload = zlib.compress(levels.tobytes(), self.level)
+		header = FRAME_HEADER.pack(FRAME_MAGIC, kind, len(levels), self.sequence,
+			info[0], info[1], info[2], self.db_min, self.db_step, len(payload))
+		return header + payload
+
+	def _fan_out(self, levels, info):
+		# Called on the event loop thread for every published spectrum.  Each
+		# kind of frame is only compressed if some client needs it.
+		start = perf.clock()
+		self.sequence += 1
+		previous = self._previous
+		if previous is not None and len(previous) != len(levels):
+			previous = None
+		key = None
+		delta = None
+		for connection in self._connections:
+			if connection.queue.full():
+				connection.frames_dropped += 1
+				connection.needs_key = True
+				self.frames_dropped += 1
+				continue
+			if connection.needs_key or previous is None:
+				if key is None:
+					key = self._frame(FRAME_KEY, levels, info)
+				frame = key
+			else:
+				if delta is None:
+					delta = self._frame(FRAME_DELTA, levels - previous, info)
+				frame = delta
+			connection.needs_key = False
+			connection.queue.put_nowait(frame)
+		self._previous = levels
+		perf.record('publish', start)
+
+	async def _serve(self, reader, writer):
+		# Send queued frames to one client until it disconnects.
+		sock = writer.get_extra_info('socket')
+		if sock is not None:
+			sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		connection = _Connection(writer, self.queue_size)
+		self._connections.add(connection)
+		try:
+			while True:
+				frame = await connection.queue.get()
+				if frame is None:
+					break
+				writer.write(frame)
+				await writer.drain()
+				self.bytes_sent += len(frame)
+		except (ConnectionError, OSError):
+			pass
+		finally:
+			self._connections.discard(connection)
+			writer.close()
+
+
+def _recv_into(sock, view):
+	# Fill the memoryview from the socket, raising IOError if it closes.
+	while len(view) > 0:
+		count = sock.recv_into(view)
+		if count == 0:
+			raise IOError('Spectrum server closed the connection.')
+		view = view[count:]
+
+
+class SpectrumClient(object):
+	"""Receives spectra from a SpectrumServer on a background thread,
+	reconnecting whenever the connection is lost.  The client provides the
+	tuner getters of a sample source and the spectrum interface of
+	acquisition.AcquisitionThread, like worker.SpectrumWorker, so the model can
+	show remote spectra in place of its own tuner.  The remote tuner can't be
+	changed, its setters raise IOError.
+	"""
+
+	def __init__(self, host, port=DEFAULT_PORT, width=None, ring_size=4,
+		timeout=5.0, reconnect_delay=1.0):
+		"""Connect to the server at host and port.  Spectra are resized to width
+		values (keeping the strongest value of merged columns) if the server
+		sends a different width, or kept as they are if width is None, which
+		then waits up to timeout seconds for the first spectrum to find its
+		width.  The newest ring_size spectra are buffered.
+		"""
+		self.host = host
+		self.port = port
+		self.timeout = timeout
+		self.reconnect_delay = reconnect_delay
+		self.connected = False
+		self.connects = 0
+		self.frames_received = 0
+		self.frames_missed = 0
+		self.bytes_received = 0
+		self.span = (0.0, 0.0)
+		self._levels = None
+		self._sequence = None
+		self._sock = None
+		self._edges = None
+		self._stop_event = threading.Event()
+		self._width_known = threading.Event()
+		self.consumer = None
+		self.width = width
+		self.ring = None
+		self._ring_size = ring_size
+		if width is not None:
+			self._make_ring(width)
+		self._thread = threading.Thread(target=self._run,
+			name='FreqShowClient')
+		self._thread.daemon = True
+		self._thread.start()
+		if width is None and not self._width_known.wait(timeout):
+			self.stop()
+			raise IOError('No spectrum from {0}:{1}.'.format(host, port))
+
+	def _make_ring(self, width):
+		self.width = width
+		self.ring = acquisition.SpectrumRing(self._ring_size, width)
+		self._freqs = np.zeros(width, dtype=np.float32)
+		self._width_known.set()
+
+	def _run(self):
+		while not self._stop_event.is_set():
+			try:
+				self._sock = socket.create_connection((self.host, self.port),
+					self.timeout)
+				self._sock.settimeout(None)
+				self.connected = True
+				self.connects += 1
+				self._receive(self._sock)
+			except (IOError, OSError, zlib.error):
+				pass
+			finally:
+				self.connected = False
+				if self._sock is not None:
+					self._sock.close()
+					self._sock = None
+			# The next connection starts with a keyframe.
+			self._levels = None
+			self._stop_event.wait(self.reconnect_delay)
+
+	def _receive(self, sock):
+		header = bytearray(FRAME_HEADER.size)
+		payload = bytearray(65536)
+		while not self._stop_event.is_set():
+			_recv_into(sock, memoryview(header))
+			magic, kind, width, sequence, timestamp, start_freq, stop_freq, \
+				db_min, db_step, length = FRAME_HEADER.unpack(header)
+			if magic != FRAME_MAGIC:
+				raise IOError('Not a FreqShow spectrum server.')
+			if len(payload) < length:
+				payload = bytearray(length)
+			_recv_into(sock, memoryview(payload)[:length])
+			self.bytes_received += FRAME_HEADER.size + length
+			levels = np.frombuffer(zlib.decompress(memoryview(payload)[:length]),
+				dtype=np.uint8)
+			if kind == FRAME_DELTA:
+				if self._levels is None or len(self._levels) != width:
+					continue
+				np.add(self._levels, levels, out=self._levels)
+			else:
+				self._levels = levels.copy()
+			if self._sequence is not None and sequence > self._sequence + 1:
+				self.frames_missed += sequence - self._sequence - 1
+			self._sequence = sequence
+			self.frames_received += 1
+			self.span = (start_freq, stop_freq)
+			if self.ring is None:
+				self._make_ring(width)
+			levels = self._levels
+			if width != self.width:
+				if self._edges is None or self._edges[1] != width:
+					self._edges = (dsp.pool_edges(width, self.width), width)
+				levels = dsp.pool_spectrum(levels, self._edges[0])
+			dsp.dequantize_db(levels, db_min, db_step, self._freqs)
+			self.ring.put(self._freqs, timestamp)
+			if self.consumer is not None:
+				self.consumer(self._freqs)
+
+	def stop(self, timeout=1.0):
+		"""Disconnect from the server and stop the background thread."""
+		self._stop_event.set()
+		sock = self._sock
+		if sock is not None:
+			try:
+				sock.shutdown(socket.SHUT_RDWR)
+			except OSError:
+				pass
+		self._thread.join(timeout)
+
+	def close(self):
+		self.stop()
+
+	def get_center_freq(self):
+		# The client's tuner covers the span of the remote spectra.
+		return (self.span[0] + self.span[1])/2.0
+
+	def set_center_freq(self, freq):
+		raise IOError('Remote spectra can not be retuned.')
+
+	def get_sample_rate(self):
+		return self.span[1] - self.span[0]
+
+	def set_sample_rate(self, rate):
+		raise IOError('Remote spectra can not be retuned.')
+
+	def get_gain(self):
+		return 0.0
+
+	def set_gain(self, gain):
+		raise IOError('Remote spectra can not be retuned.')
+
+	def set_manual_gain_enabled(self, enabled):
+		raise IOError('Remote spectra can not be retuned.')
+
+	def set_sweep(self, sweeper):
+		raise IOError('Remote spectra can not be swept.')
+
+	def set_decimator(self, decimator):
+		raise IOError('Remote spectra can not be zoomed.')
+
+	def set_consumer(self, consumer):
+		"""Pass every received spectrum to consumer, on the receiving thread."""
+		self.consumer = consumer
+
+	def configure(self, **kwargs):
+		raise IOError('Remote spectra can not be reconfigured.')
+
+	def latest(self):
+		"""Return the newest spectrum without blocking (or None if nothing has
+		been received yet).
+		"""
+		return self.ring.latest()
+
+	def next(self, timeout=None):
+		"""Return the oldest spectrum which hasn't been returned yet, waiting up
+		to timeout seconds for one (None if the timeout elapsed).
+		"""
+		return self.ring.next(timeout)
+
+	def has_new(self):
+		"""Return True if a spectrum newer than the last one returned by latest()
+		is available.
+		"""
+		return self.ring.write_seq != self.ring.read_seq
+
+	def wait(self, timeout=None):
+		"""Wait until the first spectrum has been received."""
+		return self.ring.wait(timeout)
+
+	@property
+	def sequence(self):
+		"""Sequence number of the newest spectrum returned by latest()."""
+		return self.ring.read_seq
+
+	@property
+	def frames_dropped(self):
+		"""Number of spectra skipped by the server or never read by the UI."""
+		return self.ring.frames_dropped + self.frames_missed
+
+	@property
+	def sweeps_per_second(self):
+		return 0.0
+
+	@property
+	def staleness(self):
+		"""Age in seconds of the spectrum last returned by latest()."""
+		return self.ring.staleness
+
+
+if __name__ == '__main__':
+	import core
+	import rtltcp
+	import sources
+	parser = argparse.ArgumentParser(description='FreqShow spectrum server.')
+	parser.add_argument('--host', default='',
+		help='address to listen on (default all)')
+	parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+		help='port to listen on (default {0})'.format(DEFAULT_PORT))
+	parser.add_argument('--width', type=int, default=1024,
+		help='values in each spectrum')
+	parser.add_argument('--freq', type=float, default=90.3,
+		help='center frequency in MHz')
+	parser.add_argument('--rate', type=float, default=2.4,
+		help='sample rate in MHz')
+	parser.add_argument('--gain', default='AUTO',
+		help='gain in dB or AUTO')
+	parser.add_argument('--fft-size', type=int, default=1024,
+		help='samples in each FFT')
+	parser.add_argument('--replay', metavar='FILE',
+		help='replay a cu8 recording instead of opening the RTL-SDR')
+	parser.add_argument('--rtl-tcp', metavar='HOST[:PORT]',
+		help='read samples from an rtl_tcp server instead of the RTL-SDR')
+	args = parser.parse_args()
+	factory = (sources.open_rtlsdr, (), {})
+	if args.rtl_tcp is not None:
+		host, _, port = args.rtl_tcp.partition(':')
+		factory = (rtltcp.RtlTcpSource, (host, int(port or rtltcp.DEFAULT_PORT)),
+			{})
+	elif args.replay is not None:
+		factory = (sources.FileSource, (args.replay,), dict(
+			sample_rate=args.rate*1000000.0, center_freq=args.freq*1000000.0))
+	spectra = core.SpectrumCore(args.width, source_factory=factory,
+		center_freq=args.freq, sample_rate=args.rate, gain=args.gain,
+		fft_size=args.fft_size)
+	server = SpectrumServer(args.host, args.port)
+	server.start()
+	print('Serving spectra on port {0}.'.format(server.port))
+	try:
+		for freqs in spectra.iter_spectra(copy=False):
+			low, high = spectra.get_span()
+			server.publish(freqs, low*1000000.0, high*1000000.0)
+	except KeyboardInterrupt:
+		pass
+	server.stop()
+	spectra.close()
@@ -0,0 +1,266 @@
+# FreqShow radio sample sources.
+# A sample source provides the parts of the pyrtlsdr RtlSdr interface which
+# FreqShow uses, so an RtlSdr object or any SampleSource subclass can feed the
+# model.
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import time
+
+import numpy as np
+
+import dsp
+
+
+# Recording formats understood by FileSource.
+FORMAT_CU8  = 'cu8'		# Interleaved unsigned byte I/Q, as sent by the tuner.
+FORMAT_CF32 = 'cf32'	# Interleaved 32-bit float I/Q (complex64).
+FORMATS = (FORMAT_CU8, FORMAT_CF32)
+
+# Pacing modes for sources which generate or replay samples.
+PACING_REALTIME = 'realtime'	# Serve samples at the recorded sample rate.
+PACING_FAST     = 'fast'		# Serve samples as fast as they are read.
+PACINGS = (PACING_REALTIME, PACING_FAST)
+
+
+def open_rtlsdr(*args, **kwargs):
+	"""Open an RTL-SDR dongle with pyrtlsdr.  The library is only imported when
+	a dongle is actually opened, so other sources work without it.
+	"""
+	from rtlsdr import RtlSdr
+	return RtlSdr(*args, **kwargs)
+
+
+class SampleSource(object):
+	"""Base class for a source of radio samples.  Subclasses must implement
+	read_samples, and should implement read_bytes if they can provide raw
+	unsigned byte I/Q data cheaply (set native_bytes to False otherwise).
+	Tuning values are in hertz like pyrtlsdr.
+	"""
+
+	native_bytes = True
+	pacing = PACING_FAST
+
+	def __init__(self, center_freq=100e6, sample_rate=2.4e6):
+		self.center_freq = float(center_freq)
+		self.sample_rate = float(sample_rate)
+		self.gain = 0.0
+		self.manual_gain = False
+		self._next_time = None
+
+	def get_center_freq(self):
+		return self.center_freq
+
+	def set_center_freq(self, freq):
+		self.center_freq = float(freq)
+
+	def get_sample_rate(self):
+		return self.sample_rate
+
+	def set_sample_rate(self, rate):
+		self.sample_rate = float(rate)
+
+	def get_gain(self):
+		return self.gain
+
+	def set_gain(self, gain):
+		self.gain = float(gain)
+		self.manual_gain = True
+
+	def set_manual_gain_enabled(self, enabled):
+		self.manual_gain = enabled
+
+	def read_samples(self, num_samples):
+		"""Return num_samples complex samples."""
+		raise NotImplementedError
+
+	def read_bytes(self, num_bytes):
+		"""Return num_bytes of raw interleaved unsigned byte I/Q data."""
+		raise NotImplementedError
+
+	def close(self):
+		pass
+
+	def _pace(self, num_samples):
+		# Sleep until the samples would have arrived from a real tuner.  If
+		# playback has fallen more than a second behind, start over from now
+		# instead of serving samples in a burst to catch up.
+		if self.pacing != PACING_REALTIME:
+			return
+		now = time.time()
+		if self._next_time is None or now - self._next_time > 1.0:
+			self._next_time = now
+		self._next_time += num_samples/self.sample_rate
+		delay = self._next_time - now
+		if delay > 0:
+			time.sleep(delay)
+
+
+class FileSource(SampleSource):
+	"""Replays raw I/Q recordings.  The file is memory-mapped and reads are
+	served as views straight into the mapping whenever they don't wrap around
+	the end of a segment, so playback doesn't copy or load the recording.
+
+	A recording can contain several segments captured at different center
+	frequencies (for example a sweep of a band).  Retuning selects the segment
+	whose center frequency is closest, and reads loop within that segment.
+	"""
+
+	def __init__(self, path, format=FORMAT_CU8, sample_rate=2.4e6,
+		center_freq=100e6, segments=None, pacing=PACING_REALTIME, loop=True):
+		"""Open the recording at path in the provided format (FORMAT_CU8 or
+		FORMAT_CF32) which was captured at sample_rate hertz.  Segments is an
+		optional list of (center frequency in hertz, first sample, number of
+		samples) tuples, by default the whole file is one segment recorded at
+		center_freq.  Pacing is PACING_REALTIME to serve samples no faster than
+		the sample rate or PACING_FAST to serve them as fast as possible.  If
+		loop is False reading past the end of a segment raises IOError.
+		"""
+		super(FileSource, self).__init__(center_freq, sample_rate)
+		if format not in FORMATS:
+			raise ValueError('Unknown recording format: {0}'.format(format))
+		if pacing not in PACINGS:
+			raise ValueError('Unknown pacing: {0}'.format(pacing))
+		self.path = path
+		self.format = format
+		self.pacing = pacing
+		self.loop = loop
+		self.native_bytes = format == FORMAT_CU8
+		self.data = np.memmap(path, mode='r',
+			dtype=np.uint8 if format == FORMAT_CU8 else np.complex64)
+		# Number of array elements per sample.
+		self._width = 2 if format == FORMAT_CU8 else 1
+		total = len(self.data)//self._width
+		if segments is None:
+			segments = [(center_freq, 0, total)]
+		self.segments = [(float(f), int(s), min(int(n), total - int(s)))
+			for f, s, n in segments]
+		self._iq = dsp.IQConverter()
+		self._select(0)
+
+	def _select(self, index):
+		self.center_freq, self._start, self._length = self.segments[index]
+		self.position = 0
+
+	def set_center_freq(self, freq):
+		"""Select the recorded segment closest to the provided frequency."""
+		distances = [abs(f - freq) for f, s, n in self.segments]
+		index = distances.index(min(distances))
+		if len(self.segments) == 1 and distances[0] > 0:
+			raise IOError('Recording only has a segment at {0} Hz.'.format(
+				self.segments[0][0]))
+		self._select(index)
+
+	def set_sample_rate(self, rate):
+		if rate != self.sample_rate:
+			raise IOError('Recording sample rate is fixed at {0} Hz.'.format(
+				self.sample_rate))
+
+	def _read(self, num_samples):
+		# Return num_samples worth of elements from the current segment.
+		if num_samples > self._length and not self.loop:
+			raise IOError('Segment is shorter than the requested samples.')
+		start = self._start + self.position
+		remaining = self._length - self.position
+		w = self._width
+		if num_samples <= remaining:
+			# Common case, a view into the memory map.
+			self.position += num_samples
+			if self.position == self._length and self.loop:
+				self.position = 0
+			result = self.data[start*w:(start + num_samples)*w]
+		elif not self.loop:
+			raise IOError('End of recording.')
+		else:
+			# Read wraps around the end of the segment, stitch it together.
+			index = (self.position + np.arange(num_samples)) % self._length
+			self.position = (self.position + num_samples) % self._length
+			samples = self.data[self._start*w:(self._start + self._length)*w]
+			if w == 2:
+				samples = samples.reshape(-1, 2)
+			result = samples[index].reshape(-1)
+		self._pace(num_samples)
+		return result
+
+	def read_bytes(self, num_bytes):
+		if self.format != FORMAT_CU8:
+			raise IOError('Raw bytes are only available from cu8 recordings.')
+		return self._read(num_bytes//2)
+
+	def read_samples(self, num_samples):
+		data = self._read(num_samples)
+		if self.format == FORMAT_CU8:
+			return self._iq.convert(data)
+		return data
+
+	def close(self):
+		self.data = None
+
+
+class SyntheticSource(SampleSource):
+	"""Generates I/Q data with a few tones in noise, for running FreqShow and
+	its benchmarks without a tuner.  One block of raw bytes is generated up
+	front and reads cycle through it, so producing samples costs about as much
+	as receiving them from a real tuner.
+	"""
+
+	def __init__(self, center_freq=100e6, sample_rate=2.4e6,
+		tones=((-600e3, 0.3), (150e3, 0.1), (700e3, 0.02)), noise=0.05,
+		block_size=262144, pacing=PACING_FAST, seed=0):
+		"""Create source with the provided list of (offset from center in hertz,
+		amplitude) tones in Gaussian noise of the provided amplitude (full scale
+		is 1.0).  Block_size is the number of samples generated up front and
+		pacing is PACING_FAST or PACING_REALTIME.
+		"""
+		super(SyntheticSource, self).__init__(center_freq, sample_rate)
+		if pacing not in PACINGS:
+			raise ValueError('Unknown pacing: {0}'.format(pacing))
+		self.pacing = pacing
+		random = np.random.RandomState(seed)
+		t = np.arange(block_size)/float(sample_rate)
+		iq = noise*(random.standard_normal(block_size) +
+			1j*random.standard_normal(block_size))
+		for offset, amplitude in tones:
+			iq += amplitude*np.exp(2j*np.pi*offset*t)
+		raw = np.empty(2*block_size)
+		raw[0::2] = iq.real
+		raw[1::2] = iq.imag
+		self.block = np.clip(np.round(raw*127.5 + 127.5), 0, 255).astype(np.uint8)
+		self.position = 0
+		self._iq = dsp.IQConverter()
+
+	def read_bytes(self, num_bytes):
+		num_bytes &= ~1
+		size = len(self.block)
+		if self.position + num_bytes <= size:
+			result = self.block[self.position:self.position + num_bytes]
+		else:
+			result = np.take(self.block, np.arange(self.position,
+				self.position + num_bytes), mode='wrap')
+		self.position = (self.position + num_bytes) % size
+		self._pace(num_bytes//2)
+		return result
+
+	def read_samples(self, num_samples):
+		return self._iq.convert(self.read_bytes(2*num_samples))
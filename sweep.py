@@ -0,0 +1,170 @@
+# FreqShow wideband sweep.
+# Steps the tuner across a span wider than its sample rate and stitches the
+# spectrum of each step into one panorama.
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import math
+import queue
+import threading
+import time
+
+import numpy as np
+
+import acquisition
+import dsp
+import perf
+
+
+class Sweeper(object):
+	"""Sweeps the tuner across a span in steps and returns one spectrum of the
+	whole span per sweep.  Only the middle usable fraction of each step's FFT
+	bins is kept, since the edges of the tuner's passband roll off, and steps
+	are spaced so the kept parts meet.  The span is widened symmetrically to a
+	whole number of steps.
+
+	After each step is read the tuner is retuned to the next step on another
+	thread while the FFT of the samples is computed, so retuning and settling
+	overlap with the DSP instead of waiting for it.  The first settle_samples
+	read after a retune are thrown away since they can hold samples from
+	before the retune.
+	"""
+
+	def __init__(self, start_freq, stop_freq, sample_rate, width, usable=0.75,
+		settle_samples=16384):
+		"""Create sweep from start_freq to stop_freq hertz with the tuner at
+		sample_rate hertz, producing spectra of width values.
+		"""
+		if stop_freq <= start_freq:
+			raise ValueError('Sweep stop frequency must be above its start.')
+		if not 0.0 < usable <= 1.0:
+			raise ValueError('Usable fraction must be above 0 and up to 1.')
+		self.requested = (float(start_freq), float(stop_freq))
+		self.sample_rate = float(sample_rate)
+		self.width = width
+		self.usable = usable
+		self.settle_samples = settle_samples
+		self.step = self.sample_rate*usable
+		self.steps = max(1, int(math.ceil((stop_freq - start_freq)/self.step)))
+		center = (start_freq + stop_freq)/2.0
+		self.start_freq = center - self.steps*self.step/2.0
+		self.stop_freq = self.start_freq + self.steps*self.step
+		self.centers = self.start_freq + self.step*(np.arange(self.steps) + 0.5)
+		self.sweeps = 0
+		self.sweep_times = perf.StageRing(perf.history)
+		self._power = None
+		self._edges = None
+		self._samples = None
+		self._tuned = None
+		self._last_sweep = None
+
+	@property
+	def sweeps_per_second(self):
+		"""Average number of complete sweeps per second over recent sweeps."""
+		return perf.rate(self.sweep_times)
+
+	def _tune(self, source, index, converter, raw_reads):
+		# Tune to a step and throw away the samples from before the retune.
+		if self._tuned != index:
+			self._tuned = None
+			source.set_center_freq(self.centers[index])
+			if self.settle_samples > 0:
+				acquisition.read_samples(source, self.settle_samples, converter,
+					raw_reads)
+			self._tuned = index
+
+	def _tuner(self, source, converter, raw_reads, requests, replies):
+		# Tune to every step index requested until None is, replying with None or
+		# the error tuning raised.
+		while True:
+			index = requests.get()
+			if index is None:
+				return
+			try:
+				self._tune(source, index, converter, raw_reads)
+			except Exception as error:
+				replies.put(error)
+			else:
+				replies.put(None)
+
+	def read(self, source, engine, converter, min_samples=0, raw_reads=True):
+		"""Sweep the source across the span once and return width intensities in
+		decibels covering start_freq to stop_freq.  Takes the same parameters as
+		acquisition.read_spectrum.
+		"""
+		start = perf.clock()
+		size = engine.fft_size
+		keep = max(1, int(round(size*self.usable)))
+		trim = (size - keep)//2
+		if self._power is None or len(self._power) != self.steps*keep:
+			self._power = np.zeros(self.steps*keep, dtype=np.float32)
+			self._edges = dsp.pool_edges(len(self._power), self.width)
+		count = max(min_samples, engine.samples_needed())
+		count = -(-count//256)*256
+		self._tune(source, 0, converter, raw_reads)
+		tuner = None
+		if self.steps > 1:
+			requests = queue.Queue()
+			replies = queue.Queue()
+			tuner = threading.Thread(target=self._tuner,
+				args=(source, converter, raw_reads, requests, replies))
+			tuner.daemon = True
+			tuner.start()
+		try:
+			for i in range(self.steps):
+				samples = acquisition.read_samples(source, count, converter,
+					raw_reads)
+				if tuner is not None:
+					# Copy the samples out of the converter's buffer, which the
+					# settle read reuses, and retune to the next step (the first one
+					# after the last) while their FFT is computed.
+					if self._samples is None or len(self._samples) != len(samples):
+						self._samples = np.zeros(len(samples), dtype=np.complex64)
+					np.copyto(self._samples, samples)
+					samples = self._samples
+					requests.put((i + 1) % self.steps)
+				dsp_start = perf.clock()
+				power = engine.compute_power(samples)
+				self._power[i*keep:(i + 1)*keep] = power[trim:trim + keep]
+				perf.record('dsp', dsp_start)
+				if tuner is not None:
+					error = replies.get()
+					if error is not None:
+						raise error
+		finally:
+			if tuner is not None:
+				requests.put(None)
+				tuner.join()
+		freqs = dsp.pool_spectrum(self._power, self._edges, engine.pooling,
+			engine.peak_ratio)
+		np.log10(freqs, out=freqs)
+		np.multiply(freqs, 10.0, out=freqs)
+		now = time.time()
+		if self._last_sweep is not None:
+			self.sweep_times.add(now - self._last_sweep)
+		self._last_sweep = now
+		self.sweeps += 1
+		perf.record('sweep', start)
+		perf.tick('sweeps')
+		return freqs
@@ -0,0 +1,6 @@
+# FreqShow's modules live in the root of the repository, make them importable
+# when the tests are run from anywhere.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
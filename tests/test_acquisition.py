@@ -0,0 +1,74 @@
+# Tests for the spectrum rings which buffer spectra between threads and
+# processes.
+import unittest
+
+import numpy as np
+
+import acquisition
+import worker
+
+
+class RingTestMixin(object):
+
+	def make_ring(self, size, width):
+		raise NotImplementedError
+
+	def fill(self, ring, count):
+		for i in range(count):
+			ring.put(np.full(ring.width, i + 1, dtype=np.float32))
+
+	def test_buffers_size_frames(self):
+		for size in [1, 2, 4]:
+			ring = self.make_ring(size, 8)
+			self.fill(ring, 10)
+			values = []
+			for i in range(size):
+				frame = ring.next(0)
+				self.assertIsNotNone(frame)
+				values.append(frame[0])
+			self.assertEqual(values, list(range(11 - size, 11)))
+			self.assertEqual(ring.frames_dropped, 10 - size)
+			self.assertIsNone(ring.next(0))
+
+	def test_reads_in_order(self):
+		ring = self.make_ring(4, 8)
+		for i in range(3):
+			self.fill(ring, 1)
+			self.assertEqual(ring.next(0)[0], 1)
+		self.assertEqual(ring.frames_dropped, 0)
+
+	def test_latest(self):
+		ring = self.make_ring(2, 8)
+		self.assertIsNone(ring.latest())
+		self.fill(ring, 5)
+		self.assertEqual(ring.latest()[0], 5)
+		self.assertEqual(ring.frames_dropped, 4)
+
+
+class SpectrumRingTest(RingTestMixin, unittest.TestCase):
+
+	def make_ring(self, size, width):
+		return acquisition.SpectrumRing(size, width)
+
+
+class SharedSpectrumRingTest(RingTestMixin, unittest.TestCase):
+
+	def make_ring(self, size, width):
+		ring = worker.SharedSpectrumRing(size, width)
+		self.addCleanup(ring.close)
+		return ring
+
+	def test_reader(self):
+		ring = self.make_ring(4, 8)
+		reader = ring.reader()
+		self.fill(ring, 3)
+		self.assertEqual(ring.latest()[0], 3)
+		# The second reader has a read position of its own.
+		self.assertEqual([reader.next(0)[0] for i in range(3)], [1, 2, 3])
+		self.assertIsNone(reader.next(0))
+		self.assertEqual(ring.read_seq, 3)
+		del reader
+
+
+if __name__ == '__main__':
+	unittest.main()
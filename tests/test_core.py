@@ -0,0 +1,87 @@
+# Tests for the headless spectrum core, run against a synthetic source.
+import threading
+import unittest
+
+import numpy as np
+
+import core
+import sources
+
+
+class SpectrumCoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.source = sources.SyntheticSource()
+		self.core = core.SpectrumCore(320, source=self.source,
+			center_freq=100.0, sample_rate=2.4)
+
+	def tearDown(self):
+		self.core.close()
+
+	def test_iter_spectra(self):
+		for buffer in [0, 1, 4]:
+			spectra = list(self.core.iter_spectra(count=5, buffer=buffer))
+			self.assertEqual(len(spectra), 5)
+			self.assertEqual(spectra[0].shape, (320,))
+			self.assertIsNone(self.core.acquisition)
+
+	def test_zoom(self):
+		# The strongest synthetic tone is 600 kHz below the center.
+		self.core.set_zoom(4, -0.6)
+		low, high = self.core.get_span()
+		self.assertAlmostEqual(low, 99.1)
+		self.assertAlmostEqual(high, 99.7)
+		freqs = next(self.core.iter_spectra(count=1))
+		self.assertLessEqual(abs(int(np.argmax(freqs)) - 160), 1)
+		self.core.set_zoom(1)
+		self.assertEqual(self.core.get_zoom(), (1, 0.0))
+
+	def test_zoom_ends_sweep_at_its_center(self):
+		self.core.set_sweep(95.0, 105.0)
+		next(self.core.iter_spectra(count=1))
+		self.core.set_zoom(4, 100.1 - self.core.get_center_freq())
+		self.assertIsNone(self.core.sweep)
+		self.assertEqual(self.source.get_center_freq(), 100e6)
+		low, high = self.core.get_span()
+		self.assertAlmostEqual(low, 99.8)
+		self.assertAlmostEqual(high, 100.4)
+
+
+class ConsumerTest(unittest.TestCase):
+
+	def consume(self, spectra):
+		# Count the spectra passed to a consumer while nothing reads them.
+		received = []
+		done = threading.Event()
+		def consumer(freqs, start_freq, stop_freq):
+			received.append((len(freqs), start_freq, stop_freq))
+			if len(received) >= 5:
+				done.set()
+		spectra.add_consumer(consumer)
+		spectra.start_acquisition()
+		self.assertTrue(done.wait(5.0))
+		spectra.close()
+		self.assertEqual(received[0], (320, 98.8e6, 101.2e6))
+
+	def test_acquisition_thread(self):
+		self.consume(core.SpectrumCore(320, source=sources.SyntheticSource(),
+			center_freq=100.0, sample_rate=2.4))
+
+	def test_dsp_process(self):
+		self.consume(core.SpectrumCore(320,
+			source_factory=(sources.SyntheticSource, (), {}), center_freq=100.0,
+			sample_rate=2.4, dsp_process=True))
+
+	def test_synchronous_reads(self):
+		spectra = core.SpectrumCore(320, source=sources.SyntheticSource(),
+			center_freq=100.0, sample_rate=2.4)
+		received = []
+		spectra.add_consumer(lambda *args: received.append(args[1:]))
+		list(spectra.iter_spectra(count=2, buffer=0))
+		spectra.get_spectrum()
+		spectra.close()
+		self.assertEqual(received, [(98.8e6, 101.2e6)]*3)
+
+
+if __name__ == '__main__':
+	unittest.main()
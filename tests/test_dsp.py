@@ -0,0 +1,244 @@
+# Tests for the signal processing functions.
+import tracemalloc
+import unittest
+
+import numpy as np
+
+import dsp
+
+
+def traced_memory(func):
+	"""Call func once and return the (retained, peak) bytes it allocated."""
+	tracemalloc.start()
+	try:
+		func()
+		return tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+
+
+def noise(count, seed=0):
+	random = np.random.RandomState(seed)
+	return (random.standard_normal(count) +
+		1j*random.standard_normal(count)).astype(np.complex64)
+
+
+class SpectrumEngineTest(unittest.TestCase):
+
+	def test_matches_functions(self):
+		for pooling in dsp.POOL_METHODS:
+			engine = dsp.SpectrumEngine(320, fft_size=1024, segments=4,
+				pooling=pooling)
+			samples = noise(engine.samples_needed())
+			power = dsp.welch_power(samples, 1024, 4)
+			power = dsp.remove_dc(np.fft.fftshift(power))
+			expected = 10.0*np.log10(dsp.pool_spectrum(power,
+				dsp.pool_edges(1024, 320), pooling))
+			np.testing.assert_allclose(engine.compute(samples), expected,
+				atol=1e-3)
+
+	def test_compute_only_allocates_fft_scratch(self):
+		engine = dsp.SpectrumEngine(320, fft_size=1024, segments=4)
+		samples = noise(engine.samples_needed())
+		engine.compute(samples)
+		buffers = engine.buffer_allocations
+		windowed, spectrum = engine._windowed, engine._spectrum
+		fft_retained, fft_peak = traced_memory(
+			lambda: np.fft.fft(windowed, axis=1, out=spectrum))
+		retained, peak = traced_memory(lambda: engine.compute(samples))
+		self.assertEqual(engine.buffer_allocations, buffers)
+		self.assertLess(retained, 1024)
+		# Anything beyond the FFT's own scratch space is a few small objects.
+		self.assertLess(peak, fft_peak + 4096)
+
+	def test_rebuilds_only_on_shape_change(self):
+		engine = dsp.SpectrumEngine(320, fft_size=1024, segments=4)
+		buffers = engine.buffer_allocations
+		engine.configure(window='blackman', pooling=dsp.POOL_MAX)
+		self.assertEqual(engine.buffer_allocations, buffers)
+		engine.configure(fft_size=2048)
+		self.assertGreater(engine.buffer_allocations, buffers)
+
+
+class DecimatorTest(unittest.TestCase):
+
+	def reference(self, decimator, samples):
+		# Mix and filter every output directly with the taps.
+		taps = decimator.taps
+		count = (len(samples) - len(taps))//decimator.factor + 1
+		length = (count - 1)*decimator.factor + len(taps)
+		mixer = np.exp(-2j*np.pi*decimator.offset/decimator.sample_rate*
+			np.arange(length))
+		mixed = samples[:length]*mixer
+		return np.array([np.dot(mixed[k*decimator.factor:
+			k*decimator.factor + len(taps)], taps) for k in range(count)])
+
+	def test_matches_direct_filter(self):
+		for factor in [1, 2, 3, 8, 32]:
+			decimator = dsp.Decimator(factor, 150e3, 2.4e6)
+			samples = noise(decimator.samples_needed(500))
+			result = decimator.process(samples)
+			self.assertEqual(len(result), 500)
+			np.testing.assert_allclose(result,
+				self.reference(decimator, samples), atol=1e-5)
+
+	def test_process_doesnt_allocate(self):
+		decimator = dsp.Decimator(32, 150e3, 2.4e6)
+		samples = noise(decimator.samples_needed(2560))
+		decimator.process(samples)
+		retained, peak = traced_memory(lambda: decimator.process(samples))
+		self.assertLess(peak, 4096)
+
+
+class RangeEstimatorTest(unittest.TestCase):
+
+	def test_first_spectrum_sets_percentiles(self):
+		estimator = dsp.RangeEstimator(low_percentile=5.0, high_percentile=100.0)
+		values = np.linspace(-100.0, -20.0, 101).astype(np.float32)
+		np.random.RandomState(0).shuffle(values)
+		low, high = estimator.update(values)
+		self.assertAlmostEqual(low, -96.0, places=4)
+		self.assertAlmostEqual(high, -20.0, places=4)
+
+	def test_attack_and_decay_converge(self):
+		estimator = dsp.RangeEstimator(low_percentile=0.0, attack=0.5,
+			decay=0.02)
+		steady = np.array([-90.0, -60.0, -30.0], dtype=np.float32)
+		spike = np.array([-90.0, -60.0, -10.0], dtype=np.float32)
+		estimator.update(steady)
+		# Widening moves attack of the way to the new value at once.
+		low, high = estimator.update(spike)
+		self.assertAlmostEqual(high, -20.0, places=4)
+		low, high = estimator.update(spike)
+		self.assertAlmostEqual(high, -15.0, places=4)
+		# Narrowing only moves decay of the way per spectrum but gets there.
+		low, high = estimator.update(steady)
+		self.assertAlmostEqual(high, -15.3, places=4)
+		for i in range(400):
+			low, high = estimator.update(steady)
+		self.assertAlmostEqual(low, -90.0, places=3)
+		self.assertAlmostEqual(high, -30.0, places=2)
+		# A quieter low end is followed quickly, a louder one slowly.
+		low, high = estimator.update(np.array([-100.0, -60.0, -30.0],
+			dtype=np.float32))
+		self.assertAlmostEqual(low, -95.0, places=3)
+		low, high = estimator.update(steady)
+		self.assertAlmostEqual(low, -94.9, places=3)
+
+	def test_min_range(self):
+		estimator = dsp.RangeEstimator(min_range=10.0)
+		low, high = estimator.update(np.full(64, -50.0, dtype=np.float32))
+		self.assertEqual((low, high), (-50.0, -40.0))
+
+	def test_reset(self):
+		estimator = dsp.RangeEstimator(low_percentile=0.0)
+		estimator.update(np.array([-90.0, -10.0], dtype=np.float32))
+		estimator.reset()
+		self.assertIsNone(estimator.low)
+		self.assertIsNone(estimator.high)
+		# The next spectrum sets the range directly instead of decaying to it.
+		low, high = estimator.update(np.array([-70.0, -40.0], dtype=np.float32))
+		self.assertEqual((low, high), (-70.0, -40.0))
+
+
+class FindPeaksTest(unittest.TestCase):
+
+	def spectrum(self, peaks, floor=-80.0, count=512):
+		values = np.full(count, floor, dtype=np.float32)
+		for index, level in peaks.items():
+			values[index] = level
+		return values
+
+	def test_prominence(self):
+		values = self.spectrum({100: -50.0, 200: -75.0, 300: -60.0, 400: -69.0})
+		self.assertEqual(dsp.find_peaks(values).tolist(), [100, 300, 400])
+		self.assertEqual(dsp.find_peaks(values, prominence=15.0).tolist(),
+			[100, 300])
+		# An explicit noise floor replaces the median of the spectrum.
+		self.assertEqual(dsp.find_peaks(values, noise_floor=-65.0).tolist(),
+			[100])
+
+	def test_max_peaks_keeps_strongest_first(self):
+		values = self.spectrum({50: -60.0, 150: -40.0, 250: -55.0, 350: -45.0})
+		self.assertEqual(dsp.find_peaks(values).tolist(), [150, 350, 250, 50])
+		self.assertEqual(dsp.find_peaks(values, max_peaks=2).tolist(),
+			[150, 350])
+		self.assertEqual(dsp.find_peaks(values, max_peaks=1).tolist(), [150])
+
+	def test_radius(self):
+		# Only the highest peak within radius bins counts, and only the first
+		# bin of a flat top.
+		values = self.spectrum({100: -55.0, 103: -50.0, 200: -50.0, 201: -50.0})
+		self.assertEqual(sorted(dsp.find_peaks(values, radius=4).tolist()),
+			[103, 200])
+		self.assertEqual(sorted(dsp.find_peaks(values, radius=2).tolist()),
+			[100, 103, 200])
+
+	def test_double_precision(self):
+		# Sweeps produce float64 spectra, whose peaks mustn't be lost to
+		# rounding in the window maximum.
+		values = self.spectrum({100: -50.0, 300: -60.0}).astype(np.float64)
+		values[100] -= 1e-6
+		values[300] -= 1.3e-6
+		self.assertEqual(dsp.find_peaks(values).tolist(), [100, 300])
+
+	def test_edges_and_empty(self):
+		values = self.spectrum({0: -50.0, 511: -40.0})
+		self.assertEqual(dsp.find_peaks(values).tolist(), [511, 0])
+		self.assertEqual(len(dsp.find_peaks(np.zeros(0, dtype=np.float32))), 0)
+
+
+class PeakTrackerTest(unittest.TestCase):
+
+	def spectrum(self, peaks, floor=-80.0, count=512):
+		values = np.full(count, floor, dtype=np.float32)
+		for index, level in peaks.items():
+			values[index] = level
+		return values
+
+	def shown(self, tracker, peaks):
+		return [t.index for t in tracker.update(self.spectrum(peaks))]
+
+	def test_confirm_hold_release(self):
+		tracker = dsp.PeakTracker(prominence=10.0, release=6.0, confirm=3,
+			hold=2)
+		# A new peak is only shown once it has been found in confirm spectra.
+		self.assertEqual(self.shown(tracker, {100: -50.0}), [])
+		self.assertEqual(self.shown(tracker, {100: -50.0}), [])
+		self.assertEqual(self.shown(tracker, {100: -50.0}), [100])
+		# A shown peak stays while above the release level and follows small
+		# moves within the tolerance.
+		self.assertEqual(self.shown(tracker, {101: -72.0}), [101])
+		self.assertEqual(self.shown(tracker, {99: -73.0}), [99])
+		# Once it drops below the release level it is held for hold spectra.
+		self.assertEqual(self.shown(tracker, {99: -76.0}), [99])
+		self.assertEqual(self.shown(tracker, {}), [99])
+		self.assertEqual(self.shown(tracker, {}), [])
+		self.assertEqual(tracker.tracks, [])
+
+	def test_weak_peaks_never_start(self):
+		# A peak between the release and prominence levels never starts a
+		# track however long it lasts.
+		tracker = dsp.PeakTracker(prominence=10.0, release=6.0, confirm=2)
+		for i in range(5):
+			self.assertEqual(self.shown(tracker, {300: -72.0}), [])
+
+	def test_unconfirmed_peaks_are_forgotten(self):
+		tracker = dsp.PeakTracker(confirm=3, hold=5)
+		self.shown(tracker, {100: -50.0})
+		self.shown(tracker, {100: -50.0})
+		self.assertEqual(self.shown(tracker, {}), [])
+		self.assertEqual(tracker.tracks, [])
+		# It has to be confirmed from scratch when it comes back.
+		self.assertEqual(self.shown(tracker, {100: -50.0}), [])
+
+	def test_max_peaks_strongest_first(self):
+		tracker = dsp.PeakTracker(max_peaks=2, confirm=1)
+		peaks = {50: -60.0, 150: -40.0, 250: -55.0}
+		self.assertEqual(self.shown(tracker, peaks), [150, 250])
+		tracker.reset()
+		self.assertEqual(tracker.tracks, [])
+
+
+if __name__ == '__main__':
+	unittest.main()
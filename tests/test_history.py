@@ -0,0 +1,203 @@
+# Tests for the on-disk spectrum history.
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import history
+
+
+class RowFileTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'rows')
+		self.rows = history.RowFile(self.path, np.uint8, (4,), chunk=8)
+		self.maps = 0
+		read = np.memmap
+		def counting_memmap(*args, **kwargs):
+			self.maps += 1
+			return read(*args, **kwargs)
+		history.np.memmap = counting_memmap
+		self.addCleanup(setattr, history.np, 'memmap', read)
+
+	def tearDown(self):
+		self.rows.close()
+		shutil.rmtree(self.directory)
+
+	def append(self, count):
+		for i in range(count):
+			self.rows.append(np.full(4, len(self.rows) % 256, dtype=np.uint8))
+
+	def check(self, start, stop):
+		rows = self.rows.read(start, stop)
+		self.assertEqual(rows[:, 0].tolist(), list(range(start, stop)))
+		self.assertFalse(rows.flags.writeable)
+
+	def test_remaps_per_chunk(self):
+		self.append(20)
+		self.check(10, 20)
+		self.assertEqual(self.maps, 1)
+		# Reading the newest rows every frame while rows are appended only maps
+		# the file again once a chunk of rows was appended.
+		for i in range(8):
+			self.append(1)
+			self.check(12 + i, 21 + i)
+		self.assertEqual(self.maps, 1)
+		self.append(1)
+		self.check(20, 29)
+		self.assertEqual(self.maps, 2)
+
+	def test_reopen(self):
+		self.append(5)
+		self.rows.close()
+		with open(self.path, 'ab') as f:
+			# A partly written record.
+			f.write(b'\x05\x05')
+		self.rows = history.RowFile(self.path, np.uint8, (4,))
+		self.assertEqual(len(self.rows), 5)
+		self.append(2)
+		self.check(0, 7)
+		self.assertEqual(os.path.getsize(self.path), 28)
+
+	def test_keep(self):
+		self.append(10)
+		self.check(0, 10)
+		self.rows.keep(6)
+		self.assertEqual(len(self.rows), 6)
+		self.check(0, 6)
+		self.assertEqual(os.path.getsize(self.path), 24)
+
+
+class RingFileTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'ring')
+		self.rows = self.open()
+
+	def tearDown(self):
+		self.rows.close()
+		shutil.rmtree(self.directory)
+
+	def open(self, capacity=20):
+		return history.RingFile(self.path, np.uint8, (4,), capacity, chunk=8)
+
+	def append(self, count):
+		for i in range(count):
+			total = self.rows.first + len(self.rows)
+			self.rows.append(np.full(4, total % 256, dtype=np.uint8))
+
+	def values(self, start, stop):
+		rows = self.rows.read(start, stop)
+		self.assertFalse(rows.flags.writeable)
+		return rows[:, 0].tolist()
+
+	def test_grows_in_chunks(self):
+		self.append(3)
+		size = history.RING_HEADER.size
+		self.assertEqual(os.path.getsize(self.path), size + 8*4)
+		self.assertEqual(self.values(0, 3), [0, 1, 2])
+		self.append(6)
+		self.assertEqual(os.path.getsize(self.path), size + 16*4)
+		self.assertEqual(self.values(0, 9), list(range(9)))
+
+	def test_overwrites_oldest(self):
+		self.append(45)
+		self.assertEqual((self.rows.first, len(self.rows)), (25, 20))
+		self.assertEqual(os.path.getsize(self.path),
+			history.RING_HEADER.size + 20*4)
+		self.assertEqual(self.values(0, 20), list(range(25, 45)))
+		self.assertEqual(self.values(10, 12), [35, 36])
+		# Rows written after the file was mapped show up in reads.
+		self.values(0, 20)
+		self.append(1)
+		self.assertEqual(self.values(19, 20), [45])
+
+	def test_reopen(self):
+		self.append(27)
+		self.rows.close()
+		self.rows = self.open()
+		self.assertEqual((self.rows.first, len(self.rows)), (7, 20))
+		self.append(1)
+		self.assertEqual(self.values(0, 20), list(range(8, 28)))
+		self.rows.keep(25)
+		self.assertEqual(self.values(0, len(self.rows)), list(range(8, 25)))
+		self.rows.close()
+		# Another capacity starts over.
+		self.rows = self.open(capacity=10)
+		self.assertEqual((self.rows.first, len(self.rows)), (0, 0))
+
+
+class SpectrumHistoryTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'history')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def fill(self, spectra, count, start=0):
+		for i in range(start, start + count):
+			row = np.zeros(spectra.width, dtype=np.uint8)
+			row[i % spectra.width] = 200
+			spectra.append(row, 100e6, 102e6, timestamp=float(i))
+
+	def test_levels(self):
+		spectra = history.SpectrumHistory(self.path, 16, levels=2, factor=4)
+		self.fill(spectra, 40)
+		self.assertEqual([spectra.count(level) for level in range(3)],
+			[40, 10, 2])
+		# Every row of a level pools factor rows of the level below.
+		self.assertEqual(np.nonzero(spectra.rows(0, 1, 1)[0])[0].tolist(),
+			[0, 1, 2, 3])
+		self.assertEqual(spectra.records(1, 2, 2)['time'].tolist(), [16.0])
+		self.assertEqual(spectra.find(25.5), 26)
+		spectra.close()
+		# Reopening continues pooling the rows which didn't fill a row yet.
+		spectra = history.SpectrumHistory(self.path, 16, levels=2, factor=4)
+		self.fill(spectra, 8, start=40)
+		self.assertEqual([spectra.count(level) for level in range(3)],
+			[48, 12, 3])
+		self.assertEqual(np.nonzero(spectra.rows(2, 3, 2)[0])[0].tolist(),
+			list(range(16)))
+		spectra.close()
+
+	def test_max_size(self):
+		spectra = history.SpectrumHistory(self.path, 16, levels=2, factor=4,
+			max_size=4096)
+		self.fill(spectra, 1000)
+		self.assertEqual(len(spectra), spectra.max_rows)
+		size = sum(os.path.getsize(os.path.join(self.directory, name))
+			for name in os.listdir(self.directory))
+		self.assertLessEqual(size, 4096 + 5*history.RING_HEADER.size)
+		self.check_aligned(spectra, 1000)
+		spectra.close()
+		# Reopening keeps pooling in step with the rows dropped.
+		spectra = history.SpectrumHistory(self.path, 16, levels=2, factor=4,
+			max_size=4096)
+		self.fill(spectra, 37, start=1000)
+		self.check_aligned(spectra, 1037)
+		spectra.close()
+
+	def check_aligned(self, spectra, total):
+		times = spectra.records(0, len(spectra))['time']
+		self.assertEqual(times.tolist(),
+			list(range(total - spectra.max_rows, total)))
+		self.assertEqual(spectra.find(total - 10.5), spectra.max_rows - 10)
+		# The oldest rows of the coarser levels still pool the right rows and
+		# have their index records.
+		for level in (1, 2):
+			count = spectra.count(level)
+			self.assertEqual(count, spectra.max_rows//4**level)
+			first = int(spectra.records(0, 1, level)['time'][0])
+			self.assertEqual(first, (total//4**level - count)*4**level)
+			self.assertEqual(np.nonzero(spectra.rows(0, 1, level)[0])[0].tolist(),
+				sorted(set((first + i) % 16 for i in range(4**level))))
+
+
+if __name__ == '__main__':
+	unittest.main()
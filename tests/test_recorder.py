@@ -0,0 +1,121 @@
+# Tests for recording spectra and raw I/Q samples and reading them back.
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import acquisition
+import dsp
+import recorder
+import sources
+
+
+class RecorderTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'spectra.fqs')
+		self.iq_path = os.path.join(self.directory, 'samples.cu8')
+		self.random = np.random.RandomState(0)
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def spectra(self, count, width=64):
+		return self.random.uniform(-70.0, -20.0, (count, width)).astype(
+			np.float32)
+
+	def record(self, spectra, spans, **kwargs):
+		rec = recorder.Recorder(self.path, chunk_rows=4, **kwargs)
+		for i, (freqs, span) in enumerate(zip(spectra, spans)):
+			rec.add_spectrum(freqs, span[0], span[1], timestamp=1000.0 + i)
+		rec.close()
+		self.assertEqual(rec.spectra_written, len(spectra))
+		self.assertEqual(rec.spectra_dropped, 0)
+		return recorder.RecordingReader(self.path)
+
+	def check_round_trip(self, tolerance, **kwargs):
+		spectra = self.spectra(10)
+		# The tuning changes after the third spectrum, which starts a chunk.
+		spans = [(99e6, 101e6)]*3 + [(104e6, 106e6)]*7
+		reader = self.record(spectra, spans, **kwargs)
+		self.assertEqual(len(reader), 10)
+		self.assertEqual(reader.chunks['rows'].tolist(), [3, 4, 3])
+		times, starts, stops, freqs = reader.read()
+		self.assertEqual(times.tolist(), [1000.0 + i for i in range(10)])
+		self.assertEqual(list(zip(starts, stops)), spans)
+		np.testing.assert_allclose(freqs, spectra, atol=tolerance)
+		# Reads which start and stop inside chunks.
+		times, starts, stops, part = reader.read(2, 8)
+		self.assertEqual(times.tolist(), [1002.0 + i for i in range(6)])
+		np.testing.assert_array_equal(part, freqs[2:8])
+
+	def test_uint8_zlib(self):
+		self.check_round_trip(0.25 + 1e-4, rows=recorder.ROWS_UINT8,
+			compression=recorder.COMPRESS_ZLIB, db_min=-80.0, db_step=0.5)
+
+	def test_float16_uncompressed(self):
+		self.check_round_trip(0.05, rows=recorder.ROWS_FLOAT16,
+			compression=recorder.COMPRESS_NONE)
+
+	def test_zstd(self):
+		try:
+			import zstandard
+		except ImportError:
+			self.skipTest('zstandard is not installed')
+		self.check_round_trip(0.25 + 1e-4, compression=recorder.COMPRESS_ZSTD)
+
+	def test_unknown_format(self):
+		with self.assertRaises(ValueError):
+			recorder.Recorder(self.path, rows='int4')
+		with self.assertRaises(ValueError):
+			recorder.Recorder(self.path, compression='lzma')
+
+	def test_partly_written_chunk(self):
+		self.record(self.spectra(6), [(99e6, 101e6)]*6)
+		with open(self.path, 'r+b') as f:
+			f.truncate(os.path.getsize(self.path) - 10)
+		reader = recorder.RecordingReader(self.path)
+		self.assertEqual(len(reader), 4)
+
+	def test_iq(self):
+		source = sources.SyntheticSource()
+		rec = recorder.Recorder(iq_path=self.iq_path)
+		tap = recorder.TapSource(source, rec)
+		first = np.array(tap.read_bytes(8192))
+		tap.set_center_freq(105e6)
+		second = np.array(tap.read_bytes(4096))
+		rec.close()
+		self.assertEqual(rec.samples_written, 6144)
+		segments, rate = recorder.read_segments(self.iq_path)
+		self.assertEqual(segments, [(100e6, 0, 4096), (105e6, 4096, 2048)])
+		self.assertEqual(rate, 2.4e6)
+		# Replaying the recording gives back the samples of each tuning.
+		replay = recorder.open_iq(self.iq_path, pacing=sources.PACING_FAST,
+			loop=False)
+		replay.set_center_freq(105e6)
+		np.testing.assert_array_equal(replay.read_bytes(4096), second)
+		replay.set_center_freq(100e6)
+		np.testing.assert_array_equal(replay.read_bytes(8192), first)
+		replay.close()
+
+	def test_iq_without_raw_reads(self):
+		# Samples read as complex values are recorded as the bytes they came
+		# from.
+		source = sources.SyntheticSource()
+		rec = recorder.Recorder(iq_path=self.iq_path)
+		tap = recorder.TapSource(source, rec)
+		samples = acquisition.read_samples(tap, 4096, dsp.IQConverter(),
+			raw_reads=False)
+		rec.close()
+		self.assertEqual(rec.samples_written, 4096)
+		recorded = np.fromfile(self.iq_path, dtype=np.uint8)
+		np.testing.assert_array_equal(recorded, source.block[:8192])
+		np.testing.assert_array_equal(dsp.IQConverter().convert(recorded),
+			samples)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,194 @@
+# Tests for the rtl_tcp sample source, run against the fake rtl_tcp server.
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+import rtltcp
+import sources
+
+
+def wait_for(condition, timeout=2.0):
+	end = time.time() + timeout
+	while not condition():
+		if time.time() > end:
+			return False
+		time.sleep(0.01)
+	return True
+
+
+class RtlTcpTest(unittest.TestCase):
+
+	def setUp(self):
+		self.fake = rtltcp.FakeRtlTcpServer(tuner_type=5, gain_count=29)
+		self.fake.start()
+		self.source = None
+
+	def tearDown(self):
+		if self.source is not None:
+			self.source.close()
+		self.fake.stop()
+
+	def connect(self, **kwargs):
+		self.source = rtltcp.RtlTcpSource('127.0.0.1', self.fake.port,
+			timeout=2.0, retry_delay=0.05, **kwargs)
+		return self.source
+
+	def test_header(self):
+		sock = socket.create_connection(('127.0.0.1', self.fake.port), 2.0)
+		header = b''
+		while len(header) < 12:
+			header += sock.recv(12 - len(header))
+		sock.close()
+		self.assertEqual(header, b'RTL0\x00\x00\x00\x05\x00\x00\x00\x1d')
+		source = self.connect()
+		self.assertEqual(source.tuner_type, 5)
+		self.assertEqual(source.gain_count, 29)
+
+	def test_not_rtl_tcp(self):
+		listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		listener.bind(('127.0.0.1', 0))
+		listener.listen(1)
+		try:
+			port = listener.getsockname()[1]
+			def serve():
+				client, address = listener.accept()
+				client.sendall(b'HTTP/1.0 200')
+				client.close()
+			threading.Thread(target=serve).start()
+			with self.assertRaises(IOError):
+				rtltcp.RtlTcpSource('127.0.0.1', port, timeout=2.0, retries=0)
+		finally:
+			listener.close()
+
+	def test_command_encoding(self):
+		self.assertEqual(rtltcp.COMMAND.pack(rtltcp.CMD_SET_FREQ, 100000000),
+			b'\x01\x05\xf5\xe1\x00')
+		self.assertEqual(rtltcp.COMMAND.pack(rtltcp.CMD_SET_GAIN, 207),
+			b'\x04\x00\x00\x00\xcf')
+		source = self.connect(center_freq=95e6, sample_rate=2.048e6)
+		source.set_gain(20.7)
+		source.set_center_freq(101.1e6)
+		source.set_manual_gain_enabled(False)
+		expected = [(rtltcp.CMD_SET_SAMPLE_RATE, 2048000),
+			(rtltcp.CMD_SET_FREQ, 95000000), (rtltcp.CMD_SET_GAIN_MODE, 0),
+			(rtltcp.CMD_SET_GAIN_MODE, 1), (rtltcp.CMD_SET_GAIN, 207),
+			(rtltcp.CMD_SET_FREQ, 101100000), (rtltcp.CMD_SET_GAIN_MODE, 0)]
+		self.assertTrue(wait_for(lambda: len(self.fake.commands) >= len(expected)))
+		self.assertEqual(self.fake.commands, expected)
+		self.assertEqual(self.fake.source.get_center_freq(), 101.1e6)
+		self.assertFalse(self.fake.source.manual_gain)
+
+	def test_read(self):
+		source = self.connect()
+		data = source.read_bytes(65536)
+		self.assertEqual(data.dtype, np.uint8)
+		self.assertEqual(len(data), 65536)
+		samples = source.read_samples(4096)
+		self.assertEqual(len(samples), 4096)
+		self.assertEqual(samples.dtype, np.complex64)
+		self.assertEqual(source.reads, 2)
+		self.assertGreater(source.bytes_received, 0)
+
+	def test_reconnect(self):
+		source = self.connect(center_freq=95e6)
+		source.read_bytes(4096)
+		source.set_gain(20.7)
+		self.fake.drop_clients()
+		self.assertTrue(wait_for(lambda: not source.connected))
+		del self.fake.commands[:]
+		self.assertEqual(len(source.read_bytes(4096)), 4096)
+		self.assertEqual(source.connects, 2)
+		self.assertTrue(wait_for(lambda: len(self.fake.commands) >= 4))
+		self.assertEqual(self.fake.commands, [
+			(rtltcp.CMD_SET_SAMPLE_RATE, 2400000),
+			(rtltcp.CMD_SET_FREQ, 95000000), (rtltcp.CMD_SET_GAIN_MODE, 1),
+			(rtltcp.CMD_SET_GAIN, 207)])
+
+	def test_send_while_disconnecting(self):
+		ends = socket.socketpair()
+		self.addCleanup(ends[0].close)
+		self.addCleanup(ends[1].close)
+		class LostAfterRead(object):
+			# The reader thread loses the connection right after the socket is
+			# first looked up.
+			def __init__(self, sock):
+				self.sock = sock
+			def __get__(self, source, owner):
+				sock, self.sock = self.sock, None
+				return sock
+		class RacingSource(rtltcp.RtlTcpSource):
+			_sock = LostAfterRead(ends[0])
+		source = RacingSource.__new__(RacingSource)
+		source._cond = threading.Condition()
+		source._received = source._fresh = 0
+		source._send(rtltcp.CMD_SET_FREQ, 100000000)
+		self.assertEqual(ends[1].recv(5), b'\x01\x05\xf5\xe1\x00')
+		# Once it's gone commands are dropped, to be sent again after
+		# reconnecting.
+		source._send(rtltcp.CMD_SET_FREQ, 100000000)
+
+	def test_server_gone(self):
+		source = self.connect()
+		source.retries = 1
+		source.read_bytes(4096)
+		self.fake.stop()
+		self.assertTrue(wait_for(lambda: not source.connected))
+		with self.assertRaises(IOError):
+			source.read_bytes(4096)
+
+
+class RtlTcpRetuneTest(unittest.TestCase):
+	"""Streams a recording with a constant byte value in each segment in real
+	time, so it's known which tuning every received byte came from.
+	"""
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		path = os.path.join(self.directory, 'segments.cu8')
+		size = 1 << 20
+		data = np.empty(2*size, dtype=np.uint8)
+		data[:size] = 10
+		data[size:] = 200
+		data.tofile(path)
+		recording = sources.FileSource(path,
+			segments=[(100e6, 0, size//2), (95e6, size//2, size//2)],
+			pacing=sources.PACING_REALTIME)
+		self.fake = rtltcp.FakeRtlTcpServer(recording, chunk_size=8192)
+		self.fake.start()
+		self.source = rtltcp.RtlTcpSource('127.0.0.1', self.fake.port,
+			timeout=2.0)
+
+	def tearDown(self):
+		self.source.close()
+		self.fake.stop()
+		self.fake.source.close()
+		shutil.rmtree(self.directory)
+
+	def test_read_after_retune(self):
+		self.assertTrue(np.all(self.source.read_bytes(16384) == 10))
+		# Let the stream run on while nothing is read.
+		time.sleep(0.3)
+		self.source.set_center_freq(95e6)
+		# Like a sweep, skip the samples still in flight when the command was
+		# sent before the samples that are used.
+		self.source.read_bytes(32768)
+		self.assertTrue(np.all(self.source.read_bytes(16384) == 200))
+
+	def test_reads_are_newest(self):
+		self.source.read_bytes(16384)
+		time.sleep(0.3)
+		start = time.time()
+		self.source.read_bytes(16384)
+		# Backlog from the pause is skipped rather than read through.
+		self.assertLess(time.time() - start, 0.1)
+		self.assertGreater(self.source.bytes_skipped, 1000000)
+
+
+if __name__ == '__main__':
+	unittest.main()
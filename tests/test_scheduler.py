@@ -0,0 +1,91 @@
+# Tests for the main loop frame scheduler.
+import os
+import threading
+import time
+import unittest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+import scheduler
+
+
+class FrameSchedulerTest(unittest.TestCase):
+
+	def setUp(self):
+		pygame.display.init()
+		pygame.display.set_mode((16, 16))
+		pygame.event.clear()
+		self.stop = threading.Event()
+		self.thread = None
+
+	def tearDown(self):
+		self.stop.set()
+		if self.thread is not None:
+			self.thread.join()
+		pygame.event.clear()
+
+	def flood(self, event_type, **attributes):
+		# Post events from another thread as fast as the input of a busy user.
+		def post():
+			while not self.stop.is_set():
+				pygame.event.post(pygame.event.Event(event_type, **attributes))
+				time.sleep(0.001)
+		self.thread = threading.Thread(target=post)
+		self.thread.start()
+
+	def count_frames(self, frames, animated, duration):
+		count = 0
+		events = []
+		end = time.time() + duration
+		while time.time() < end:
+			events.extend(frames.wait(animated))
+			count += 1
+		return count, events
+
+	def test_animated_rate(self):
+		frames = scheduler.FrameScheduler(fps=20)
+		self.flood(pygame.KEYDOWN, key=pygame.K_a)
+		count, events = self.count_frames(frames, True, 0.5)
+		self.assertLessEqual(count, 12)
+		self.assertGreaterEqual(count, 8)
+		self.assertGreater(len(events), 0)
+
+	def test_static_ignores_motion(self):
+		frames = scheduler.FrameScheduler(fps=20, idle_timeout=0.3)
+		self.flood(pygame.MOUSEMOTION, pos=(1, 1), rel=(1, 1), buttons=(0, 0, 0))
+		start = time.time()
+		self.assertEqual(frames.wait(False), [])
+		self.assertGreaterEqual(time.time() - start, 0.25)
+
+	def test_static_input_rate(self):
+		frames = scheduler.FrameScheduler(fps=20, idle_timeout=1.0)
+		self.flood(pygame.MOUSEBUTTONDOWN, pos=(1, 1), button=1)
+		count, events = self.count_frames(frames, False, 0.5)
+		self.assertLessEqual(count, 12)
+		self.assertTrue(all(event.type == pygame.MOUSEBUTTONDOWN
+			for event in events))
+
+	def test_static_wakes_on_input(self):
+		frames = scheduler.FrameScheduler(fps=20, idle_timeout=2.0)
+		pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_a))
+		start = time.time()
+		events = frames.wait(False)
+		self.assertLess(time.time() - start, 0.1)
+		self.assertEqual([event.type for event in events], [pygame.KEYDOWN])
+
+	def test_drops_late_frames(self):
+		frames = scheduler.FrameScheduler(fps=20)
+		frames.wait(True)
+		time.sleep(0.3)
+		late = time.time()
+		frames.wait(True)
+		self.assertGreaterEqual(frames.frames_dropped, 4)
+		# The schedule restarts from the late frame instead of catching up with
+		# the missed ones.
+		self.assertGreaterEqual(frames.next_frame, late + frames.frame_time)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,216 @@
+# Tests for the spectrum server and client over loopback.
+import socket
+import sys
+import threading
+import time
+import unittest
+
+import numpy as np
+
+import core
+import server
+
+
+def wait_for(condition, timeout=2.0):
+	end = time.time() + timeout
+	while not condition():
+		if time.time() > end:
+			return False
+		time.sleep(0.005)
+	return True
+
+
+class SpectrumServerTest(unittest.TestCase):
+
+	def setUp(self):
+		self.server = server.SpectrumServer('127.0.0.1', 0)
+		self.server.start()
+		self.clients = []
+		self.sockets = []
+		self.random = np.random.RandomState(0)
+		self.published = 0
+
+	def tearDown(self):
+		for client in self.clients:
+			client.stop()
+		for sock in self.sockets:
+			sock.close()
+		self.server.stop()
+
+	def connect(self, width, count=1):
+		clients = [server.SpectrumClient('127.0.0.1', self.server.port,
+			width=width, reconnect_delay=0.05) for i in range(count)]
+		self.clients.extend(clients)
+		self.assertTrue(wait_for(lambda: all(c.connected for c in clients)))
+		self.assertTrue(wait_for(
+			lambda: self.server.clients == len(self.clients) + len(self.sockets)))
+		return clients
+
+	def publish(self, freqs, clients):
+		# Publish one spectrum and wait until every client received it (every
+		# frame was either received or skipped by the server).
+		self.server.publish(freqs, 99e6, 101e6)
+		self.published += 1
+		self.assertTrue(wait_for(lambda: all(client.frames_received +
+			client.frames_missed == self.published for client in clients)))
+
+	def spectrum(self, width=320):
+		return self.random.uniform(-70.0, -20.0, width).astype(np.float32)
+
+	def test_clients_receive_spectra(self):
+		clients = self.connect(320, count=3)
+		for i in range(10):
+			freqs = self.spectrum()
+			self.publish(freqs, clients)
+			for client in clients:
+				np.testing.assert_allclose(client.latest(), freqs,
+					atol=self.server.db_step/2.0 + 1e-4)
+		for client in clients:
+			self.assertEqual(client.frames_received, 10)
+			self.assertEqual(client.frames_missed, 0)
+			self.assertEqual(client.get_center_freq(), 100e6)
+			self.assertEqual(client.get_sample_rate(), 2e6)
+
+	def test_width_pooling(self):
+		full, pooled = self.connect(320)[0], self.connect(160)[0]
+		for i in range(5):
+			freqs = self.spectrum()
+			self.publish(freqs, [full, pooled])
+			self.assertEqual(len(pooled.latest()), 160)
+			# Merged columns keep the strongest value.
+			np.testing.assert_allclose(pooled.latest(),
+				freqs.reshape(-1, 2).max(axis=1),
+				atol=self.server.db_step/2.0 + 1e-4)
+
+	def test_slow_client_drops_frames(self):
+		client = self.connect(320)[0]
+		# A client which never reads fills its socket and then its queue.
+		slow = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+		slow.connect(('127.0.0.1', self.server.port))
+		self.sockets.append(slow)
+		self.assertTrue(wait_for(lambda: self.server.clients == 2))
+		# Random levels don't compress, so this is more than the socket buffers
+		# can hold.
+		for i in range(300):
+			freqs = self.spectrum(65536)
+			self.server.publish(freqs, 99e6, 101e6)
+			self.published += 1
+			time.sleep(0.001)
+		self.assertTrue(wait_for(lambda: self.server.frames_dropped > 0))
+		# The fast client isn't held up by the slow one.  It may have skipped
+		# some of the flood too, so wait until it's done with what was queued.
+		received = -1
+		while client.frames_received != received:
+			received = client.frames_received
+			time.sleep(0.2)
+		self.published = self.server.sequence
+		freqs = self.spectrum()
+		self.publish(freqs, [client])
+		np.testing.assert_allclose(client.latest(), freqs,
+			atol=self.server.db_step/2.0 + 1e-4)
+
+	def test_publish_from_threads(self):
+		client = self.connect(64)[0]
+		seen = []
+		def check():
+			# Every received spectrum must be one of the published ones, which
+			# are constant at a different level for each thread.  Large spectra
+			# make numpy release the GIL while quantizing.
+			while not done.is_set():
+				freqs = client.latest()
+				if freqs is not None:
+					seen.append(np.ptp(freqs))
+				time.sleep(0.0005)
+		def publish(level, width):
+			freqs = np.full(width, level, dtype=np.float32)
+			try:
+				for i in range(50):
+					self.server.publish(freqs, 99e6, 101e6)
+			except Exception as error:
+				errors.append(error)
+		errors = []
+		done = threading.Event()
+		checker = threading.Thread(target=check)
+		checker.start()
+		threads = [threading.Thread(target=publish, args=(-70.0 + 10*i, 65536*(i % 2 + 1)))
+			for i in range(4)]
+		# Switch threads as often as possible to provoke races.
+		interval = sys.getswitchinterval()
+		sys.setswitchinterval(1e-6)
+		try:
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+		finally:
+			sys.setswitchinterval(interval)
+		time.sleep(0.1)
+		done.set()
+		checker.join()
+		self.assertEqual(errors, [])
+		self.assertGreater(len(seen), 0)
+		self.assertEqual(max(seen), 0.0)
+
+	def test_reconnect(self):
+		client = self.connect(320)[0]
+		port = self.server.port
+		self.server.stop()
+		self.assertTrue(wait_for(lambda: not client.connected))
+		self.server = server.SpectrumServer('127.0.0.1', port)
+		self.server.start()
+		self.assertTrue(wait_for(lambda: client.connected))
+		self.assertTrue(wait_for(lambda: self.server.clients == 1))
+		freqs = self.spectrum()
+		self.publish(freqs, [client])
+		self.assertEqual(client.connects, 2)
+		np.testing.assert_allclose(client.latest(), freqs,
+			atol=self.server.db_step/2.0 + 1e-4)
+
+
+class RemoteCoreTest(unittest.TestCase):
+
+	def setUp(self):
+		# Find a free port for the server which isn't started yet.
+		sock = socket.socket()
+		sock.bind(('127.0.0.1', 0))
+		self.port = sock.getsockname()[1]
+		sock.close()
+		self.client = server.SpectrumClient('127.0.0.1', self.port, width=64,
+			reconnect_delay=0.05)
+		self.core = core.SpectrumCore(64, remote=self.client)
+		self.server = None
+
+	def tearDown(self):
+		self.core.close()
+		if self.server is not None:
+			self.server.stop()
+
+	def test_unreachable_server(self):
+		start = time.time()
+		freqs = self.core.get_spectrum()
+		self.assertLess(time.time() - start, 0.5)
+		self.assertEqual(freqs.tolist(), [0.0]*64)
+		self.assertEqual(self.core.frame_seq, 0)
+		self.assertFalse(self.core.has_new_data())
+		with self.assertRaises(IOError) as error:
+			next(self.core.iter_spectra(count=1, timeout=0.1))
+		self.assertIn(str(self.port), str(error.exception))
+		# Once the server is up the client connects on its own.
+		self.server = server.SpectrumServer('127.0.0.1', self.port)
+		self.server.start()
+		self.assertTrue(wait_for(lambda: self.server.clients == 1))
+		received = []
+		self.core.add_consumer(lambda freqs, low, high: received.append(
+			(float(freqs[0]), low, high)))
+		self.server.publish(np.full(64, -30.0, dtype=np.float32), 99e6, 101e6)
+		# Consumers get the spectrum without the core being read.
+		self.assertTrue(wait_for(lambda: received == [(-30.0, 99e6, 101e6)]))
+		self.assertTrue(wait_for(self.core.has_new_data))
+		freqs = self.core.get_spectrum()
+		np.testing.assert_allclose(freqs, -30.0)
+		self.assertEqual(self.core.frame_seq, 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,127 @@
+# Tests for replaying I/Q recordings.
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import dsp
+import sources
+
+
+class FileSourceTest(unittest.TestCase):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		random = np.random.RandomState(0)
+		# 1000 samples of each kind of recording.
+		self.raw = random.randint(0, 256, 2000).astype(np.uint8)
+		self.cu8_path = os.path.join(self.directory, 'samples.cu8')
+		self.raw.tofile(self.cu8_path)
+		self.samples = (random.standard_normal(1000) +
+			1j*random.standard_normal(1000)).astype(np.complex64)
+		self.cf32_path = os.path.join(self.directory, 'samples.cf32')
+		self.samples.tofile(self.cf32_path)
+		self.opened = []
+
+	def tearDown(self):
+		for source in self.opened:
+			source.close()
+		shutil.rmtree(self.directory)
+
+	def open(self, path, format, **kwargs):
+		kwargs.setdefault('pacing', sources.PACING_FAST)
+		source = sources.FileSource(path, format, **kwargs)
+		self.opened.append(source)
+		return source
+
+	def test_cu8(self):
+		source = self.open(self.cu8_path, sources.FORMAT_CU8)
+		self.assertTrue(source.native_bytes)
+		np.testing.assert_array_equal(source.read_bytes(600), self.raw[:600])
+		expected = dsp.IQConverter().convert(self.raw[600:1000])
+		np.testing.assert_array_equal(source.read_samples(200), expected)
+
+	def test_cf32(self):
+		source = self.open(self.cf32_path, sources.FORMAT_CF32)
+		self.assertFalse(source.native_bytes)
+		np.testing.assert_array_equal(source.read_samples(300),
+			self.samples[:300])
+		np.testing.assert_array_equal(source.read_samples(300),
+			self.samples[300:600])
+		with self.assertRaises(IOError):
+			source.read_bytes(100)
+
+	def test_unknown_format(self):
+		with self.assertRaises(ValueError):
+			sources.FileSource(self.cu8_path, 'cs16')
+		with self.assertRaises(ValueError):
+			sources.FileSource(self.cu8_path, pacing='slow')
+
+	def test_loop(self):
+		for path, format, data in [(self.cu8_path, sources.FORMAT_CU8,
+				self.raw.reshape(-1, 2)),
+				(self.cf32_path, sources.FORMAT_CF32, self.samples)]:
+			source = self.open(path, format, loop=True)
+			read = source.read_bytes if format == sources.FORMAT_CU8 else \
+				source.read_samples
+			size = 2 if format == sources.FORMAT_CU8 else 1
+			# A read ending at the end of the file starts the next one over.
+			read(size*400)
+			np.testing.assert_array_equal(read(size*600), data[400:].reshape(-1))
+			np.testing.assert_array_equal(read(size*100), data[:100].reshape(-1))
+			# A read across the end wraps around to the start.
+			read(size*850)
+			expected = np.concatenate((data[950:], data[:50]))
+			np.testing.assert_array_equal(read(size*100), expected.reshape(-1))
+			self.assertEqual(source.position, 50)
+
+	def test_no_loop(self):
+		source = self.open(self.cf32_path, sources.FORMAT_CF32, loop=False)
+		np.testing.assert_array_equal(source.read_samples(1000), self.samples)
+		with self.assertRaises(IOError):
+			source.read_samples(1)
+		source = self.open(self.cf32_path, sources.FORMAT_CF32, loop=False)
+		source.read_samples(900)
+		with self.assertRaises(IOError):
+			source.read_samples(200)
+		# Reads longer than the whole recording can't be served either.
+		source = self.open(self.cf32_path, sources.FORMAT_CF32, loop=False)
+		with self.assertRaises(IOError):
+			source.read_samples(1001)
+
+	def test_retune_selects_segment(self):
+		segments = [(100e6, 0, 300), (102e6, 300, 500), (104e6, 800, 500)]
+		source = self.open(self.cf32_path, sources.FORMAT_CF32,
+			segments=segments)
+		self.assertEqual(source.get_center_freq(), 100e6)
+		# The last segment is cut short at the end of the file.
+		self.assertEqual(source.segments[2], (104e6, 800, 200))
+		source.set_center_freq(104.4e6)
+		self.assertEqual(source.get_center_freq(), 104e6)
+		np.testing.assert_array_equal(source.read_samples(150),
+			self.samples[800:950])
+		# Reads loop within the selected segment.
+		np.testing.assert_array_equal(source.read_samples(100),
+			np.concatenate((self.samples[950:1000], self.samples[800:850])))
+		# Retuning starts the closest segment from its beginning.
+		source.set_center_freq(101.2e6)
+		self.assertEqual(source.get_center_freq(), 102e6)
+		np.testing.assert_array_equal(source.read_samples(10),
+			self.samples[300:310])
+
+	def test_fixed_tuning(self):
+		source = self.open(self.cu8_path, sources.FORMAT_CU8, center_freq=95e6,
+			sample_rate=1e6)
+		source.set_center_freq(95e6)
+		with self.assertRaises(IOError):
+			source.set_center_freq(96e6)
+		source.set_sample_rate(1e6)
+		with self.assertRaises(IOError):
+			source.set_sample_rate(2e6)
+		self.assertEqual(source.get_center_freq(), 95e6)
+
+
+if __name__ == '__main__':
+	unittest.main()
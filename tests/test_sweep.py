@@ -0,0 +1,123 @@
+# Tests for stitching wideband sweeps from the spectra of several tunings.
+import threading
+import unittest
+
+import numpy as np
+
+import dsp
+import sources
+import sweep
+
+
+class RolloffSource(sources.SampleSource):
+	"""Noise whose power drops by 20 dB towards the edges of the tuner's
+	passband, like the filters of a real tuner.
+	"""
+
+	native_bytes = False
+
+	def __init__(self, sample_rate=2.4e6, passband=0.8, seed=0):
+		super(RolloffSource, self).__init__(100e6, sample_rate)
+		self.passband = passband
+		self.random = np.random.RandomState(seed)
+		self.tunings = []
+
+	def set_center_freq(self, freq):
+		super(RolloffSource, self).set_center_freq(freq)
+		self.tunings.append((freq, threading.current_thread()))
+
+	def read_samples(self, num_samples):
+		spectrum = (self.random.standard_normal(num_samples) +
+			1j*self.random.standard_normal(num_samples))
+		offsets = np.fft.fftfreq(num_samples)
+		spectrum[np.abs(offsets) > self.passband/2.0] *= 0.1
+		return np.fft.ifft(spectrum).astype(np.complex64)
+
+
+class SweeperTest(unittest.TestCase):
+
+	def test_span(self):
+		sweeper = sweep.Sweeper(90e6, 110e6, 2.4e6, 320, usable=0.75)
+		self.assertEqual(sweeper.step, 1.8e6)
+		self.assertEqual(sweeper.steps, 12)
+		# Widened symmetrically to a whole number of steps.
+		self.assertAlmostEqual(sweeper.start_freq, 89.2e6)
+		self.assertAlmostEqual(sweeper.stop_freq, 110.8e6)
+		self.assertEqual(sweeper.requested, (90e6, 110e6))
+		np.testing.assert_allclose(np.diff(sweeper.centers), 1.8e6)
+		self.assertAlmostEqual(sweeper.centers[0], 90.1e6)
+		self.assertAlmostEqual(sweeper.centers[-1], 109.9e6)
+		with self.assertRaises(ValueError):
+			sweep.Sweeper(110e6, 90e6, 2.4e6, 320)
+		with self.assertRaises(ValueError):
+			sweep.Sweeper(90e6, 110e6, 2.4e6, 320, usable=0.0)
+
+	def test_tones_land_once_at_their_frequency(self):
+		# The synthetic tones follow the tuning, so every step shows its own
+		# copy of them inside the usable part of the band.
+		source = sources.SyntheticSource(tones=((-600e3, 0.3), (300e3, 0.3)),
+			noise=0.01)
+		sweeper = sweep.Sweeper(95e6, 105e6, source.get_sample_rate(), 600,
+			usable=0.75, settle_samples=0)
+		engine = dsp.SpectrumEngine(600, fft_size=1024, segments=4)
+		freqs = sweeper.read(source, engine, dsp.IQConverter())
+		self.assertEqual(len(freqs), 600)
+		column_hz = (sweeper.stop_freq - sweeper.start_freq)/600
+		expected = sorted(int((center + offset - sweeper.start_freq)/column_hz)
+			for center in sweeper.centers for offset in (-600e3, 300e3))
+		peaks = sorted(dsp.find_peaks(freqs, prominence=20.0, radius=2))
+		self.assertEqual(len(peaks), len(expected))
+		for peak, column in zip(peaks, expected):
+			self.assertLessEqual(abs(peak - column), 1)
+		# The sweep ends tuned back to the first step for the next one.
+		self.assertEqual(source.get_center_freq(), sweeper.centers[0])
+
+	def test_usable_fraction_leaves_no_seams(self):
+		def sweep_floor(usable):
+			source = RolloffSource(passband=0.8)
+			sweeper = sweep.Sweeper(95e6, 105e6, source.get_sample_rate(), 400,
+				usable=usable)
+			engine = dsp.SpectrumEngine(400, fft_size=512, segments=32,
+				pooling=dsp.POOL_MEAN)
+			freqs = sweeper.read(source, engine, dsp.IQConverter(),
+				raw_reads=False)
+			return freqs - np.median(freqs)
+		# Only the flat middle of each step is kept, so the floor is level.
+		floor = sweep_floor(0.75)
+		self.assertLess(np.max(np.abs(floor)), 1.5)
+		# Keeping the whole band shows the roll off at every seam.
+		self.assertLess(np.min(sweep_floor(1.0)), -10.0)
+
+	def test_retunes_while_computing(self):
+		# The next step is tuned on another thread, which is only possible
+		# while the previous step's FFT runs.
+		source = RolloffSource()
+		sweeper = sweep.Sweeper(95e6, 105e6, source.get_sample_rate(), 200,
+			settle_samples=256)
+		engine = dsp.SpectrumEngine(200, fft_size=256)
+		sweeper.read(source, engine, dsp.IQConverter(), raw_reads=False)
+		freqs = [f for f, thread in source.tunings]
+		self.assertEqual(freqs, list(sweeper.centers) + [sweeper.centers[0]])
+		threads = [thread for f, thread in source.tunings]
+		self.assertIs(threads[0], threading.current_thread())
+		self.assertNotIn(threading.current_thread(), threads[1:])
+		# The source is tuned and settled for the first step of the next sweep.
+		source.tunings = []
+		sweeper.read(source, engine, dsp.IQConverter(), raw_reads=False)
+		self.assertEqual(len(source.tunings), sweeper.steps)
+
+	def test_retune_error_raised(self):
+		class Failing(RolloffSource):
+			def set_center_freq(self, freq):
+				if self.tunings:
+					raise IOError('Tuner went away.')
+				super(Failing, self).set_center_freq(freq)
+		source = Failing()
+		sweeper = sweep.Sweeper(95e6, 105e6, source.get_sample_rate(), 200)
+		engine = dsp.SpectrumEngine(200, fft_size=256)
+		with self.assertRaises(IOError):
+			sweeper.read(source, engine, dsp.IQConverter(), raw_reads=False)
+
+
+if __name__ == '__main__':
+	unittest.main()
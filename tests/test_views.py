@@ -0,0 +1,152 @@
+# Tests for the spectrogram views, drawn on surfaces without a display.
+import os
+import shutil
+import tempfile
+import unittest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+
+import dsp
+import freqshow
+import history
+import views
+
+
+class FakeModel(object):
+	"""Stand-in for FreqShowModel which serves the spectrum in freqs."""
+
+	def __init__(self, width=64, height=48):
+		self.width = width
+		self.height = height
+		self.min_intensity = -80.0
+		self.max_intensity = 40.0
+		self.range = self.max_intensity - self.min_intensity
+		self.frame_seq = 0
+		self.freqs = np.zeros(width, dtype=np.float32)
+		self.history = None
+		self.peaks = []
+
+	def get_data(self):
+		return self.freqs
+
+	def publish(self, level):
+		self.freqs = np.full(self.width, level, dtype=np.float32)
+		self.frame_seq += 1
+
+
+class FakeController(object):
+
+	def change_to_settings(self, *args):
+		pass
+
+	def toggle_main(self, *args):
+		pass
+
+
+class WaterfallTest(unittest.TestCase):
+
+	def setUp(self):
+		pygame.font.init()
+		self.model = FakeModel()
+		self.view = views.WaterfallSpectrogram(self.model, FakeController())
+		self.screen = pygame.Surface((self.model.width, self.model.height))
+
+	def column(self):
+		# Colors of the first column of the screen, top to bottom.
+		return [tuple(self.screen.get_at((0, y)))[:3]
+			for y in range(self.model.height)]
+
+	def test_newest_row_at_bottom(self):
+		decibels = np.array([-60.0, 0.0, 30.0], dtype=np.float32)
+		for value in decibels:
+			self.model.publish(value)
+			self.view.render_spectrogram(self.screen)
+		column = self.column()
+		levels = dsp.quantize_db(decibels, freqshow.WATERFALL_DB_MIN,
+			freqshow.WATERFALL_DB_STEP, np.zeros(3, dtype=np.uint8))
+		self.assertEqual(column[-3:],
+			[tuple(self.view.palette[level]) for level in levels])
+		self.assertEqual(column[0], freqshow.MAIN_BG)
+		# Redrawing without a new spectrum doesn't add a row.
+		self.view.render_spectrogram(self.screen)
+		self.assertEqual(self.column(), column)
+
+	def test_rows_wrap_around(self):
+		# More rows than the waterfall holds wrap around its circular buffer,
+		# and the screen still shows the newest ones oldest first.
+		decibels = np.linspace(-70.0, 30.0, 70).astype(np.float32)
+		for value in decibels:
+			self.model.publish(value)
+			self.view.render_spectrogram(self.screen)
+		self.assertNotEqual(self.view.write_row, 0)
+		levels = dsp.quantize_db(decibels, freqshow.WATERFALL_DB_MIN,
+			freqshow.WATERFALL_DB_STEP, np.zeros(70, dtype=np.uint8))
+		self.assertEqual(self.column(), [tuple(self.view.palette[level])
+			for level in levels[-self.model.height:]])
+
+	def test_clear(self):
+		self.model.publish(0.0)
+		self.view.render_spectrogram(self.screen)
+		self.view.clear_waterfall()
+		self.view.render_spectrogram(self.screen)
+		self.assertEqual(set(self.column()), set([freqshow.MAIN_BG]))
+
+
+class ScrollbackTest(unittest.TestCase):
+
+	def setUp(self):
+		pygame.font.init()
+		self.directory = tempfile.mkdtemp()
+		self.model = FakeModel(width=64, height=100)
+		self.model.history = history.SpectrumHistory(
+			os.path.join(self.directory, 'history'), 64, levels=2, factor=4)
+		for i in range(500):
+			self.model.history.append(np.zeros(64, dtype=np.uint8))
+		self.view = views.WaterfallSpectrogram(self.model, FakeController())
+
+	def tearDown(self):
+		self.model.history.close()
+		shutil.rmtree(self.directory)
+
+	def swipe(self, start, end):
+		self.view.click(start)
+		self.view.release(end)
+
+	def test_swipe_scrolls(self):
+		self.swipe((30, 30), (30, 70))
+		self.assertEqual((self.view.history_level, self.view.history_offset),
+			(0, 40))
+		self.assertTrue(self.view.overlay_enabled)
+		self.swipe((30, 70), (32, 45))
+		self.assertEqual(self.view.history_offset, 15)
+		# Swiping up past the newest rows goes back to the live waterfall.
+		self.swipe((30, 70), (30, 30))
+		self.assertEqual(self.view.history_offset, 0)
+		self.view.zoom(1)
+		self.swipe((30, 70), (30, 30))
+		self.assertEqual((self.view.history_level, self.view.history_offset),
+			(0, 0))
+
+	def test_swipe_zooms(self):
+		self.view.scroll(100)
+		self.swipe((50, 50), (10, 55))
+		self.assertEqual((self.view.history_level, self.view.history_offset),
+			(1, 25))
+		self.swipe((10, 50), (50, 50))
+		self.assertEqual((self.view.history_level, self.view.history_offset),
+			(0, 100))
+
+	def test_tap_toggles_overlay(self):
+		self.swipe((30, 50), (33, 52))
+		self.assertFalse(self.view.overlay_enabled)
+		self.assertEqual(self.view.history_offset, 0)
+		# A release without a press on the spectrogram does nothing.
+		self.view.release((30, 90))
+		self.assertFalse(self.view.overlay_enabled)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -22,6 +22,8 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+from collections import OrderedDict
+
 import pygame
 
 
@@ -55,14 +57,50 @@ def get_font(size):
 		font_cache[size] = pygame.font.Font(None, size)
 	return font_cache[size]
 
+# Rendered text surfaces, most recently used last.  Surfaces in the cache are
+# shared so callers must only blit them and never draw on them.
+TEXT_CACHE_SIZE = 64
+text_cache = OrderedDict()
+text_cache_hits = 0
+text_cache_misses = 0
+
 def render_text(text, size=33, fg=(255, 255, 255), bg=(0, 0, 0)):
-	"""Render the provided text to a surface which is returned."""
+	"""Render the provided text to a surface which is returned.  Surfaces are
+	kept in a least recently used cache so repeatedly rendering the same text
+	doesn't rasterize the font again.
+	"""
+	global text_cache_hits, text_cache_misses
+	key = (text, size, tuple(fg), tuple(bg) if bg is not None else None)
+	surface = text_cache.get(key)
+	if surface is not None:
+		text_cache_hits += 1
+		text_cache.move_to_end(key)
+		return surface
+	text_cache_misses += 1
 	if bg is not None:
 		# Optimized case when the background is known.
-		return get_font(size).render(text, True, fg, bg)
+		surface = get_font(size).render(text, True, fg, bg)
 	else:
 		# Less optimized case with transparent background.
-		return get_font(size).render(text, True, fg)
+		surface = get_font(size).render(text, True, fg)
+	text_cache[key] = surface
+	while len(text_cache) > TEXT_CACHE_SIZE:
+		text_cache.popitem(last=False)
+	return surface
+
+def text_cache_info():
+	"""Return dict with the text cache hits, misses, current size and maximum
+	size.
+	"""
+	return {'hits': text_cache_hits, 'misses': text_cache_misses,
+		'size': len(text_cache), 'max_size': TEXT_CACHE_SIZE}
+
+def clear_text_cache():
+	"""Empty the text cache and reset its statistics."""
+	global text_cache_hits, text_cache_misses
+	text_cache.clear()
+	text_cache_hits = 0
+	text_cache_misses = 0
 
 
 class Button(object):
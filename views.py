@@ -25,11 +25,14 @@
 # SOFTWARE.
 import math
 import sys
+import time
 
 import numpy as np
 import pygame
 
+import dsp
 import freqshow
+import perf
 import ui
 
 
@@ -65,6 +68,15 @@ def gradient_func(colors):
 			return rgb_lerp(x, 0.0, 1.0, c0, c1)
 	return _fun
 
+def gradient_lut(colors, size=256):
+	"""Precompute a waterfall gradient into a lookup table.  Returns a numpy
+	array of size x 3 unsigned bytes where entry i is the RGB color of value
+	i/(size-1) on the gradient of provided RGB colors.
+	"""
+	color_func = gradient_func(colors)
+	return np.array([color_func(i/(size-1.0)) for i in range(size)],
+		dtype=np.uint8)
+
 def clamp(x, x0, x1):
 	"""Clamp a provided value to be between x0 and x1 (inclusive).  If value is
 	outside the range it will be truncated to the min/max value which is closest.
@@ -77,17 +89,124 @@ def clamp(x, x0, x1):
 		return x
 
 
+class PerfHud(object):
+	"""Overlay with frames per second and the milliseconds spent in each timed
+	stage (see perf module).  The text only changes every update_interval
+	seconds so it stays readable and doesn't churn the text cache.
+	"""
+
+	def __init__(self, update_interval=0.5):
+		self.update_interval = update_interval
+		self.visible = False
+		self._lines = []
+		self._updated = 0.0
+		self._rect = None
+
+	def toggle(self):
+		"""Show or hide the overlay, timing is only enabled while visible.  The
+		view under the overlay must be redrawn after it is hidden.
+		"""
+		self.visible = not self.visible
+		self._rect = None
+		perf.enable(self.visible or freqshow.PERF_ENABLED)
+
+	def render(self, screen):
+		"""Draw the overlay and return a list of the rects which changed."""
+		if not self.visible:
+			return []
+		now = time.time()
+		if now - self._updated >= self.update_interval:
+			self._updated = now
+			stats = perf.summary()
+			self._lines = ['{0:0.1f} FPS'.format(stats.pop('fps'))]
+			for name, value in stats.pop('rates').items():
+				self._lines.append('{0:0.1f} {1}/s'.format(value, name))
+			for name, values in stats.items():
+				self._lines.append('{0} {1:0.1f} ms'.format(name, values['mean_ms']))
+		labels = [ui.render_text(line, size=freqshow.HUD_FONT,
+			fg=freqshow.HUD_FG, bg=freqshow.MAIN_BG) for line in self._lines]
+		if not labels:
+			return []
+		# Cover the area of the previous text too, in case it was larger.
+		width = max(label.get_width() for label in labels)
+		height = sum(label.get_height() for label in labels)
+		rect = pygame.Rect(screen.get_width() - width, 0, width, height)
+		if self._rect is not None:
+			rect.union_ip(self._rect)
+		self._rect = rect
+		screen.fill(freqshow.MAIN_BG, rect)
+		y = 0
+		for label in labels:
+			screen.blit(label, (screen.get_width() - label.get_width(), y))
+			y += label.get_height()
+		return [rect]
+
+
 class ViewBase(object):
 	"""Base class for simple UI view which represents all the elements drawn
-	on the screen.  Subclasses should override the render, and click functions.
+	on the screen.  Subclasses should override the render_static,
+	render_dynamic, and click functions.
+
+	Parts of a view which don't change from frame to frame (backgrounds,
+	buttons, static labels) are drawn once by render_static into a cached
+	background surface.  Each frame render_dynamic only draws what changed and
+	returns those rects, so the display only has to update the changed areas.
 	"""
 
+	background = None
+	redraw = True
+	animated = False	# True if the view changes without any input.
+
+	def invalidate(self, static=False):
+		"""Force the next render to redraw the entire view.  If static is True
+		the cached background is drawn again too.
+		"""
+		self.redraw = True
+		if static:
+			self.background = None
+
+	def render_static(self, surface):
+		"""Draw the parts of the view which don't change between frames."""
+		surface.fill(freqshow.MAIN_BG)
+
+	def render_dynamic(self, screen, full):
+		"""Draw the parts of the view which change between frames and return a
+		list of the rects which were changed.  Full is True when the whole
+		background was just drawn and everything needs to be drawn again.
+		"""
+		return []
+
 	def render(self, screen):
-		pass
+		"""Render the view on the provided surface and return a list of the
+		rects which changed.
+		"""
+		if self.background is None \
+			or self.background.get_size() != screen.get_size():
+			self.background = pygame.Surface(screen.get_size(), 0, screen)
+			self.render_static(self.background)
+			self.redraw = True
+		if self.redraw:
+			self.redraw = False
+			screen.blit(self.background, (0, 0))
+			self.render_dynamic(screen, True)
+			return [screen.get_rect()]
+		return self.render_dynamic(screen, False)
+
+	def restore(self, screen, rect):
+		"""Draw the cached background over the provided rect of the screen."""
+		screen.blit(self.background, rect, area=rect)
 
 	def click(self, location):
 		pass
 
+	def release(self, location):
+		"""Handle the release of a press (which was passed to click)."""
+		pass
+
+	def key(self, key):
+		"""Handle a key press (pygame key constant)."""
+		pass
+
 
 class MessageDialog(ViewBase):
 	"""Dialog which displays a message in the center of the screen with an OK
@@ -108,11 +227,11 @@ class MessageDialog(ViewBase):
 		self.label_rect = ui.align(self.label.get_rect(),
 			(0, 0, model.width, model.height))
 
-	def render(self, screen):
+	def render_static(self, surface):
 		# Draw background, buttons, and text.
-		screen.fill(freqshow.MAIN_BG)
-		self.buttons.render(screen)
-		screen.blit(self.label, self.label_rect)
+		surface.fill(freqshow.MAIN_BG)
+		self.buttons.render(surface)
+		surface.blit(self.label, self.label_rect)
 
 	def click(self, location):
 		self.buttons.click(location)
@@ -173,20 +292,30 @@ class NumberDialog(ViewBase):
 			fg=freqshow.INPUT_FG, bg=freqshow.INPUT_BG)
 		self.label_pos = ui.align(self.label.get_rect(), self.input_rect,
 			horizontal=ui.ALIGN_LEFT, hpad=10)
+		self.rendered_value = None
 
-	def render(self, screen):
+	def render_static(self, surface):
 		# Clear view and draw background.
-		screen.fill(freqshow.MAIN_BG)
+		surface.fill(freqshow.MAIN_BG)
 		# Draw input background at top of screen.
-		screen.fill(freqshow.INPUT_BG, self.input_rect)
-		# Render label and value text.
-		screen.blit(self.label, self.label_pos)
-		value_label = ui.render_text('{0} {1}'.format(self.value, self.unit_text),
-			size=freqshow.NUM_FONT, fg=freqshow.INPUT_FG, bg=freqshow.INPUT_BG)
+		surface.fill(freqshow.INPUT_BG, self.input_rect)
+		# Render label text.
+		surface.blit(self.label, self.label_pos)
+		# Render buttons.
+		self.buttons.render(surface)
+
+	def render_dynamic(self, screen, full):
+		# Only redraw the value text when it changes.
+		text = '{0} {1}'.format(self.value, self.unit_text)
+		if not full and text == self.rendered_value:
+			return []
+		self.rendered_value = text
+		self.restore(screen, self.input_rect)
+		value_label = ui.render_text(text, size=freqshow.NUM_FONT,
+			fg=freqshow.INPUT_FG, bg=freqshow.INPUT_BG)
 		screen.blit(value_label, ui.align(value_label.get_rect(), self.input_rect,
 			horizontal=ui.ALIGN_RIGHT, hpad=-10))
-		# Render buttons.
-		self.buttons.render(screen)
+		return [pygame.Rect(self.input_rect)]
 
 	def click(self, location):
 		self.buttons.click(location)
@@ -256,21 +385,30 @@ class SettingsList(ViewBase):
 		centerfreq_text = 'CENTER FREQ: {0:0.2f} MHz'.format(model.get_center_freq())
 		samplerate_text = 'SAMPLE RATE: {0:0.2f} MHz'.format(model.get_sample_rate())
 		gain_text       = 'GAIN: {0} dB'.format(model.get_gain())
+		zoom_factor     = model.get_zoom()[0]
+		zoom_text       = 'ZOOM: {0}'.format('{0}x'.format(zoom_factor)
+			if zoom_factor > 1 else 'OFF')
 		min_text        = 'MIN: {0} dB'.format(model.get_min_string())
 		max_text        = 'MAX: {0} dB'.format(model.get_max_string())
+		if model.sweep is None:
+			sweep_text  = 'SWEEP: OFF'
+		else:
+			sweep_text  = 'SWEEP: {0:0.0f}-{1:0.0f} MHz'.format(*model.get_span())
 		# Create buttons.
 		self.buttons = ui.ButtonGrid(model.width, model.height, 4, 5)
 		self.buttons.add(0, 0, centerfreq_text, colspan=4, click=self.centerfreq_click)
 		self.buttons.add(0, 1, samplerate_text, colspan=4, click=self.sample_click)
-		self.buttons.add(0, 2, gain_text,       colspan=4, click=self.gain_click)
+		self.buttons.add(0, 2, gain_text,       colspan=2, click=self.gain_click)
+		self.buttons.add(2, 2, zoom_text,       colspan=2, click=self.zoom_click)
 		self.buttons.add(0, 3, min_text,        colspan=2, click=self.min_click)
 		self.buttons.add(2, 3, max_text,        colspan=2, click=self.max_click)
 		self.buttons.add(0, 4, 'BACK', click=self.controller.change_to_main)
+		self.buttons.add(1, 4, sweep_text,      colspan=3, click=self.sweep_click)
 
-	def render(self, screen):
+	def render_static(self, surface):
 		# Clear view and render buttons.
-		screen.fill(freqshow.MAIN_BG)
-		self.buttons.render(screen)
+		surface.fill(freqshow.MAIN_BG)
+		self.buttons.render(surface)
 
 	def click(self, location):
 		self.buttons.click(location)
@@ -306,6 +444,32 @@ class SettingsList(ViewBase):
 		self.controller.waterfall.clear_waterfall()
 		self.controller.change_to_settings()
 
+	def zoom_click(self, button):
+		# Ask for the zoom factor and then the frequency to zoom in on, AUTO
+		# turns zoom off.
+		factor = self.model.get_zoom()[0]
+		self.controller.number_dialog('ZOOM:', 'x',
+			initial=str(factor) if factor > 1 else 'AUTO',
+			accept=self.zoom_factor_accept, has_auto=True)
+
+	def zoom_factor_accept(self, value):
+		if value == 'AUTO' or int(float(value)) <= 1:
+			self.model.set_zoom(1)
+			self.controller.waterfall.clear_waterfall()
+			self.controller.change_to_settings()
+			return
+		self.zoom_factor = int(float(value))
+		low, high = self.model.get_span()
+		self.controller.number_dialog('ZOOM CENTER:', 'MHz',
+			initial='{0:0.2f}'.format((low+high)/2.0),
+			accept=self.zoom_center_accept)
+
+	def zoom_center_accept(self, value):
+		self.model.set_zoom(self.zoom_factor,
+			float(value) - self.model.get_center_freq())
+		self.controller.waterfall.clear_waterfall()
+		self.controller.change_to_settings()
+
 	def min_click(self, button):
 		self.controller.number_dialog('MIN:', 'dB',
 			initial=self.model.get_min_string(), accept=self.min_accept, 
@@ -313,7 +477,6 @@ class SettingsList(ViewBase):
 
 	def min_accept(self, value):
 		self.model.set_min_intensity(value)
-		self.controller.waterfall.clear_waterfall()
 		self.controller.change_to_settings()
 
 	def max_click(self, button):
@@ -323,6 +486,33 @@ class SettingsList(ViewBase):
 
 	def max_accept(self, value):
 		self.model.set_max_intensity(value)
+		self.controller.change_to_settings()
+
+	def sweep_click(self, button):
+		# Ask for the start and then the stop frequency, AUTO turns sweeping off.
+		low, high = self.model.get_span()
+		self.controller.number_dialog('SWEEP START:', 'MHz',
+			initial='{0:0.2f}'.format(low), accept=self.sweep_start_accept,
+			has_auto=True)
+
+	def sweep_start_accept(self, value):
+		if value == 'AUTO':
+			self.model.clear_sweep()
+			self.controller.waterfall.clear_waterfall()
+			self.controller.change_to_settings()
+			return
+		self.sweep_start = float(value)
+		low, high = self.model.get_span()
+		self.controller.number_dialog('SWEEP STOP:', 'MHz',
+			initial='{0:0.2f}'.format(max(high, self.sweep_start)),
+			accept=self.sweep_stop_accept)
+
+	def sweep_stop_accept(self, value):
+		try:
+			self.model.set_sweep(self.sweep_start, float(value))
+		except ValueError:
+			# Stop frequency wasn't above the start, ignore the sweep.
+			pass
 		self.controller.waterfall.clear_waterfall()
 		self.controller.change_to_settings()
 
@@ -330,6 +520,8 @@ class SettingsList(ViewBase):
 class SpectrogramBase(ViewBase):
 	"""Base class for a spectrogram view."""
 
+	animated = True
+
 	def __init__(self, model, controller):
 		self.model      = model
 		self.controller = controller
@@ -339,6 +531,7 @@ class SpectrogramBase(ViewBase):
 		self.buttons.add(3, 0, 'QUIT', click=self.quit_click,
 			bg_color=freqshow.CANCEL_BG)
 		self.overlay_enabled = True
+		self.rendered_freqs = None
 
 	def render_spectrogram(self, screen):
 		"""Subclass should implement spectorgram rendering in the provided
@@ -354,59 +547,113 @@ class SpectrogramBase(ViewBase):
 		pygame.draw.lines(screen, freqshow.BUTTON_FG, False, 
 			[(x, y), (x-size, y+size), (x+size, y+size), (x, y), (x, y+2*size)])
 
-	def render(self, screen):
+	def marker_y(self, index, height):
+		"""Return y position of the marker for the provided spectrum bin in a
+		spectrogram of the provided height, or None to not draw markers.
+		Subclasses can override it to put markers on the spectrum.
+		"""
+		return 0
+
+	def render_markers(self, screen, size=5):
+		"""Draw a marker (triangle pointing down) and frequency label for each
+		of the model's peaks.  Labels come from the text cache, so they are only
+		rendered again when a peak's frequency changes.
+		"""
+		x, y, width, height = screen.get_rect()
+		for peak in self.model.peaks:
+			if peak.index >= width:
+				continue
+			top = self.marker_y(peak.index, height)
+			if top is None:
+				return
+			top = clamp(top - size - 1, 0, height - size)
+			px = peak.index
+			pygame.draw.polygon(screen, freqshow.MARKER_FG, [(px - size, top),
+				(px + size, top), (px, top + size)])
+			label = ui.render_text('{0:0.3f}'.format(
+				self.model.get_peak_freq(peak.index)), size=freqshow.HUD_FONT,
+				fg=freqshow.MARKER_FG, bg=freqshow.MAIN_BG)
+			rect = label.get_rect()
+			rect.midbottom = (px, top)
+			if rect.top < 0:
+				# No room above the marker, put the label below it.
+				rect.top = top + size + 1
+			rect.clamp_ip(screen.get_rect())
+			screen.blit(label, rect)
+
+	def render_static(self, surface):
 		# Clear screen.
-		screen.fill(freqshow.MAIN_BG)
+		surface.fill(freqshow.MAIN_BG)
 		if self.overlay_enabled:
-			# Draw shrunken spectrogram with overlaid buttons and axes values.
-			spect_rect = (0, self.buttons.row_size, self.model.width,
-				self.model.height-2*self.buttons.row_size)
-			self.render_spectrogram(screen.subsurface(spect_rect))
 			# Draw hash marks.
-			self.render_hash(screen, 0)
-			self.render_hash(screen, self.model.width/2)
-			self.render_hash(screen, self.model.width-1)
-			# Draw frequencies in bottom row.
-			bottom_row  = (0, self.model.height-self.buttons.row_size,
-				self.model.width, self.buttons.row_size)
-			freq        = self.model.get_center_freq()
-			bandwidth   = self.model.get_sample_rate()
-			# Render minimum frequency on left.
-			label = ui.render_text('{0:0.2f} Mhz'.format(freq-bandwidth/2.0),
-				size=freqshow.MAIN_FONT)
-			screen.blit(label, ui.align(label.get_rect(), bottom_row,
-				horizontal=ui.ALIGN_LEFT))
-			# Render center frequency in center.
-			label = ui.render_text('{0:0.2f} Mhz'.format(freq),
-				size=freqshow.MAIN_FONT)
-			screen.blit(label, ui.align(label.get_rect(), bottom_row,
-				horizontal=ui.ALIGN_CENTER))
-			# Render maximum frequency on right.
-			label = ui.render_text('{0:0.2f} Mhz'.format(freq+bandwidth/2.0),
-				size=freqshow.MAIN_FONT)
-			screen.blit(label, ui.align(label.get_rect(), bottom_row,
-				horizontal=ui.ALIGN_RIGHT))
-			# Render min intensity in bottom left.
-			label = ui.render_text('{0:0.0f} dB'.format(self.model.min_intensity),
-				size=freqshow.MAIN_FONT)
-			screen.blit(label, ui.align(label.get_rect(), spect_rect,
-				horizontal=ui.ALIGN_LEFT, vertical=ui.ALIGN_BOTTOM))
-			# Render max intensity in top left.
-			label = ui.render_text('{0:0.0f} dB'.format(self.model.max_intensity),
-				size=freqshow.MAIN_FONT)
-			screen.blit(label, ui.align(label.get_rect(), spect_rect,
-				horizontal=ui.ALIGN_LEFT, vertical=ui.ALIGN_TOP))
+			self.render_hash(surface, 0)
+			self.render_hash(surface, self.model.width/2)
+			self.render_hash(surface, self.model.width-1)
 			# Draw the buttons.
-			self.buttons.render(screen)
-		else:
+			self.buttons.render(surface)
+
+	def render_dynamic(self, screen, full):
+		if not full and not self.model.has_new_data():
+			# Acquisition hasn't kept up with the display, skip this frame
+			# instead of drawing the same spectrum again.
+			return []
+		if not self.overlay_enabled:
 			# Draw fullscreen spectrogram.
+			start = perf.clock()
 			self.render_spectrogram(screen)
+			self.render_markers(screen)
+			perf.record('spectrogram', start)
+			return [screen.get_rect()]
+		# Draw shrunken spectrogram with overlaid buttons and axes values.
+		spect_rect = pygame.Rect(0, self.buttons.row_size, self.model.width,
+			self.model.height-2*self.buttons.row_size)
+		start = perf.clock()
+		spect_surface = screen.subsurface(spect_rect)
+		self.render_spectrogram(spect_surface)
+		self.render_markers(spect_surface)
+		perf.record('spectrogram', start)
+		start = perf.clock()
+		dirty = [spect_rect]
+		# Draw frequencies in bottom row, only when they change.
+		bottom_row  = pygame.Rect(0, self.model.height-self.buttons.row_size,
+			self.model.width, self.buttons.row_size)
+		low, high   = self.model.get_span()
+		freq_text = ('{0:0.2f} Mhz'.format(low),
+			'{0:0.2f} Mhz'.format((low+high)/2.0), '{0:0.2f} Mhz'.format(high))
+		if full or freq_text != self.rendered_freqs:
+			self.rendered_freqs = freq_text
+			self.restore(screen, bottom_row)
+			# Render minimum frequency on left, center frequency in center, and
+			# maximum frequency on right.
+			for text, horizontal in zip(freq_text,
+				(ui.ALIGN_LEFT, ui.ALIGN_CENTER, ui.ALIGN_RIGHT)):
+				label = ui.render_text(text, size=freqshow.MAIN_FONT)
+				screen.blit(label, ui.align(label.get_rect(), bottom_row,
+					horizontal=horizontal))
+			dirty.append(bottom_row)
+		# Render min intensity in bottom left.
+		label = ui.render_text('{0:0.0f} dB'.format(self.model.min_intensity),
+			size=freqshow.MAIN_FONT)
+		screen.blit(label, ui.align(label.get_rect(), spect_rect,
+			horizontal=ui.ALIGN_LEFT, vertical=ui.ALIGN_BOTTOM))
+		# Render max intensity in top left.
+		label = ui.render_text('{0:0.0f} dB'.format(self.model.max_intensity),
+			size=freqshow.MAIN_FONT)
+		screen.blit(label, ui.align(label.get_rect(), spect_rect,
+			horizontal=ui.ALIGN_LEFT, vertical=ui.ALIGN_TOP))
+		perf.record('overlay', start)
+		return dirty
+
+	def on_spectrogram(self, location):
+		"""Return True if location is on the spectrogram, not the buttons."""
+		mx, my = location
+		return my > self.buttons.row_size and my < 4*self.buttons.row_size
 
 	def click(self, location):
-		mx, my = location
-		if my > self.buttons.row_size and my < 4*self.buttons.row_size:
+		if self.on_spectrogram(location):
 			# Handle click on spectrogram.
 			self.overlay_enabled = not self.overlay_enabled
+			self.invalidate(static=True)
 		else:
 			# Handle click on buttons.
 			self.buttons.click(location)
@@ -424,30 +671,194 @@ class WaterfallSpectrogram(SpectrogramBase):
 
 	def __init__(self, model, controller):
 		super(WaterfallSpectrogram, self).__init__(model, controller)
-		self.color_func = gradient_func(freqshow.WATERFALL_GRAD)
-		self.waterfall = pygame.Surface((model.width, model.height))
+		# The history is kept as quantized decibels in an 8-bit surface, and
+		# its palette maps each quantized level to a color for the current
+		# intensity scale.  Rescaling or changing the gradient only rebuilds the
+		# 256 entry palette and recolors the whole history right away.  Level 0
+		# marks rows without data and is drawn with the background color.
+		self.levels = freqshow.WATERFALL_DB_MIN + \
+			(np.arange(256) - 1)*freqshow.WATERFALL_DB_STEP
+		self.set_gradient(freqshow.WATERFALL_GRAD)
+		# The waterfall surface is a circular buffer of rows.  New rows overwrite
+		# the oldest row and the write position advances, so adding a row never
+		# moves the rest of the surface in memory.
+		self.waterfall = pygame.Surface((model.width, model.height), depth=8)
+		self.palette = np.zeros((256, 3), dtype=np.uint8)
+		self.palette_scale = None
+		self.write_row = 0
+		self.last_seq = None
+		self.scaled = None
+		self.clear_waterfall()
+		# Position in the model's long-term history, level is the pyramid level
+		# (zoomed out factor**level times) and offset the number of rows of that
+		# level back from the newest.  Both 0 shows the live waterfall.
+		self.history_level = 0
+		self.history_offset = 0
+		self.scrollback = None
+		self.page = model.height//2
+		# Where the spectrogram was pressed, to tell a click from a swipe when
+		# it's released.
+		self.pressed = None
+
+	def set_gradient(self, colors):
+		"""Change the waterfall gradient to the provided list of RGB colors,
+		which recolors the existing history too.
+		"""
+		self.color_lut = gradient_lut(colors, freqshow.WATERFALL_LUT_SIZE)
+		self.palette_scale = None
 
 	def clear_waterfall(self):
-		self.waterfall.fill(freqshow.MAIN_BG)
+		self.waterfall.fill(0)
+		self.write_row = 0
+
+	def update_palette(self):
+		"""Color the quantized levels for the model's current intensity scale."""
+		scale = (self.model.min_intensity, self.model.range)
+		if scale == self.palette_scale:
+			return
+		self.palette_scale = scale
+		size = len(self.color_lut)
+		index = (self.levels - scale[0])*((size-1)/scale[1])
+		np.clip(index, 0, size-1, out=index)
+		self.palette[:] = self.color_lut[index.astype(np.intp)]
+		self.palette[0] = freqshow.MAIN_BG
+		self.waterfall.set_palette(self.palette)
+
+	def add_row(self, freqs):
+		"""Store the provided spectrum as the newest row of the waterfall."""
+		wwidth, wheight = self.waterfall.get_size()
+		if self.scaled is None or len(self.scaled) != wwidth:
+			# Buffers reused for every row.
+			self.scaled = np.zeros(wwidth, dtype=np.float32)
+			self.quantized = np.zeros(wwidth, dtype=np.uint8)
+		# Quantize the intensities to levels 1 to 255 and copy them over the
+		# oldest row.
+		dsp.quantize_db(freqs, freqshow.WATERFALL_DB_MIN,
+			freqshow.WATERFALL_DB_STEP, self.quantized, self.scaled)
+		pixels = pygame.surfarray.pixels2d(self.waterfall)
+		pixels[:, self.write_row] = self.quantized
+		del pixels
+		self.write_row = (self.write_row + 1) % wheight
+
+	def scroll(self, rows):
+		"""Scroll the number of rows back through the history, or forward for
+		a negative number.  Scrolling forward from the newest rows goes back to
+		the live waterfall.
+		"""
+		history = self.model.history
+		if rows < 0 and self.history_offset == 0:
+			self.history_level = 0
+		self.history_offset = min(max(self.history_offset + rows, 0),
+			max(history.count(self.history_level) - 1, 0))
+
+	def zoom(self, levels):
+		"""Zoom out the number of pyramid levels, or in for a negative number."""
+		history = self.model.history
+		level = min(max(self.history_level + levels, 0), len(history.levels)-1)
+		if level > self.history_level:
+			self.history_offset //= history.factor**(level - self.history_level)
+		else:
+			self.history_offset *= history.factor**(self.history_level - level)
+		self.history_level = level
+
+	def click(self, location):
+		# With a history wait for the release of presses on the spectrogram,
+		# they can be swipes through the history.
+		if self.model.history is not None and self.on_spectrogram(location):
+			self.pressed = location
+		else:
+			super(WaterfallSpectrogram, self).click(location)
+
+	def release(self, location):
+		if self.pressed is None:
+			return
+		dx = location[0] - self.pressed[0]
+		dy = location[1] - self.pressed[1]
+		pressed = self.pressed
+		self.pressed = None
+		if max(abs(dx), abs(dy)) < freqshow.SWIPE_DISTANCE:
+			super(WaterfallSpectrogram, self).click(pressed)
+		elif abs(dy) >= abs(dx):
+			# Swiping down drags older rows into view, one row per pixel.
+			self.scroll(dy)
+		else:
+			# Swiping left zooms out and right zooms in.
+			self.zoom(1 if dx < 0 else -1)
+
+	def key(self, key):
+		# Up and down scroll back through the history, minus and plus zoom out
+		# and in, and end goes back to the live waterfall.
+		if self.model.history is None:
+			return
+		if key == pygame.K_UP:
+			self.scroll(self.page)
+		elif key == pygame.K_DOWN:
+			self.scroll(-self.page)
+		elif key == pygame.K_MINUS:
+			self.zoom(1)
+		elif key in (pygame.K_EQUALS, pygame.K_PLUS):
+			self.zoom(-1)
+		elif key == pygame.K_END:
+			self.history_level = 0
+			self.history_offset = 0
+
+	def marker_y(self, index, height):
+		# Markers belong to the live waterfall, not the scrolled back history.
+		if self.history_level > 0 or self.history_offset > 0:
+			return None
+		return 0
+
+	def render_history(self, screen):
+		"""Draw the part of the long-term history selected by history_level and
+		history_offset, newest row at the bottom.
+		"""
+		history = self.model.history
+		x, y, width, height = screen.get_rect()
+		self.page = max(height//2, 1)
+		end = max(history.count(self.history_level) - self.history_offset, 0)
+		rows = history.rows(end - height, end, self.history_level)
+		if self.scrollback is None or self.scrollback.get_size() != (width, height):
+			self.scrollback = pygame.Surface((width, height), depth=8)
+		self.scrollback.set_palette(self.palette)
+		pixels = pygame.surfarray.pixels2d(self.scrollback)
+		pixels.fill(0)
+		pixels[:, height-len(rows):] = rows[:, :width].T
+		del pixels
+		screen.blit(self.scrollback, (0, 0))
+		# Label with the age of the newest row shown and the zoom.
+		if len(rows) == 0:
+			return
+		age = int(time.time() - history.records(end-1, end,
+			self.history_level)['time'][0])
+		label = ui.render_text('-{0}:{1:02d}:{2:02d} 1:{3}'.format(age//3600,
+			age//60 % 60, age % 60, history.factor**self.history_level),
+			size=freqshow.MAIN_FONT)
+		screen.blit(label, ui.align(label.get_rect(), (0, 0, width, height),
+			horizontal=ui.ALIGN_RIGHT, vertical=ui.ALIGN_TOP))
 
 	def render_spectrogram(self, screen):
 		# Grab spectrogram data.
 		freqs = self.model.get_data()
-		# Scroll up the waterfall display.
-		self.waterfall.scroll(0, -1)
-		# Scale the FFT values to the range 0 to 1.
-		freqs = (freqs-self.model.min_intensity)/self.model.range
-		# Convert scaled values to pixels drawn at the bottom of the display.
+		# Only add a row when the model has a new spectrum, otherwise just
+		# redraw the existing waterfall.
+		if self.model.frame_seq != self.last_seq:
+			self.last_seq = self.model.frame_seq
+			self.add_row(freqs)
+		self.update_palette()
+		if self.history_level > 0 or self.history_offset > 0:
+			self.render_history(screen)
+			return
+		# Draw the newest rows which fit on the screen, oldest at the top.  The
+		# rows wrap around the end of the circular buffer so it takes up to two
+		# blits: from the oldest visible row to the end of the buffer, and then
+		# from the start of the buffer to the newest row.
 		x, y, width, height = screen.get_rect()
-		wx, wy, wwidth, wheight = self.waterfall.get_rect()
-		offset = wheight - height
-		# Draw FFT values mapped through the gradient function to a color.
-		self.waterfall.lock()
-		for i in range(width):
-			power = clamp(freqs[i], 0.0, 1.0)
-			self.waterfall.set_at((i, wheight-1), self.color_func(power))
-		self.waterfall.unlock()
-		screen.blit(self.waterfall, (0, 0), area=(0, offset, width, height))
+		wwidth, wheight = self.waterfall.get_size()
+		start = (self.write_row - height) % wheight
+		first = min(height, wheight - start)
+		screen.blit(self.waterfall, (0, 0), area=(0, start, width, first))
+		if first < height:
+			screen.blit(self.waterfall, (0, first), area=(0, 0, width, height-first))
 
 
 class InstantSpectrogram(SpectrogramBase):
@@ -455,19 +866,78 @@ class InstantSpectrogram(SpectrogramBase):
 
 	def __init__(self, model, controller):
 		super(InstantSpectrogram, self).__init__(model, controller)
+		self.points = None
+		self.scaled = None
+
+	def _allocate_points(self, width, height):
+		# Build the point array once per screen size.  The first and last points
+		# are the bottom corners of the plot (used to close the filled area)
+		# and the points in between are one per pixel column.
+		self.points = np.zeros((width+2, 2), dtype=np.intp)
+		self.points[1:-1, 0] = np.arange(width)
+		self.points[0] = (0, height)
+		self.points[-1] = (width-1, height)
+		self.scaled = np.zeros(width)
+		# Row index of every pixel, the top of the filled plot in each column
+		# and the mask of pixels under it.
+		self.rows = np.arange(height)
+		self.fill_top = np.zeros((width, 1), dtype=np.intp)
+		self.fill_mid = np.zeros(width-1, dtype=np.intp)
+		self.fill_mask = None
+
+	def marker_y(self, index, height):
+		# Put markers on the spectrum line.
+		if self.scaled is None or index >= len(self.scaled):
+			return 0
+		return int(self.scaled[index])
 
 	def render_spectrogram(self, screen):
 		# Grab spectrogram data.
 		freqs = self.model.get_data()
-		# Scale frequency values to fit on the screen based on the min and max
-		# intensity values.
 		x, y, width, height = screen.get_rect()
-		freqs = height-np.floor(((freqs-self.model.min_intensity)/self.model.range)*height)
+		if self.points is None or len(self.scaled) != width \
+			or self.points[0, 1] != height:
+			self._allocate_points(width, height)
+		# Scale frequency values to fit on the screen based on the min and max
+		# intensity values, all in one pass over the spectrum.
+		scaled = self.scaled
+		np.subtract(freqs[:width], self.model.min_intensity, out=scaled)
+		np.multiply(scaled, height/self.model.range, out=scaled)
+		np.floor(scaled, out=scaled)
+		np.subtract(height, scaled, out=scaled)
+		np.clip(scaled, 0, height, out=scaled)
+		self.points[1:-1, 1] = scaled
 		# Render frequency graph.
 		screen.fill(freqshow.MAIN_BG)
-		# Draw line segments to join each FFT result bin.
-		ylast = freqs[0]
-		for i in range(1, width):
-			y = freqs[i]
-			pygame.draw.line(screen, freqshow.INSTANT_LINE, (i-1, ylast), (i, y))
-			ylast = y
+		curve = self.points[1:-1]
+		if freqshow.INSTANT_MODE == 'fill':
+			# Set every pixel under the spectrum directly in the surface, through
+			# a mask computed in one comparison of each column's top with the row
+			# indexes.  Like the line plot, a column reaches halfway up a steep
+			# line to either neighbor.
+			if self.fill_mask is None:
+				self.fill_mask = np.zeros((width, height), dtype=np.bool_)
+			top = self.fill_top[:, 0]
+			mid = self.fill_mid
+			np.add(curve[:-1, 1], curve[1:, 1], out=mid)
+			np.right_shift(mid, 1, out=mid)
+			np.copyto(top, curve[:, 1])
+			np.minimum(top[1:], mid, out=top[1:])
+			np.minimum(top[:-1], mid, out=top[:-1])
+			np.greater_equal(self.rows, self.fill_top, out=self.fill_mask)
+			pixels = pygame.surfarray.pixels2d(screen)
+			np.copyto(pixels, screen.map_rgb(freqshow.INSTANT_LINE),
+				where=self.fill_mask)
+			del pixels
+		elif freqshow.INSTANT_MODE == 'dots':
+			# Set one pixel per FFT result bin directly in the surface.
+			pixels = pygame.surfarray.pixels2d(screen)
+			pixels[curve[:, 0], np.minimum(curve[:, 1], height-1)] = \
+				screen.map_rgb(freqshow.INSTANT_LINE)
+			del pixels
+		elif freqshow.INSTANT_ANTIALIAS:
+			# Draw one antialiased line through every FFT result bin.
+			pygame.draw.aalines(screen, freqshow.INSTANT_LINE, False, curve)
+		else:
+			# Draw one line through every FFT result bin.
+			pygame.draw.lines(screen, freqshow.INSTANT_LINE, False, curve)
@@ -0,0 +1,445 @@
+# FreqShow multiprocess DSP worker.
+# Reads radio samples and computes spectra in a separate process, so acquisition
+# and the FFTs run on another core instead of sharing the GIL with rendering.
+# Spectra are published into a ring in shared memory which the UI process reads
+# without copying.
+#
+# Author: Tony DiCola (tony@tonydicola.com)
+#
+# The MIT License (MIT)
+#
+# Copyright (c) 2014 Adafruit Industries
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import atexit
+import copy
+import multiprocessing
+from multiprocessing import shared_memory
+import queue
+import threading
+import time
+
+import numpy as np
+
+import acquisition
+import dsp
+
+
+# Indexes of the tuner settings published in the ring's status block.
+STATUS_CENTER_FREQ = 0
+STATUS_SAMPLE_RATE = 1
+STATUS_GAIN        = 2
+STATUS_SWEEP_RATE  = 3
+STATUS_SIZE        = 4
+
+
+class SharedSpectrumRing(object):
+	"""Ring of spectrum frames in shared memory with a single writer process and
+	a single reader process.  Every slot carries the sequence number of the
+	frame it holds, which the writer sets to -1 while the slot is being written.
+	The reader checks it to skip half written frames and to notice when a frame
+	it was handed has since been overwritten (torn).
+
+	Layout of the shared block: write sequence number (int64), tuner status
+	(float64 x STATUS_SIZE), slot sequence numbers (int64 x slots), slot
+	timestamps (float64 x slots), frames (float32 x slots x width), where there
+	is one more slot than the size frames the ring holds.
+	"""
+
+	def __init__(self, size, width, name=None):
+		"""Create a new ring of size frames of width values each, or attach to
+		the existing ring with the provided shared memory name.
+		"""
+		# The writer fills a slot of its own while size frames can be read.
+		self.size = max(size, 1)
+		self.slots = slots = self.size + 1
+		self.width = width
+		nbytes = 8*(1 + STATUS_SIZE + 2*slots) + 4*slots*width
+		self.owner = name is None
+		if self.owner:
+			self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+		else:
+			self.shm = shared_memory.SharedMemory(name=name)
+		self.name = self.shm.name
+		buf = self.shm.buf
+		offset = 0
+		self._header = np.ndarray(1, dtype=np.int64, buffer=buf, offset=offset)
+		offset += 8
+		self.status = np.ndarray(STATUS_SIZE, dtype=np.float64, buffer=buf,
+			offset=offset)
+		offset += 8*STATUS_SIZE
+		self.slot_seq = np.ndarray(slots, dtype=np.int64, buffer=buf,
+			offset=offset)
+		offset += 8*slots
+		self.timestamps = np.ndarray(slots, dtype=np.float64, buffer=buf,
+			offset=offset)
+		offset += 8*slots
+		self.frames = np.ndarray((slots, width), dtype=np.float32, buffer=buf,
+			offset=offset)
+		if self.owner:
+			self._header[0] = 0
+			self.status.fill(0)
+			self.slot_seq.fill(0)
+		self.read_seq = 0
+		self.frames_dropped = 0
+		self.frames_torn = 0
+		self.staleness = 0.0
+
+	@property
+	def write_seq(self):
+		"""Sequence number of the newest frame written to the ring."""
+		return int(self._header[0])
+
+	def put(self, frame, timestamp=None):
+		"""Copy a spectrum frame into the next slot of the ring.  Only call this
+		from the writer process.
+		"""
+		seq = int(self._header[0]) + 1
+		slot = (seq - 1) % self.slots
+		self.slot_seq[slot] = -1
+		self.frames[slot] = frame
+		self.timestamps[slot] = time.time() if timestamp is None else timestamp
+		# Publish the frame only after it is completely written.
+		self.slot_seq[slot] = seq
+		self._header[0] = seq
+
+	def latest(self):
+		"""Return a view of the newest frame in shared memory (or None if no
+		frame has been written yet).  The view is only valid until the writer
+		comes back around to its slot, size frames later.
+		"""
+		if self.write_seq == 0:
+			return None
+		return self._read(False)
+
+	def next(self, timeout=None):
+		"""Return a view of the oldest frame which hasn't been returned yet,
+		waiting up to timeout seconds for one (None if the timeout elapsed).
+		Frames which were overwritten before they could be returned are counted
+		as dropped.
+		"""
+		deadline = None if timeout is None else time.time() + timeout
+		while self.write_seq <= self.read_seq:
+			if deadline is not None and time.time() >= deadline:
+				return None
+			time.sleep(0.001)
+		return self._read(True)
+
+	def _read(self, oldest):
+		# Return the newest frame, or with oldest the oldest frame which hasn't
+		# been read yet and is still safe from the writer.  First count the
+		# frame handed out by the previous call as (possibly) drawn torn if it
+		# has been overwritten since.
+		if self.read_seq > 0:
+			slot = (self.read_seq - 1) % self.slots
+			if self.slot_seq[slot] != self.read_seq:
+				self.frames_torn += 1
+		while True:
+			seq = int(self._header[0])
+			if oldest:
+				seq = max(self.read_seq + 1, seq - (self.size - 1))
+			slot = (seq - 1) % self.slots
+			frame = self.frames[slot]
+			timestamp = self.timestamps[slot]
+			# The writer could have lapped the ring since the header was read,
+			# in which case look up the frame again.
+			if self.slot_seq[slot] == seq:
+				break
+		if seq > self.read_seq:
+			self.frames_dropped += seq - self.read_seq - 1
+			self.read_seq = seq
+		self.staleness = time.time() - timestamp
+		return frame
+
+	def reader(self):
+		"""Return another reader of this ring, with a read position of its own,
+		for a second thread of this process.  It must be dropped before this
+		ring is closed.
+		"""
+		reader = copy.copy(self)
+		reader.owner = False
+		reader.shm = None
+		reader.read_seq = 0
+		reader.frames_dropped = 0
+		reader.frames_torn = 0
+		return reader
+
+	def close(self):
+		"""Detach from the shared memory, and free it if this ring created it.
+		Frames returned by latest() must not be used afterwards.
+		"""
+		if self.shm is None:
+			return
+		self._header = self.status = self.slot_seq = self.timestamps = \
+			self.frames = None
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
+		self.shm = None
+
+
+def _publish_status(ring, source):
+	ring.status[STATUS_CENTER_FREQ] = source.get_center_freq()
+	ring.status[STATUS_SAMPLE_RATE] = source.get_sample_rate()
+	ring.status[STATUS_GAIN] = source.get_gain()
+
+def _run_worker(factory, ring_name, ring_size, width, engine_args, min_samples,
+	raw_reads, error_delay, commands, replies, first):
+	# Main function of the worker process.  The sample source is opened here
+	# since tuner handles can't be moved between processes.
+	ring = SharedSpectrumRing(ring_size, width, name=ring_name)
+	try:
+		func, args, kwargs = factory
+		source = func(*args, **kwargs)
+		engine = dsp.SpectrumEngine(width, **engine_args)
+		_publish_status(ring, source)
+	except Exception as error:
+		replies.put(error)
+		ring.close()
+		return
+	replies.put(None)
+	iq = dsp.IQConverter()
+	sweeper = None
+	decimator = None
+	running = True
+	while running:
+		# Apply any setting changes between reads, acknowledging each one so
+		# the UI sees errors just like calling the source directly.
+		while True:
+			try:
+				command, args = commands.get_nowait()
+			except queue.Empty:
+				break
+			if command == 'stop':
+				running = False
+				break
+			try:
+				if command == 'configure':
+					engine.configure(**args[0])
+				elif command == 'set_sweep':
+					sweeper = args[0]
+					ring.status[STATUS_SWEEP_RATE] = 0.0
+				elif command == 'set_decimator':
+					decimator = args[0]
+				else:
+					getattr(source, command)(*args)
+				_publish_status(ring, source)
+				replies.put(None)
+			except Exception as error:
+				replies.put(error)
+		if not running:
+			break
+		try:
+			if sweeper is None:
+				freqs = acquisition.read_spectrum(source, engine, iq,
+					min_samples, raw_reads, decimator)
+			else:
+				freqs = sweeper.read(source, engine, iq, min_samples, raw_reads)
+		except IOError:
+			time.sleep(error_delay)
+			continue
+		ring.put(freqs)
+		if sweeper is not None:
+			ring.status[STATUS_SWEEP_RATE] = sweeper.sweeps_per_second
+		if not first.is_set():
+			first.set()
+	source.close()
+	ring.close()
+
+
+class SpectrumWorker(object):
+	"""Runs acquisition and spectrum computation in a separate process.  The
+	worker provides the tuner setters and getters of a sample source (so the
+	model can use it in place of its RtlSdr) and the spectrum interface of
+	acquisition.AcquisitionThread (latest, has_new, wait, stop and statistics).
+	Setters block until the worker has applied them and raise the same errors
+	the source raised.
+	"""
+
+	def __init__(self, source_factory, width, engine_args=None, ring_size=4,
+		min_samples=0, raw_reads=True, error_delay=0.1, timeout=5.0):
+		"""Start a worker process which opens its sample source by calling
+		source_factory, a picklable (function, args, kwargs) tuple such as
+		(sources.open_rtlsdr, (), {}).  Spectra of width values are computed by a
+		dsp.SpectrumEngine created with the engine_args keyword arguments, and
+		kept in a shared ring of ring_size frames.  Min_samples and raw_reads are
+		passed to acquisition.read_spectrum.  Commands which get no reply within
+		timeout seconds raise IOError.
+		"""
+		self.timeout = timeout
+		self.ring = SharedSpectrumRing(ring_size, width)
+		self._commands = multiprocessing.Queue()
+		self._replies = multiprocessing.Queue()
+		self._first = multiprocessing.Event()
+		self._call_lock = threading.Lock()
+		self.consumer = None
+		self._tap = None
+		self._tap_stop = threading.Event()
+		self.process = multiprocessing.Process(target=_run_worker,
+			name='FreqShowDSP', args=(source_factory, self.ring.name, ring_size,
+			width, engine_args or {}, min_samples, raw_reads, error_delay,
+			self._commands, self._replies, self._first))
+		self.process.daemon = True
+		self.process.start()
+		atexit.register(self.stop)
+		# Wait for the worker to open the source, and fail if it couldn't.
+		try:
+			self._reply()
+		except Exception:
+			self.stop()
+			raise
+
+	def _reply(self):
+		try:
+			result = self._replies.get(timeout=self.timeout)
+		except queue.Empty:
+			raise IOError('DSP worker did not respond.')
+		if result is not None:
+			raise result
+
+	def _call(self, command, *args):
+		# Send a command to the worker and wait until it has been applied.
+		if self.ring.shm is None:
+			raise IOError('DSP worker is stopped.')
+		with self._call_lock:
+			self._commands.put((command, args))
+			self._reply()
+
+	def get_center_freq(self):
+		return float(self.ring.status[STATUS_CENTER_FREQ])
+
+	def set_center_freq(self, freq):
+		self._call('set_center_freq', freq)
+
+	def get_sample_rate(self):
+		return float(self.ring.status[STATUS_SAMPLE_RATE])
+
+	def set_sample_rate(self, rate):
+		self._call('set_sample_rate', rate)
+
+	def get_gain(self):
+		return float(self.ring.status[STATUS_GAIN])
+
+	def set_gain(self, gain):
+		self._call('set_gain', gain)
+
+	def set_manual_gain_enabled(self, enabled):
+		self._call('set_manual_gain_enabled', enabled)
+
+	def set_sweep(self, sweeper):
+		"""Run a sweep.Sweeper in the worker (a copy of it is sent), or stop
+		sweeping if sweeper is None.
+		"""
+		self._call('set_sweep', sweeper)
+
+	def set_decimator(self, decimator):
+		"""Zoom in with a dsp.Decimator in the worker (a copy of it is sent),
+		or stop zooming if decimator is None.
+		"""
+		self._call('set_decimator', decimator)
+
+	def configure(self, **kwargs):
+		"""Change the settings of the worker's spectrum engine, takes the same
+		arguments as dsp.SpectrumEngine.configure.
+		"""
+		self._call('configure', kwargs)
+
+	def set_consumer(self, consumer):
+		"""Pass every spectrum the worker computes to consumer, on a thread
+		which follows the shared ring with a read position of its own.
+		"""
+		self.consumer = consumer
+		if self._tap is None:
+			self._tap = threading.Thread(target=self._run_tap, name='FreqShowTap')
+			self._tap.daemon = True
+			self._tap.start()
+
+	def _run_tap(self):
+		ring = self.ring.reader()
+		# Copy each frame out of shared memory so the writer can't change it
+		# while it's consumed.
+		frame = np.zeros(ring.width, dtype=np.float32)
+		while not self._tap_stop.is_set():
+			shared = ring.next(0.1)
+			if shared is None:
+				continue
+			np.copyto(frame, shared)
+			self.consumer(frame)
+
+	def stop(self, timeout=1.0):
+		"""Stop the worker process and free the shared ring."""
+		if self.ring.shm is None:
+			return
+		if self._tap is not None:
+			self._tap_stop.set()
+			self._tap.join()
+		if self.process.is_alive():
+			self._commands.put(('stop', ()))
+			self.process.join(timeout)
+			if self.process.is_alive():
+				self.process.terminate()
+				self.process.join()
+		self.ring.close()
+
+	def latest(self):
+		"""Return the newest spectrum without blocking (or None if nothing has
+		been computed yet).  The array is a view into shared memory.
+		"""
+		return self.ring.latest()
+
+	def next(self, timeout=None):
+		"""Return the oldest spectrum which hasn't been returned yet, waiting up
+		to timeout seconds for one (None if the timeout elapsed).
+		"""
+		return self.ring.next(timeout)
+
+	def has_new(self):
+		"""Return True if a spectrum newer than the last one returned by latest()
+		is available.
+		"""
+		return self.ring.write_seq != self.ring.read_seq
+
+	def wait(self, timeout=None):
+		"""Wait until the first spectrum has been computed."""
+		return self._first.wait(timeout)
+
+	@property
+	def sequence(self):
+		"""Sequence number of the newest spectrum returned by latest()."""
+		return self.ring.read_seq
+
+	@property
+	def frames_dropped(self):
+		"""Number of computed spectra which were never read by the UI."""
+		return self.ring.frames_dropped
+
+	@property
+	def frames_torn(self):
+		"""Number of spectra overwritten while the UI could still be using them."""
+		return self.ring.frames_torn
+
+	@property
+	def sweeps_per_second(self):
+		"""Complete sweeps per second of the worker's sweep."""
+		return float(self.ring.status[STATUS_SWEEP_RATE])
+
+	@property
+	def staleness(self):
+		"""Age in seconds of the spectrum last returned by latest()."""
+		return self.ring.staleness